@@ -804,11 +804,11 @@ class SoftwareSwitchBase (object):
     priority = flow_mod.priority
 
     modified = False
-    for entry in table.entries:
+    for entry in table.matching_entries(match, priority=priority,
+                                        strict=strict):
       # update the actions field in the matching flows
-      if entry.is_matched_by(match, priority=priority, strict=strict):
-        entry.actions = flow_mod.actions
-        modified = True
+      entry.actions = flow_mod.actions
+      modified = True
 
     if not modified:
       # if no matching entry is found, modify acts as add
@@ -34,9 +34,17 @@ from pox.lib.recoco import Timer
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpid_to_str
+from pox.lib.mac_table import MacTable
+from pox.lib.packet.ethernet import ethernet
 import time
-from pox.openflow.spanning_tree import generator_for_link
-import networkx as nx
+from pox.openflow.spanning_tree import broadcast_segments
+from pox.openflow.spanning_tree import track_broadcast_segments
+from pox.lib.graph.paths import ShortestPaths
+from pox.lib.flow_hash import Rendezvous, get_flow_hash
+from pox.openflow.flow_index import FlowIndex, reroute_flows
+from pox.openflow.path_install import PathInstaller, PendingInstalls
+from pox.openflow.path_install import PathInstalled
+import heapq
 import itertools
 
 log = core.getLogger()
@@ -47,18 +55,22 @@ adjacency = defaultdict(lambda:defaultdict(lambda:None))
 # Switches we know of.  [dpid] -> Switch
 switches = {}
 
+# Broadcast clouds.  [frozenset of (dpid,port)] -> Cloud
 clouds = {}
 
-# ethaddr -> (switch, port)
-mac_map = {}
+# (dpid,port) -> the Cloud it's part of
+cloud_at = {}
 
-# [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda: {}))
+# ethaddr -> (switch, port), also indexed by (switch, port)
+mac_map = MacTable()
 
-real__path_map = defaultdict(lambda:defaultdict(lambda:set()))
+# Hop counts between switches (and clouds); kept in step with adjacency
+shortest_paths = ShortestPaths()
+
+# [sw1][sw2] -> path info; built on demand by _path_entry()
+path_map = defaultdict(dict)
 
-# Waiting path.  (dpid,xid)->WaitingPath
-waiting_paths = {}
+real__path_map = defaultdict(lambda:defaultdict(lambda:set()))
 
 # Time to not flood in seconds
 FLOOD_HOLDDOWN = 5
@@ -70,128 +82,208 @@ FLOW_HARD_TIMEOUT = 30
 # How long is allowable to set up a path?
 PATH_SETUP_TIME = 4
 
+# Most PacketIns to hold for a flow while its path is being installed
+# (more are dropped)
+MAX_HELD_PACKETS = 8
+
+# Most equal-cost paths to consider between a pair of switches
+MAX_ECMP_PATHS = 16
+
+# Forget path_map entries which haven't been used for this many seconds
+PATH_IDLE_TIME = 2 * FLOW_HARD_TIMEOUT
+
 broadcast_adj = set()
 
-def _calc_paths ():
+# Spreads flows over a pair's best paths (see launch())
+flow_hasher = Rendezvous()
+
+# Installed flows, by cookie and by the ports they leave switches by
+flow_index = FlowIndex(FLOW_IDLE_TIMEOUT, FLOW_HARD_TIMEOUT)
+
+# Sends path flow_mods with one barrier per switch per batch
+installer = PathInstaller(PATH_SETUP_TIME)
+
+# Paths being installed for PacketIns, and PacketIns held meanwhile
+pending_installs = PendingInstalls(installer, MAX_HELD_PACKETS)
+
+# Tie-breaker for path ranking heaps
+_rank_seq = itertools.count()
+
+def _link (sw1, sw2, port1, port2, changes):
+  """
+  Connects sw1 and sw2 in adjacency, noting which paths changed
+  """
+  if adjacency[sw1].get(sw2) is not None:
+    _unlink(sw1, sw2, changes)
+  adjacency[sw1][sw2] = port1
+  adjacency[sw2][sw1] = port2
+  _merge_changes(changes, shortest_paths.add_link(sw1, sw2))
+
+def _unlink (sw1, sw2, changes):
+  """
+  Disconnects sw1 and sw2 in adjacency, noting which paths changed
+  """
+  adjacency[sw1].pop(sw2, None)
+  adjacency[sw2].pop(sw1, None)
+  _merge_changes(changes, shortest_paths.remove_link(sw1, sw2))
+
+def _merge_changes (changes, new):
+  for src,dsts in new.iteritems():
+    if src in changes:
+      changes[src].update(dsts)
+    else:
+      changes[src] = dsts
+
+def _invalidate_paths (changes):
+  """
+  Forgets path_map entries for {src:set(dst)} pairs whose paths changed
+  """
+  for src,dsts in changes.iteritems():
+    entries = path_map.get(src)
+    if not entries: continue
+    for dst in dsts:
+      _drop_path_entry(entries.pop(dst, None))
+
+def _forget_node (node):
+  """
+  Removes a switch or cloud from the path state
+  """
+  changes = shortest_paths.remove_node(node)
+  for entry in path_map.pop(node, {}).itervalues():
+    _drop_path_entry(entry)
+  return changes
+
+def _drop_path_entry (entry):
+  if entry is None: return
+  for path,path_congestion_weight in entry['path'].iteritems():
+    for sw,port in path_congestion_weight[1]:
+      sw.port_to_path.get(port, {}).pop(path, None)
+
+def _expire_path_entries ():
+  """
+  Forgets path_map entries which haven't been used in a while
+  """
+  cutoff = time.time() - PATH_IDLE_TIME
+  for src,entries in path_map.items():
+    for dst,entry in entries.items():
+      if entry['used'] < cutoff:
+        del entries[dst]
+        _drop_path_entry(entry)
+    if not entries: del path_map[src]
+
+def _path_entry (src, dst):
+  """
+  Returns the path_map entry for src -> dst, computing it if needed
+
+  Only up to MAX_ECMP_PATHS of the equal-cost paths are kept (and given
+  port_to_path records).  Returns None if src is dst or if there's no
+  path.
   """
-  Essentially Floyd-Warshall algorithm
+  entry = path_map[src].get(dst)
+  if entry is not None:
+    entry['used'] = time.time()
+    return entry
+
+  distance = shortest_paths.distance(src, dst)
+  if not distance: return None
+
+  entry = {'distance':distance, 'path':{}, 'used':time.time(),
+           'ranking':[]}
+  for path in shortest_paths.sample_paths(src, dst, MAX_ECMP_PATHS):
+    path_port = []
+    for s1, s2 in zip(path[:-1],path[1:]):
+      out_port = adjacency[s1][s2]
+      path_port.append((s1,out_port))
+
+    path_congestion_weight = [path,path_port,None,None]
+    _path_congestion(path_congestion_weight)
+
+    for sw, port in path_port:
+      sw.port_to_path.setdefault(port, {})[path] = path_congestion_weight
+
+    entry['path'][path] = path_congestion_weight
+    entry['ranking'].append((path_congestion_weight[2],
+                             path_congestion_weight[3],
+                             next(_rank_seq), path_congestion_weight))
+
+  heapq.heapify(entry['ranking'])
+  path_map[src][dst] = entry
+  select_best_paths(src,dst)
+  return entry
+
+def _path_congestion (path_congestion_weight):
   """
+  Recomputes a path's maximum and total congestion
 
-  def dump ():
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
+  Returns True if either changed.
+  """
+  this_path_weight = 0
+  this_path_max_congestion = 0
+  for sw,port in path_congestion_weight[1]:
+    this_port_congesion_status = sw.port_congestion.get(port, 0)
+    this_path_weight += this_port_congesion_status
+    if this_port_congesion_status > this_path_max_congestion:
+      this_path_max_congestion = this_port_congesion_status
+  if (path_congestion_weight[2] == this_path_max_congestion
+      and path_congestion_weight[3] == this_path_weight):
+    return False
+  path_congestion_weight[2] = this_path_max_congestion
+  path_congestion_weight[3] = this_path_weight
+  return True
 
-  def __get_path(source, dest):
-    if source is dest: return None
+def _rank_path (entry, path_congestion_weight):
+  """
+  (Re)queues a path in its entry's ranking heap under its current weights
+  """
+  ranking = entry['ranking']
+  if len(ranking) > 4 * len(entry['path']) + 8:
+    # Mostly stale; start over
+    ranking[:] = [(p[2], p[3], next(_rank_seq), p)
+                  for p in entry['path'].itervalues()]
+    heapq.heapify(ranking)
+  else:
+    heapq.heappush(ranking, (path_congestion_weight[2],
+                             path_congestion_weight[3],
+                             next(_rank_seq), path_congestion_weight))
 
-    intermediate = path_map[source][dest]['intermediate']
-    distance = path_map[source][dest]['distance']
-    if distance == 1:
-      return frozenset([tuple()])
+def select_best_paths (src,dst):
+  """
+  Finds the least congested paths and rebuilds the selector if they changed
 
-    # print('intermediate %s' % str(path_map[source][dest]))
+  The best paths are the ones with the lowest maximum congestion on any
+  hop, and of those, the lowest total congestion.  entry['ranking'] is a
+  heap of (max congestion, total, seq, path) which may contain stale
+  items (whose weights no longer match the path's); they're dropped as
+  they're encountered.
 
-    def sub_path(k):
-      if k == source or k == dest:
-        return frozenset()
-      else:
-        left = map(lambda route: route + (k,), __get_path(source, k))
-        right = __get_path(k, dest)
-        # print('left = %s' % left)
-        # print('right = %s' % right)
-        return reduce(lambda result_set, product: result_set.union([product[0] + product[1]]),
-                      itertools.product(left, right), frozenset())
-
-    result = reduce(frozenset.union, map(lambda k: sub_path(k), intermediate))
-    return result
-
-  sws = switches.values()
-  path_map.clear()
-  for k in sws:
-    for j in sws:
-      path_map[k][j]['distance'] = float("inf")
-      path_map[k][j]['intermediate'] = []
-      path_map[k][j]['path'] = {}
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j]['distance'] = 1
-      path_map[k][j]['intermediate'] = []
-    path_map[k][k]['distance'] = 0
-    path_map[k][k]['intermediate'] = []
-
-
-  # dump()
-
-
-  for k in sws:
-    for i in sws:
-      for j in sws:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k]['distance']+path_map[k][j]['distance']
-            if ikj_dist < path_map[i][j]['distance']:
-              # i -> k -> j is better than existing
-              path_map[i][j]['distance'] = ikj_dist
-              path_map[i][j]['intermediate'] = [k]
-
-
-            elif path_map[i][j]['distance'] == ikj_dist:
-             path_map[i][j]['intermediate'].append(k)
-
-  for i in sws:
-    for j in sws:
-      all_intermediates = __get_path(i,j)
-      if all_intermediates != None:
-        for every_intermediate in all_intermediates:
-          path = tuple([i] + list(every_intermediate) + [j])
-
-          path_port = []
-
-          for s1, s2 in zip(path[:-1],path[1:]):
-            out_port = adjacency[s1][s2]
-            path_port.append((s1,out_port))
-
-          this_path_weight = 0
-          for sw,port in path_port:
-            this_port_congesion_status = sw.port_congestion[port]
-            this_path_weight += this_port_congesion_status
-
-          # this_path_weight = reduce(lambda x,y : x + y[0].port_congestion[y[1]], path_port)
-
-          sw, port = max(path_port,key = lambda x: x[0].port_congestion[x[1]])
-          this_path_max_congestion = sw.port_congestion[port]
-          path_congestion_weight = [path,path_port,this_path_max_congestion,this_path_weight]
-
-          for sw, port in path_port:
-            sw.port_to_path[port].append(path_congestion_weight)
-
-          path_map[i][j]['path'][path] = path_congestion_weight
-
-        select_best_path_build_hash_dict(i,j)
-  #print "--------------------"
-  #dump()
-def select_best_path_build_hash_dict(src,dst):
-  min_congestion_path = min(path_map[src][dst]['path'].itervalues(), key=lambda x: x[2])
-  min_congestion_on_path = min_congestion_path[2]
-  min_congestion_paths = filter(lambda x: x[2] == min_congestion_on_path,path_map[src][dst]['path'].values())
-
-  min_weight_path = min(min_congestion_paths, key=lambda x: x[-1])
-  min_weight_on_path = min_weight_path[-1]
-  min_weight_paths = filter(lambda x: x[-1] == min_weight_on_path,min_congestion_paths)
-
-  path_map[src][dst]['best_con_weight'] = (min_congestion_on_path,min_weight_on_path)
-  path_map[src][dst]['hash_dict'] = {}
-  possible_path_index = 0
-  for index in xrange(256):
-    path_map[src][dst]['hash_dict'][index] = min_weight_paths[possible_path_index]
-    if min_weight_paths[possible_path_index] is min_weight_paths[-1]:
-      possible_path_index = 0
-    else:
-      possible_path_index += 1
+  Returns True if the selector was rebuilt.
+  """
+  entry = path_map[src][dst]
+  ranking = entry['ranking']
+  best = []
+  best_weight = None
+  while ranking:
+    item = ranking[0]
+    p = item[3]
+    if item[0] != p[2] or item[1] != p[3] or p in best:
+      heapq.heappop(ranking)
+      continue
+    if best_weight is None:
+      best_weight = item[:2]
+    elif item[:2] != best_weight:
+      break
+    heapq.heappop(ranking)
+    best.append(p)
+  for p in best:
+    heapq.heappush(ranking, (p[2], p[3], next(_rank_seq), p))
+
+  entry['best_con_weight'] = best_weight
+  min_weight_paths = [p[0] for p in best]
+  if entry.get('best_paths') == min_weight_paths:
+    return False
+  entry['best_paths'] = min_weight_paths
+  entry['selector'] = flow_hasher.build(min_weight_paths)
+  return True
 
 def _check_path (p):
   """
@@ -207,18 +299,18 @@ def _check_path (p):
   return True
 
 def _path_selector(src,dst,match):
-  source_mac = ord(match.dl_src._value[5])
-  dest_mac = ord(match.dl_dst._value[5])
-  hash_result_index = source_mac^dest_mac
-  return path_map[src][dst]['hash_dict'][hash_result_index][0]
+  """
+  Picks one of the best paths from src to dst for a flow
+  """
+  entry = _path_entry(src,dst)
+  if entry is None: return None
+  return flow_hasher.select(entry['selector'], flow_hasher.flow_key(match))
 
 def _get_path (src, dst, first_port, final_port, match):
   """
   Gets a cooked path -- a list of (node,in_port,out_port)
   """
   # Start with a raw path...
-  if len(path_map) == 0: _calc_paths()
-
   if src == dst:
     path = [src]
   else:
@@ -244,70 +336,14 @@ def _is_edge_port_in_topo(id,port):
   else:
     return True
 
-
-class WaitingPath (object):
+def _new_hops (flow):
   """
-  A path which is waiting for its path to be established
+  Gets the hops a rerouted flow should take (see reroute_flows())
   """
-  def __init__ (self, path, packet):
-    """
-    xids is a sequence of (dpid,xid)
-    first_switch is the DPID where the packet came from
-    packet is something that can be sent in a packet_out
-    """
-    self.expires_at = time.time() + PATH_SETUP_TIME
-    self.path = path
-    self.first_switch = path[0][0].dpid
-    self.xids = set()
-    self.packet = packet
-
-    if len(waiting_paths) > 1000:
-      WaitingPath.expire_waiting_paths()
-
-  def add_xid (self, dpid, xid):
-    self.xids.add((dpid,xid))
-    waiting_paths[(dpid,xid)] = self
-
-  @property
-  def is_expired (self):
-    return time.time() >= self.expires_at
-
-  def notify (self, event):
-    """
-    Called when a barrier has been received
-    """
-    self.xids.discard((event.dpid,event.xid))
-    if len(self.xids) == 0:
-      # Done!
-      if self.packet:
-        log.debug("Sending delayed packet out %s"
-                  % (dpid_to_str(self.first_switch),))
-        msg = of.ofp_packet_out(data=self.packet,
-            action=of.ofp_action_output(port=of.OFPP_TABLE))
-        core.openflow.sendToDPID(self.first_switch, msg)
-
-      core.l2_multi.raiseEvent(PathInstalled(self.path))
-
-
-  @staticmethod
-  def expire_waiting_paths ():
-    packets = set(waiting_paths.values())
-    killed = 0
-    for p in packets:
-      if p.is_expired:
-        killed += 1
-        for entry in p.xids:
-          waiting_paths.pop(entry, None)
-    if killed:
-      log.error("%i paths failed to install" % (killed,))
-
-
-class PathInstalled (Event):
-  """
-  Fired when a path is installed
-  """
-  def __init__ (self, path):
-    self.path = path
+  src,first_port,dst,final_port = flow.route
+  p = _get_path(src, dst, first_port, final_port, flow.match)
+  if p is None: return None
+  return [h for h in p if type(h[0]) is Switch]
 
 
 class Switch (EventMixin):
@@ -324,52 +360,25 @@ class Switch (EventMixin):
     for port in self.ports:
       if port.port_no >of.OFPP_MAX: continue
       self.port_congestion[port.port_no] = 0
-      self.port_to_path[port.port_no] = []
-
-
-  def update_congestion_path(self,port):
-    new_congestion = self.port_congestion[port]
-    for path in self.port_to_path[port]:
-
-      src = path[0][0]
-      dest = path[0][-1]
-
-      new_path_weight = 0
-      for sw,port in path[1]:
-        this_port_congesion_status = sw.port_congestion[port]
-        new_path_weight += this_port_congesion_status
-      path[3] = new_path_weight
-      if new_congestion > path[2]:
-        path[2] = new_congestion
-      select_best_path_build_hash_dict(src,dest)
-
-
-
+      self.port_to_path[port.port_no] = {}
 
 
   def __repr__ (self):
     return str(self.dpid)
     # return dpid_to_str(self.dpid)
 
-  def _install (self, switch, in_port, out_port, match, buf = None):
-    msg = of.ofp_flow_mod()
-    msg.match = match
-    msg.match.in_port = in_port
-    msg.idle_timeout = FLOW_IDLE_TIMEOUT
-    msg.hard_timeout = FLOW_HARD_TIMEOUT
-    msg.actions.append(of.ofp_action_output(port = out_port))
-    msg.buffer_id = buf
-    if switch.connection is None: return
-    switch.connection.send(msg)
-
-  def _install_path (self, p, match, packet_in=None):
-    wp = WaitingPath(p, packet_in)
+  def _install_path (self, p, match, route, packet_in=None):
+    """
+    Installs a flow along p, indexing it so it can be rerouted later
+
+    route is (src, first_port, dst, final_port) for computing a new path.
+    """
+    flow = flow_index.add(match, route, p)
+    txn = pending_installs.begin(core.l2_multi, p, match, packet_in)
     for sw,in_port,out_port in p:
-      self._install(sw, in_port, out_port, match)
-      msg = of.ofp_barrier_request()
-      if sw.connection is None: pass
-      sw.connection.send(msg)
-      wp.add_xid(sw.dpid,msg.xid)
+      if sw.connection is None: continue
+      txn.send(sw.connection, flow_index.flow_mod(flow, in_port, out_port))
+    txn.commit()
 
   def install_path (self, dst_sw, last_port, match, event):
     """
@@ -419,13 +428,15 @@ class Switch (EventMixin):
         match.dl_src, match.dl_dst, match.dl_type, len(p))
 
     # We have a path -- install it
+    route = (p[0][0], p[0][1], p[-1][0], p[-1][2])
     p = filter(lambda x:type(x[0]) is Switch,p)
-    self._install_path(p, match, event.ofp)
+    self._install_path(p, match, route, event.ofp)
 
     # Now reverse it and install it backwards
     # (we'll just assume that will work)
     p = [(sw,out_port,in_port) for sw,in_port,out_port in p]
-    self._install_path(p, match.flip())
+    self._install_path(p, match.flip(), (route[2], route[3], route[0],
+                                         route[1]))
 
 
   def _handle_PacketIn (self, event):
@@ -449,18 +460,23 @@ class Switch (EventMixin):
         msg.in_port = event.port
         self.connection.send(msg)
 
-    packet = event.parsed
+    # Only the Ethernet header is needed until we install a path
+    packet = event.fields
+    if packet.dl_type is None:
+      # Runt frame
+      drop()
+      return
 
     loc = (self, event.port) # Place we saw this ethaddr
     dpid_port = (loc[0].dpid, loc[1])
 
-    for cloud in clouds.values():
-        if dpid_port in cloud.ports:
-          loc = (cloud, 0)
+    cloud = cloud_at.get(dpid_port)
+    if cloud is not None:
+      loc = (cloud, 0)
 
     oldloc = mac_map.get(packet.src) # Place we last saw this ethaddr
 
-    if packet.effective_ethertype == packet.LLDP_TYPE:
+    if packet.dl_type == ethernet.LLDP_TYPE:
       drop()
       return
 
@@ -503,7 +519,10 @@ class Switch (EventMixin):
         flood()
       else:
         dest = mac_map[packet.dst]
-        match = of.ofp_match.from_packet(packet,spec_frags= True)
+        match = of.ofp_match.from_packet(event.parsed,spec_frags= True)
+        if pending_installs.hold(core.l2_multi, self.dpid, match, event,
+                                 drop):
+          return
         self.install_path(dest[0], dest[1], match, event)
 
   def disconnect (self):
@@ -544,8 +563,36 @@ class l2_multi (EventMixin):
   ])
 
   def __init__ (self):
+    # (Switch,port)s whose congestion changed since paths were last ranked
+    self._congested_ports = set()
+    self._rerank_pending = False
+
+    # Congestion counters: PortStats reports used, path rankings done, and
+    # rankings saved over doing one per path per report
+    self.congestion_reports = 0
+    self.congestion_reranks = 0
+    self.congestion_reranks_saved = 0
+
+    # Rerouting counters: link failures handled, flows moved, flow_mods
+    # sent, flow_mods clearing everything would have needed instead, and
+    # how long the last reroute took to be confirmed by barriers
+    self.reroutes = 0
+    self.rerouted_flows = 0
+    self.reroute_flow_mods = 0
+    self.reroute_full_clear_flow_mods = 0
+    self.last_convergence_time = None
+
+    # PacketIns for flows whose paths were already being installed, and
+    # how many of them were dropped rather than held
+    self.redundant_installs_avoided = 0
+    self.held_packets_dropped = 0
+
+    # broadcast_segments.version when we last looked
+    self._segments_version = broadcast_segments.version
+
     # Listen to dependencies (specifying priority 0 for openflow)
     core.listen_to_dependencies(self, listen_args={'openflow':{'priority':0}})
+    core.call_when_ready(track_broadcast_segments, "openflow_discovery")
 
   def _handle_openflow_discovery_LinkEvent (self, event):
     def flip (link):
@@ -555,31 +602,27 @@ class l2_multi (EventMixin):
     sw1 = switches[l.dpid1]
     sw2 = switches[l.dpid2]
 
-    # Invalidate all flows and path info.
+    # Invalidate the path info which the change affects.
     # For link adds, this makes sure that if a new link leads to an
     # improved path, we use it.
     # For link removals, this makes sure that we don't use a
     # path that may have been broken.
-    #NOTE: This could be radically improved! (e.g., not *ALL* paths break)
-    '''clear = of.ofp_flow_mod(command=of.OFPFC_DELETE)
-    for sw in switches.itervalues():
-      if sw.connection is None: continue
-      sw.connection.send(clear)'''
-    path_map.clear()
+    # Affected entries are rebuilt when they're next needed.
+    # Installed flows which used a removed link are rerouted (see
+    # reroute_flows()); others are left to time out.
+    changes = {}
     if l.link_type is 'lldp':
 
       if event.removed:
         # This link no longer okay
-        if sw2 in adjacency[sw1]: del adjacency[sw1][sw2]
-        if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
+        _unlink(sw1, sw2, changes)
 
         # But maybe there's another way to connect these...
-        for ll in core.openflow_discovery.adjacency:
+        for ll in core.openflow_discovery.adjacency.links_on(l.dpid1):
           if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
             if flip(ll) in core.openflow_discovery.adjacency:
               # Yup, link goes both ways
-              adjacency[sw1][sw2] = ll.port1
-              adjacency[sw2][sw1] = ll.port2
+              _link(sw1, sw2, ll.port1, ll.port2, changes)
               # Fixed -- new link chosen to connect these
               break
       else:
@@ -591,22 +634,22 @@ class l2_multi (EventMixin):
           # exists in both directions, we consider them connected now.
           if flip(l) in core.openflow_discovery.adjacency:
             # Yup, link goes both ways -- connected!
-            adjacency[sw1][sw2] = l.port1
-            adjacency[sw2][sw1] = l.port2
-    elif l.link_type is 'broadcast':
-      self.clear_the_previous()
-      self.update_clouds_in_broadcast()
-
+            _link(sw1, sw2, l.port1, l.port2, changes)
+    segments_changed = broadcast_segments.version != self._segments_version
+    self._segments_version = broadcast_segments.version
+    if segments_changed or l.link_type is 'broadcast':
+      self.update_clouds_in_broadcast(changes)
+    _invalidate_paths(changes)
+    if l.link_type is 'lldp' and event.removed:
+      reroute_flows(self, flow_index, installer, l, _new_hops,
+                    sum(1 for sw in switches.itervalues()
+                        if type(sw) is Switch))
 
     # If we have learned a MAC on this port which we now know to
     # be connected to a switch, unlearn it.
-    bad_macs = set()
-    for mac,(sw,port) in mac_map.iteritems():
-      if sw is sw1 and port == l.port1: bad_macs.add(mac)
-      if sw is sw2 and port == l.port2: bad_macs.add(mac)
-    for mac in bad_macs:
-      log.debug("Unlearned %s", mac)
-      del mac_map[mac]
+    for loc in ((sw1, l.port1), (sw2, l.port2)):
+      for mac in mac_map.forget_location(loc):
+        log.debug("Unlearned %s", mac)
 
   def _handle_openflow_ConnectionUp (self, event):
     sw = switches.get(event.dpid)
@@ -614,17 +657,16 @@ class l2_multi (EventMixin):
       # New switch
       sw = Switch()
       switches[event.dpid] = sw
+      shortest_paths.add_node(sw)
       sw.connect(event.connection)
     else:
       sw.connect(event.connection)
 
+  def _handle_openflow_FlowRemoved (self, event):
+    flow_index.flow_removed(event)
+
   def _handle_openflow_BarrierIn (self, event):
-    wp = waiting_paths.pop((event.dpid,event.xid), None)
-    if not wp:
-      #log.info("No waiting packet %s,%s", event.dpid, event.xid)
-      return
-    #log.debug("Notify waiting packet %s,%s", event.dpid, event.xid)
-    wp.notify(event)
+    installer.barrier_in(event)
 
   def _handle_openflow_PortStats(self, event):
 
@@ -632,45 +674,89 @@ class l2_multi (EventMixin):
     port = event.ofp.port_no
     if _is_edge_port_in_topo(sw,port):
       return
+    self.congestion_reports += 1
+    paths = len(sw.port_to_path.get(port, ()))
+    self.congestion_reranks_saved += paths
+    if sw.port_congestion.get(port) == event.ofp.tx_congestion: return
     sw.port_congestion[port] = event.ofp.tx_congestion
-    sw.update_congestion_path(port)
-
-
-  def clear_the_previous(self):
-
-    for sw_cloud in broadcast_adj:
-      del adjacency[sw_cloud[0]][sw_cloud[1]]
-      del adjacency[sw_cloud[1]][sw_cloud[0]]
-
-
-    for cloud in clouds:
-      del switches[cloud]
-    clouds.clear()
-    broadcast_adj.clear()
+    if not paths: return
 
+    # Rank paths once for all the reports which arrive together
+    self._congested_ports.add((sw,port))
+    if not self._rerank_pending:
+      self._rerank_pending = True
+      core.callLater(self._rerank_paths)
 
+  def _rerank_paths (self):
+    """
+    Updates the paths through congested ports and re-ranks their pairs
+    """
+    self._rerank_pending = False
+    updated = set()
+    pairs = set()
+    for sw,port in self._congested_ports:
+      for path in sw.port_to_path.get(port, {}).itervalues():
+        if path[0] in updated: continue
+        updated.add(path[0])
+        if _path_congestion(path):
+          src = path[0][0]
+          dst = path[0][-1]
+          _rank_path(path_map[src][dst], path)
+          pairs.add((src,dst))
+    self._congested_ports.clear()
+
+    for src,dst in pairs:
+      select_best_paths(src,dst)
+    self.congestion_reranks += len(pairs)
+    self.congestion_reranks_saved -= len(pairs)
+
+
+  def update_clouds_in_broadcast (self, changes):
+    """
+    Brings clouds into line with the broadcast segments
 
-  def update_clouds_in_broadcast(self):
+    Each segment's ports which still have an available broadcast link
+    (spanning_tree marks the others) form a cloud.  Only clouds whose
+    ports changed are torn down or created.
+    """
     from pox.openflow.spanning_tree import node_to_be_down
-    g = nx.Graph()
-    for link in generator_for_link('broadcast'):
-      if link.available is True:
-        g.add_edge((link.dpid1,link.port1), (link.dpid2,link.port2))
-
-    for clique in nx.find_cliques(g):
-      if frozenset(clique) in node_to_be_down.keys():
-        clique.remove(node_to_be_down[frozenset(clique)])
-      cloud_id = frozenset(clique)
+    wanted = {}
+    for ports in broadcast_segments:
+      ports = [p for p in ports
+               if any(l.available is True
+                      for l in broadcast_segments.links_at(p))]
+      if not ports: continue
+      down = node_to_be_down.get(frozenset(ports))
+      if down in ports: ports.remove(down)
+      wanted[frozenset(ports)] = ports
+
+    for cloud_id in [c for c in clouds if c not in wanted]:
+      self._remove_cloud(clouds.pop(cloud_id), changes)
+
+    for cloud_id,ports in wanted.iteritems():
+      if cloud_id in clouds: continue
       cloud = Cloud(cloud_id)
-      cloud.ports.extend(clique)
+      cloud.ports.extend(ports)
       clouds[cloud_id] = cloud
-      switches[cloud_id]= cloud
-      for sw in clique:
-        sw_dpid = switches[sw[0]]
-        sw_port = sw[1]
-        adjacency[cloud][sw_dpid] = 0
-        adjacency[sw_dpid][cloud] = sw_port
-        broadcast_adj.add((sw_dpid,cloud))
+      switches[cloud_id] = cloud
+      for dpid,port in ports:
+        cloud_at[(dpid,port)] = cloud
+        sw = switches[dpid]
+        _link(cloud, sw, 0, port, changes)
+        broadcast_adj.add((sw,cloud))
+
+  def _remove_cloud (self, cloud, changes):
+    for dpid,port in cloud.ports:
+      if cloud_at.get((dpid,port)) is cloud:
+        del cloud_at[(dpid,port)]
+      sw = switches[dpid]
+      _unlink(sw, cloud, changes)
+      broadcast_adj.discard((sw,cloud))
+    del switches[cloud.dpid]
+    adjacency.pop(cloud, None)
+    _merge_changes(changes, _forget_node(cloud))
+    for mac in mac_map.forget_location((cloud, 0)):
+      log.debug("Unlearned %s", mac)
 
 
 class Cloud(Switch):
@@ -688,8 +774,31 @@ class Cloud(Switch):
 
 
 
-def launch ():
+def launch (max_paths = MAX_ECMP_PATHS, path_idle_time = PATH_IDLE_TIME,
+            flow_hash = "rendezvous", hash_fields = None):
+  """
+  Starts l2_multi
+
+  --max_paths limits how many equal-cost paths are used between any two
+  switches.  --path_idle_time is how long (in seconds) unused path
+  information is kept.  --flow_hash picks how flows are spread over the
+  best paths (rendezvous or maglev), and --hash_fields is a
+  comma-separated list of ofp_match fields to hash (the default is the
+  IP 5-tuple).
+  """
+  global MAX_ECMP_PATHS, PATH_IDLE_TIME, flow_hasher
+  MAX_ECMP_PATHS = int(max_paths)
+  PATH_IDLE_TIME = float(path_idle_time)
+  if MAX_ECMP_PATHS < 1:
+    raise RuntimeError("Expected max_paths to be at least 1")
+
+  kw = {}
+  if hash_fields: kw['fields'] = hash_fields
+  flow_hasher = get_flow_hash(flow_hash, **kw)
+
   core.registerNew(l2_multi)
 
   timeout = min(max(PATH_SETUP_TIME, 5) * 2, 15)
-  Timer(timeout, WaitingPath.expire_waiting_paths, recurring=True)
+  Timer(timeout, pending_installs.expire, recurring=True)
+  Timer(max(PATH_IDLE_TIME / 2, 1), _expire_path_entries, recurring=True)
+  Timer(FLOW_HARD_TIMEOUT, flow_index.expire, recurring=True)
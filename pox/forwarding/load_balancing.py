@@ -34,6 +34,11 @@ from pox.lib.recoco import Timer
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpid_to_str
+from pox.lib.mac_table import MacTable
+from pox.openflow.flow_index import FlowIndex, reroute_flows
+from pox.openflow.path_install import PathInstaller, PendingInstalls
+from pox.openflow.path_install import PathInstalled
+from pox.lib.graph.paths import PathMatrix, PathMap
 import time
 
 log = core.getLogger()
@@ -45,26 +50,21 @@ adjacency = defaultdict(lambda:defaultdict(lambda:None))
 # Switches we know of.  [dpid] -> Switch
 switches = {}
 
-# ethaddr -> (switch, port)
-mac_map = {}
+# ethaddr -> (switch, port), also indexed by (switch, port)
+mac_map = MacTable()
 
 port_tx_congestion = defaultdict(lambda: defaultdict(lambda:None))
 
 all_path_tx_congestion = False
 # [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+path_map = PathMap()
 
-round_robin = defaultdict(lambda: defaultdict(lambda: []))
+# [sw1][sw2] -> first hops of equal-cost paths (filled in as needed)
+round_robin = defaultdict(dict)
 used_round_robin = defaultdict(lambda: defaultdict(lambda: []))
 
 will_round_robin= defaultdict(lambda: defaultdict(lambda: []))
 
-best_path = defaultdict(lambda: defaultdict(lambda: []))
-current_path = defaultdict(lambda: defaultdict(lambda: []))
-
-
-# Waiting path.  (dpid,xid)->WaitingPath
-waiting_paths = {}
 
 # Time to not flood in seconds
 FLOOD_HOLDDOWN = 5
@@ -76,6 +76,19 @@ FLOW_HARD_TIMEOUT = 30
 # How long is allowable to set up a path?
 PATH_SETUP_TIME = 4
 
+# Most PacketIns to hold for a flow while its path is being installed
+# (more are dropped)
+MAX_HELD_PACKETS = 8
+
+# Installed flows, by cookie and by the ports they leave switches by
+flow_index = FlowIndex(FLOW_IDLE_TIMEOUT, FLOW_HARD_TIMEOUT)
+
+# Sends path flow_mods with one barrier per switch per batch
+installer = PathInstaller(PATH_SETUP_TIME)
+
+# Paths being installed for PacketIns, and PacketIns held meanwhile
+pending_installs = PendingInstalls(installer, MAX_HELD_PACKETS)
+
 
 def _init_tx_congestion():
     sws = switches.values()
@@ -85,60 +98,29 @@ def _init_tx_congestion():
                 port_tx_congestion[i][adjacency[i][j]] = True
 
 def _calc_paths():
-    def _get_node_list(src, dst):
-        if src is dst:
-            # We're here!
-            return []
-
-        if path_map[src][dst][0] is None:
-            return None
-        intermediate = path_map[src][dst][1]
-        if intermediate is None:
-            return []
-        return _get_raw_path(src, intermediate) + [intermediate] + \
-               _get_raw_path(intermediate, dst)
-
     sws = switches.values()
-    path_map.clear()
-    for k in sws:
-        for j, port in adjacency[k].iteritems():
-            if port is None: continue
-            path_map[k][j] = (1, None)
-        path_map[k][k] = (0, None)  # distance, intermediate
-
-  #dump()
-
+    adj = {}
     for k in sws:
-        for i in sws:
-            for j in sws:
-                if path_map[i][k][0] is not None:
-                    if path_map[k][j][0] is not None:
-                        # i -> k -> j exists
-                        ikj_dist = path_map[i][k][0] + path_map[k][j][0]
-                        if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-                            # i -> k -> j is better than existing
-                            path_map[i][j] = (ikj_dist, k)
-
-                            #print "--------------------"
-                            #dump()
-
+        adj[k] = [j for j, port in adjacency[k].iteritems() if port is not None]
+    path_map.load(PathMatrix(adj))
+    round_robin.clear()
+    used_round_robin.clear()
+    will_round_robin.clear()
 
-    for i in sws:
-        for j in sws:
-            best_path[i][j] = _get_node_list(i, j)
-            round_robin[i][j].append(path_map[i][j][1])
 
-    for k in sws:
-        for i in sws:
-            for j in sws:
-                if path_map[i][k][0] is not None:
-                    if path_map[k][j][0] is not None:
-                        distance = path_map[i][k][0] + path_map[k][j][0]
-                        if distance == path_map[i][j][0] and k != path_map[i][j][1] and k != i and k != j:
-                            path_map[i][j] = (distance, k)
-                            current_path[i][j] = _get_node_list(i, j)
-                            if current_path[i][j] != best_path[i][j]:
-                                round_robin[i][j].append(k)
+def _round_robin(src, dst):
+    """
+  Get the intermediates to try for src -> dst, one per equal-cost path
+  """
+    r = round_robin[src].get(dst)
+    if r is None:
+        distance = path_map[src][dst][0]
+        if distance is not None and distance > 1:
+            r = path_map.matrix.first_hops(src, dst)
+        else:
+            r = [None]
+        round_robin[src][dst] = r
+    return r
 
 
 def _get_raw_path(src, dst):
@@ -188,7 +170,7 @@ def _get_path(src, dst, first_port, final_port, match):
         if src == dst:
             path = [src]
         else:
-            if len(path_map) ==0:
+            if path_map.matrix is None:
                 _calc_paths()
                 _init_tx_congestion()
             path = _get_raw_path(src, dst)
@@ -217,77 +199,20 @@ def _get_path(src, dst, first_port, final_port, match):
         if all(port_tx_congestion_list):
             return r
         else:
-            if used_round_robin[src][dst] == round_robin[src][dst]:
+            if used_round_robin[src][dst] == _round_robin(src, dst):
                 del used_round_robin[src][dst][:]
                 return None
-            will_round_robin[src][dst] = [x for x in round_robin[src][dst] if x not in used_round_robin[src][dst]]
+            will_round_robin[src][dst] = [x for x in _round_robin(src, dst) if x not in used_round_robin[src][dst]]
             path_map[src][dst] = (path_map[src][dst][0],will_round_robin[src][dst][0])
             used_round_robin[src][dst].append(will_round_robin[src][dst][0])
 
 
-class WaitingPath (object):
+def _new_hops (flow):
   """
-  A path which is waiting for its path to be established
+  Gets the hops a rerouted flow should take (see reroute_flows())
   """
-  def __init__ (self, path, packet):
-    """
-    xids is a sequence of (dpid,xid)
-    first_switch is the DPID where the packet came from
-    packet is something that can be sent in a packet_out
-    """
-    self.expires_at = time.time() + PATH_SETUP_TIME
-    self.path = path
-    self.first_switch = path[0][0].dpid
-    self.xids = set()
-    self.packet = packet
-
-    if len(waiting_paths) > 1000:
-      WaitingPath.expire_waiting_paths()
-
-  def add_xid (self, dpid, xid):
-    self.xids.add((dpid,xid))
-    waiting_paths[(dpid,xid)] = self
-
-  @property
-  def is_expired (self):
-    return time.time() >= self.expires_at
-
-  def notify (self, event):
-    """
-    Called when a barrier has been received
-    """
-    self.xids.discard((event.dpid,event.xid))
-    if len(self.xids) == 0:
-      # Done!
-      if self.packet:
-        log.debug("Sending delayed packet out %s"
-                  % (dpid_to_str(self.first_switch),))
-        msg = of.ofp_packet_out(data=self.packet,
-            action=of.ofp_action_output(port=of.OFPP_TABLE))
-        core.openflow.sendToDPID(self.first_switch, msg)
-
-      core.l2_multi.raiseEvent(PathInstalled(self.path))
-
-
-  @staticmethod
-  def expire_waiting_paths ():
-    packets = set(waiting_paths.values())
-    killed = 0
-    for p in packets:
-      if p.is_expired:
-        killed += 1
-        for entry in p.xids:
-          waiting_paths.pop(entry, None)
-    if killed:
-      log.error("%i paths failed to install" % (killed,))
-
-
-class PathInstalled (Event):
-  """
-  Fired when a path is installed
-  """
-  def __init__ (self, path):
-    self.path = path
+  src,first_port,dst,final_port = flow.route
+  return _get_path(src, dst, first_port, final_port, flow.match)
 
 
 class Switch (EventMixin):
@@ -301,23 +226,16 @@ class Switch (EventMixin):
   def __repr__ (self):
     return dpid_to_str(self.dpid)
 
-  def _install (self, switch, in_port, out_port, match, buf = None):
-    msg = of.ofp_flow_mod()
-    msg.match = match
-    msg.match.in_port = in_port
-    msg.idle_timeout = FLOW_IDLE_TIMEOUT
-    msg.hard_timeout = FLOW_HARD_TIMEOUT
-    msg.actions.append(of.ofp_action_output(port = out_port))
-    msg.buffer_id = buf
-    switch.connection.send(msg)
-
   def _install_path (self, p, match, packet_in=None):
-    wp = WaitingPath(p, packet_in)
+    """
+    Installs a flow along p, indexing it so it can be rerouted later
+    """
+    flow = flow_index.add(match, (p[0][0], p[0][1], p[-1][0], p[-1][2]), p)
+    txn = pending_installs.begin(core.l2_multi, p, match, packet_in)
     for sw,in_port,out_port in p:
-      self._install(sw, in_port, out_port, match)
-      msg = of.ofp_barrier_request()
-      sw.connection.send(msg)
-      wp.add_xid(sw.dpid,msg.xid)
+      if sw.connection is None: continue
+      txn.send(sw.connection, flow_index.flow_mod(flow, in_port, out_port))
+    txn.commit()
 
   def install_path (self, dst_sw, last_port, match, event):
     """
@@ -445,6 +363,9 @@ class Switch (EventMixin):
       else:
         dest = mac_map[packet.dst]
         match = of.ofp_match.from_packet(packet,spec_frags= True)
+        if pending_installs.hold(core.l2_multi, self.dpid, match, event,
+                                 drop):
+          return
         self.install_path(dest[0], dest[1], match, event)
 
   def disconnect (self):
@@ -484,6 +405,20 @@ class l2_multi (EventMixin):
   ])
 
   def __init__ (self):
+    # Rerouting counters: link failures handled, flows moved, flow_mods
+    # sent, flow_mods clearing everything would have needed instead, and
+    # how long the last reroute took to be confirmed by barriers
+    self.reroutes = 0
+    self.rerouted_flows = 0
+    self.reroute_flow_mods = 0
+    self.reroute_full_clear_flow_mods = 0
+    self.last_convergence_time = None
+
+    # PacketIns for flows whose paths were already being installed, and
+    # how many of them were dropped rather than held
+    self.redundant_installs_avoided = 0
+    self.held_packets_dropped = 0
+
     # Listen to dependencies (specifying priority 0 for openflow)
     core.listen_to_dependencies(self, listen_args={'openflow':{'priority':0}})
 
@@ -495,16 +430,18 @@ class l2_multi (EventMixin):
     sw1 = switches[l.dpid1]
     sw2 = switches[l.dpid2]
 
-    # Invalidate all flows and path info.
+    # Invalidate path info, and for link adds, all flows.
     # For link adds, this makes sure that if a new link leads to an
     # improved path, we use it.
     # For link removals, this makes sure that we don't use a
-    # path that may have been broken.
-    #NOTE: This could be radically improved! (e.g., not *ALL* paths break)
-    clear = of.ofp_flow_mod(command=of.OFPFC_DELETE)
-    for sw in switches.itervalues():
-      if sw.connection is None: continue
-      sw.connection.send(clear)
+    # path that may have been broken.  Only the flows which used the
+    # removed link are rerouted (see reroute_flows()).
+    if not event.removed:
+      clear = of.ofp_flow_mod(command=of.OFPFC_DELETE)
+      for sw in switches.itervalues():
+        if sw.connection is None: continue
+        sw.connection.send(clear)
+      flow_index.clear()
     path_map.clear()
 
     if event.removed:
@@ -513,7 +450,7 @@ class l2_multi (EventMixin):
       if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
 
       # But maybe there's another way to connect these...
-      for ll in core.openflow_discovery.adjacency:
+      for ll in core.openflow_discovery.adjacency.links_on(l.dpid1):
         if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
           if flip(ll) in core.openflow_discovery.adjacency:
             # Yup, link goes both ways
@@ -521,6 +458,9 @@ class l2_multi (EventMixin):
             adjacency[sw2][sw1] = ll.port2
             # Fixed -- new link chosen to connect these
             break
+
+      reroute_flows(self, flow_index, installer, l, _new_hops,
+                    len(switches))
     else:
       # If we already consider these nodes connected, we can
       # ignore this link up.
@@ -535,13 +475,9 @@ class l2_multi (EventMixin):
 
       # If we have learned a MAC on this port which we now know to
       # be connected to a switch, unlearn it.
-      bad_macs = set()
-      for mac,(sw,port) in mac_map.iteritems():
-        if sw is sw1 and port == l.port1: bad_macs.add(mac)
-        if sw is sw2 and port == l.port2: bad_macs.add(mac)
-      for mac in bad_macs:
-        log.debug("Unlearned %s", mac)
-        del mac_map[mac]
+      for loc in ((sw1, l.port1), (sw2, l.port2)):
+        for mac in mac_map.forget_location(loc):
+          log.debug("Unlearned %s", mac)
 
   def _handle_openflow_ConnectionUp (self, event):
     sw = switches.get(event.dpid)
@@ -553,13 +489,11 @@ class l2_multi (EventMixin):
     else:
       sw.connect(event.connection)
 
+  def _handle_openflow_FlowRemoved (self, event):
+    flow_index.flow_removed(event)
+
   def _handle_openflow_BarrierIn (self, event):
-    wp = waiting_paths.pop((event.dpid,event.xid), None)
-    if not wp:
-      #log.info("No waiting packet %s,%s", event.dpid, event.xid)
-      return
-    #log.debug("Notify waiting packet %s,%s", event.dpid, event.xid)
-    wp.notify(event)
+    installer.barrier_in(event)
 
   def _handle_openflow_PortStats(self, event):
     print 'switch is ' + str(event.dpid) + ' port number is ' +str(event.ofp.port_no) + ' congestion bit is ' + str(event.ofp.tx_congestion)
@@ -568,4 +502,5 @@ def launch ():
   core.registerNew(l2_multi)
 
   timeout = min(max(PATH_SETUP_TIME, 5) * 2, 15)
-  Timer(timeout, WaitingPath.expire_waiting_paths, recurring=True)
+  Timer(timeout, pending_installs.expire, recurring=True)
+  Timer(FLOW_HARD_TIMEOUT, flow_index.expire, recurring=True)
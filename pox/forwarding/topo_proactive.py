@@ -38,6 +38,7 @@ from pox.lib.util import dpid_to_str
 from pox.proto.dhcpd import DHCPLease, DHCPD
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
+from pox.lib.graph.paths import PathMatrix, PathMap
 import time
 
 log = core.getLogger("f.t_p")
@@ -51,7 +52,7 @@ switches_by_dpid = {}
 switches_by_id = {}
 
 # [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+path_map = PathMap()
 
 
 def dpid_to_mac (dpid):
@@ -60,48 +61,20 @@ def dpid_to_mac (dpid):
 
 def _calc_paths ():
   """
-  Essentially Floyd-Warshall algorithm
+  Computes all shortest paths (a BFS from each switch)
   """
-
-  def dump ():
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
-
   sws = switches_by_dpid.values()
-  path_map.clear()
-  for k in sws:
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j] = (1,None)
-    path_map[k][k] = (0,None) # distance, intermediate
-
-  #dump()
-
+  adj = {}
   for k in sws:
-    for i in sws:
-      for j in sws:
-        if path_map[i][k][0] is not None:
-          if path_map[k][j][0] is not None:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-              # i -> k -> j is better than existing
-              path_map[i][j] = (ikj_dist, k)
-
-  #print "--------------------"
-  #dump()
+    adj[k] = [j for j,port in adjacency[k].iteritems() if port is not None]
+  path_map.load(PathMatrix(adj))
 
 
 def _get_raw_path (src, dst):
   """
   Get a raw path (just a list of nodes to traverse)
   """
-  if len(path_map) == 0: _calc_paths()
+  if path_map.matrix is None: _calc_paths()
   if src is dst:
     # We're here!
     return []
@@ -434,7 +407,7 @@ class topo_addressing (object):
       if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
 
       # But maybe there's another way to connect these...
-      for ll in core.openflow_discovery.adjacency:
+      for ll in core.openflow_discovery.adjacency.links_on(l.dpid1):
         if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
           if flip(ll) in core.openflow_discovery.adjacency:
             # Yup, link goes both ways
@@ -338,12 +338,7 @@ class host_tracker (EventMixin):
     """
     dpid = event.connection.dpid
     inport = event.port
-    packet = event.parsed
-    if not packet.parsed:
-      log.warning("%i %i ignoring unparsed packet", dpid, inport)
-      return
-
-    if packet.type == ethernet.LLDP_TYPE: # Ignore LLDP packets
+    if event.fields.eth_type == ethernet.LLDP_TYPE: # Ignore LLDP packets
       return
     # This should use Topology later
     if not core.openflow_discovery.is_edge_port(dpid, inport):
@@ -351,6 +346,11 @@ class host_tracker (EventMixin):
       log.debug("%i %i ignoring packetIn at switch-only port", dpid, inport)
       return
 
+    packet = event.parsed
+    if not packet.parsed:
+      log.warning("%i %i ignoring unparsed packet", dpid, inport)
+      return
+
     log.debug("PacketIn: %i %i ETH %s => %s",
               dpid, inport, str(packet.src), str(packet.dst))
 
@@ -0,0 +1,198 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Consistent hashing of flows onto weighted choices (e.g., paths)
+
+A FlowHash turns an ofp_match into a 64 bit flow key using a
+configurable set of fields (the IP 5-tuple by default), and picks one of
+a set of weighted choices for a key such that when choices come and go,
+only the flows which have to move do.
+
+There are two implementations:
+ Rendezvous -- highest random weight hashing.  Tables are just the list
+               of choices and lookups are O(choices).  When a choice is
+               removed, only its flows move.
+ Maglev     -- Google's Maglev lookup tables.  Lookups are O(1), but each
+               table is table_size entries, and a few extra flows move on
+               changes.
+
+  hasher = Rendezvous()
+  table = hasher.build(paths, weights)
+  path = hasher.select(table, hasher.flow_key(match))
+"""
+
+import math
+
+# The IP 5-tuple
+DEFAULT_FIELDS = ('nw_src', 'nw_dst', 'nw_proto', 'tp_src', 'tp_dst')
+
+# Used when all of the configured fields are wildcarded (e.g., non-IP)
+FALLBACK_FIELDS = ('dl_src', 'dl_dst', 'dl_type')
+
+_M64 = 0xffffFFFFffffFFFF
+
+
+def _mix64 (x):
+  """
+  The MurmurHash3 64 bit finalizer
+  """
+  x &= _M64
+  x ^= x >> 33
+  x = (x * 0xff51afd7ed558ccd) & _M64
+  x ^= x >> 33
+  x = (x * 0xc4ceb9fe1a85ec53) & _M64
+  x ^= x >> 33
+  return x
+
+
+class FlowHash (object):
+  """
+  Base class for flow hashing schemes
+  """
+  def __init__ (self, fields = DEFAULT_FIELDS):
+    if isinstance(fields, str):
+      fields = fields.replace(",", " ").split()
+    self.fields = tuple(fields)
+
+  def flow_key (self, match):
+    """
+    Returns a 64 bit key for an ofp_match
+    """
+    values = [getattr(match, f) for f in self.fields]
+    if all(v is None for v in values):
+      values = [getattr(match, f) for f in FALLBACK_FIELDS]
+    key = 0
+    for v in values:
+      if v is not None:
+        key = _mix64(key ^ hash(v))
+      else:
+        key = _mix64(key + 1)
+    return key
+
+  def build (self, choices, weights = None):
+    """
+    Returns a table for selecting among choices
+
+    weights, if given, is a parallel sequence of positive numbers; flows
+    are spread in proportion to them.
+    """
+    raise NotImplementedError()
+
+  def select (self, table, key):
+    """
+    Returns the choice for a flow key from a table made by build()
+    """
+    raise NotImplementedError()
+
+
+class Rendezvous (FlowHash):
+  """
+  Weighted rendezvous (highest random weight) hashing
+
+  Each choice gets a score for each flow key (w / -ln(u), where u is a
+  uniform hash of the key and choice), and the highest score wins.
+  """
+  def build (self, choices, weights = None):
+    if weights is not None and len(set(weights)) <= 1:
+      weights = None
+    if weights is None:
+      return (False, [(_mix64(hash(c)), 1.0, c) for c in choices])
+    return (True, [(_mix64(hash(c)), float(w), c)
+                   for c,w in zip(choices, weights)])
+
+  def select (self, table, key):
+    weighted,entries = table
+    if not entries: return None
+    best = None
+    best_score = -1
+    if weighted:
+      log = math.log
+      for seed,weight,choice in entries:
+        # The top 52 bits, so that u is exactly representable and in (0,1)
+        u = ((_mix64(key ^ seed) >> 12) + 0.5) / 4503599627370496.0
+        score = weight / -log(u)
+        if score > best_score:
+          best_score = score
+          best = choice
+    else:
+      for seed,weight,choice in entries:
+        score = _mix64(key ^ seed)
+        if score > best_score:
+          best_score = score
+          best = choice
+    return best
+
+
+class Maglev (FlowHash):
+  """
+  Weighted Maglev hashing
+
+  table_size must be a prime, and should be comfortably larger than the
+  number of choices.
+  """
+  def __init__ (self, fields = DEFAULT_FIELDS, table_size = 251):
+    super(Maglev, self).__init__(fields)
+    self.table_size = int(table_size)
+    if self.table_size < 3 or any(self.table_size % i == 0 for i in
+                                  xrange(2, int(self.table_size ** 0.5) + 1)):
+      raise RuntimeError("Maglev table size must be a prime")
+
+  def build (self, choices, weights = None):
+    choices = list(choices)
+    size = self.table_size
+    if not choices: return []
+    if weights is None: weights = [1] * len(choices)
+    top = float(max(weights))
+
+    # Each choice walks its own permutation of the slots
+    perms = []
+    for c in choices:
+      h = _mix64(hash(c))
+      offset = h % size
+      skip = (h >> 32) % (size - 1) + 1
+      perms.append([offset, skip])
+    credit = [0.0] * len(choices)
+
+    table = [None] * size
+    filled = 0
+    while True:
+      for i,c in enumerate(choices):
+        credit[i] += weights[i] / top
+        if credit[i] < 1: continue
+        credit[i] -= 1
+        p = perms[i]
+        while table[p[0]] is not None:
+          p[0] = (p[0] + p[1]) % size
+        table[p[0]] = c
+        filled += 1
+        if filled == size: return table
+
+  def select (self, table, key):
+    if not table: return None
+    return table[key % len(table)]
+
+
+_hashers = {
+  'rendezvous' : Rendezvous,
+  'maglev' : Maglev,
+}
+
+def get_flow_hash (name, *args, **kw):
+  """
+  Returns a FlowHash by name ("rendezvous" or "maglev")
+  """
+  cls = _hashers.get(name.lower())
+  if cls is None:
+    raise RuntimeError("Unknown flow hash '%s' (expected one of: %s)"
+                       % (name, ", ".join(sorted(_hashers))))
+  return cls(*args, **kw)
@@ -0,0 +1,560 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+All-pairs shortest paths which are kept up to date as links come and go
+
+ShortestPaths keeps, for every source node, the hop count to every node
+it can reach.  The shortest paths from a source form a DAG (u -> v is an
+edge of it when u and v are neighbors and v is one hop further from the
+source than u), so there's no need to store the paths themselves; they
+can be walked back from the destination on demand.  Since the number of
+equal-cost paths can grow combinatorially, sample_paths() picks a bounded
+number of them without enumerating the rest.
+
+Adding or removing a link only revisits the sources whose DAG it touches
+and, for those, only the nodes whose distance changes (for removals,
+this is the approach of Ramalingam and Reps).  Each update returns the
+(source, destination) pairs whose set of shortest paths changed, which
+is what a cache of paths needs to invalidate.
+
+For components which just recompute everything when the topology
+changes, PathMatrix computes all-pairs hop counts and next hops for a
+snapshot of a graph in one go.  If NumPy is available, it does a BFS
+from every source at once with matrix products; otherwise it does a BFS
+per source over integer adjacency lists.  Either way the results are the
+same.  PathMap presents a PathMatrix as the [src][dst] -> (distance,
+intermediate) dicts which the forwarding components have always used.
+"""
+
+from collections import deque
+import heapq
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+_GOLDEN = (5 ** 0.5 - 1) / 2
+
+
+class ShortestPaths (object):
+  """
+  Incrementally maintained all-pairs hop counts on an undirected graph
+
+  Nodes can be any hashable objects.
+  """
+  def __init__ (self):
+    self._adj = {}  # node -> set of neighbors
+    self._dist = {} # source -> {node:hops} for nodes it can reach
+
+  def __contains__ (self, node):
+    return node in self._adj
+
+  def __len__ (self):
+    return len(self._adj)
+
+  @property
+  def nodes (self):
+    return self._adj.keys()
+
+  def neighbors (self, node):
+    return self._adj[node]
+
+  def has_link (self, a, b):
+    return b in self._adj.get(a, ())
+
+  def distance (self, src, dst):
+    """
+    Returns the number of hops from src to dst or None if unreachable
+    """
+    d = self._dist.get(src)
+    if d is None: return None
+    return d.get(dst)
+
+  def distances (self, src):
+    """
+    Returns a {node:hops} dict of everything src can reach (don't modify)
+    """
+    return self._dist[src]
+
+  def predecessors (self, src, dst):
+    """
+    Returns the neighbors of dst which are one hop closer to src
+    """
+    d = self._dist.get(src)
+    if d is None: return []
+    h = d.get(dst)
+    if not h: return []
+    h -= 1
+    return [n for n in self._adj[dst] if d.get(n) == h]
+
+  def _path_counts (self, src, dst):
+    """
+    Returns {node:number of shortest paths from src} for dst's ancestors
+    """
+    d = self._dist[src]
+    adj = self._adj
+    # Gather the ancestors, then count from the source outwards
+    seen = set([dst])
+    q = deque([dst])
+    while q:
+      v = q.popleft()
+      h = d[v] - 1
+      if h < 0: continue
+      for p in adj[v]:
+        if p not in seen and d.get(p) == h:
+          seen.add(p)
+          q.append(p)
+    counts = {}
+    for v in sorted(seen, key = d.__getitem__):
+      if v == src:
+        counts[v] = 1
+      else:
+        h = d[v] - 1
+        counts[v] = sum(counts[p] for p in adj[v] if d.get(p) == h)
+    return counts
+
+  def count_paths (self, src, dst):
+    """
+    Returns the number of shortest paths from src to dst
+    """
+    if self.distance(src, dst) is None: return 0
+    return self._path_counts(src, dst)[dst]
+
+  def sample_paths (self, src, dst, limit):
+    """
+    Returns up to limit shortest paths from src to dst
+
+    If there are more than that, they're picked from a golden ratio
+    sequence over the positions of all of them in an enumeration of the
+    DAG, which spreads them over the choices at every hop rather than just
+    the hops nearest the destination.  Only the chosen paths are built.
+    """
+    if self.distance(src, dst) is None: return []
+    counts = self._path_counts(src, dst)
+    total = counts[dst]
+    if total <= limit:
+      indexes = xrange(total)
+    else:
+      indexes = []
+      used = set()
+      for i in xrange(limit):
+        index = int((i * _GOLDEN) % 1.0 * total)
+        while index in used:
+          index = (index + 1) % total
+        used.add(index)
+        indexes.append(index)
+    d = self._dist[src]
+    adj = self._adj
+    r = []
+    for index in indexes:
+      path = [dst]
+      v = dst
+      while v != src:
+        h = d[v] - 1
+        for p in adj[v]:
+          if d.get(p) != h: continue
+          c = counts[p]
+          if index < c: break
+          index -= c
+        path.append(p)
+        v = p
+      path.reverse()
+      r.append(tuple(path))
+    return r
+
+  def paths (self, src, dst):
+    """
+    Generates every shortest path from src to dst as a tuple of nodes
+    """
+    if self.distance(src, dst) is None: return
+    def walk (node, suffix):
+      if node == src:
+        yield (src,) + suffix
+        return
+      suffix = (node,) + suffix
+      for p in self.predecessors(src, node):
+        for r in walk(p, suffix):
+          yield r
+    for r in walk(dst, ()):
+      yield r
+
+  def add_node (self, node):
+    if node in self._adj: return
+    self._adj[node] = set()
+    self._dist[node] = {node:0}
+
+  def remove_node (self, node):
+    """
+    Removes a node and its links
+
+    Returns changes as with remove_link(), except that the removed node
+    isn't included as a source.
+    """
+    changes = {}
+    if node not in self._adj: return changes
+    for n in list(self._adj[node]):
+      for s,dsts in self.remove_link(node, n).iteritems():
+        if s is node: continue
+        changes.setdefault(s, set()).update(dsts)
+    del self._adj[node]
+    del self._dist[node]
+    return changes
+
+  def add_link (self, a, b):
+    """
+    Adds an (undirected) link between a and b, adding them if needed
+
+    Returns a {source:set(destinations)} dict of the pairs whose shortest
+    paths changed.
+    """
+    self.add_node(a)
+    self.add_node(b)
+    changes = {}
+    if b in self._adj[a]: return changes
+    self._adj[a].add(b)
+    self._adj[b].add(a)
+
+    for s,d in self._dist.iteritems():
+      da = d.get(a)
+      db = d.get(b)
+      if da is None and db is None: continue
+      if da == db: continue
+      if db is None or (da is not None and da < db):
+        near,far = a,b
+        dn = da
+      else:
+        near,far = b,a
+        dn = db
+      df = d.get(far)
+
+      changed = set()
+      if df is None or df > dn + 1:
+        # Things got closer; propagate outwards from far
+        d[far] = dn + 1
+        changed.add(far)
+        q = deque([far])
+        while q:
+          v = q.popleft()
+          h = d[v] + 1
+          for w in self._adj[v]:
+            dw = d.get(w)
+            if dw is None or dw > h:
+              d[w] = h
+              changed.add(w)
+              q.append(w)
+      # Otherwise far is one hop further than near, so far (and everything
+      # below it) just gained paths through the new link.
+
+      changed.add(far)
+      changes[s] = self._descendants(d, changed)
+
+    return changes
+
+  def remove_link (self, a, b):
+    """
+    Removes the link between a and b
+
+    Returns changes as with add_link().
+    """
+    changes = {}
+    if b not in self._adj.get(a, ()): return changes
+    self._adj[a].discard(b)
+    self._adj[b].discard(a)
+
+    adj = self._adj
+    for s,d in self._dist.iteritems():
+      da = d.get(a)
+      db = d.get(b)
+      if da is None or da == db: continue
+      if da < db:
+        near,far = a,b
+      else:
+        near,far = b,a
+      hf = d[far] - 1
+      if any(d.get(n) == hf for n in adj[far]):
+        # far still has a shortest path of the same length, so no
+        # distances change; far and its descendants just lost some paths.
+        changes[s] = self._descendants(d, (far,))
+        continue
+
+      # Find the nodes all of whose shortest paths went through the link
+      # (in order of distance, so a node's parents are settled first).
+      lost = set([far])
+      q = deque([far])
+      while q:
+        v = q.popleft()
+        h = d[v] + 1
+        for w in adj[v]:
+          if w in lost or d.get(w) != h: continue
+          if all(p in lost for p in adj[w] if d.get(p) == h - 1):
+            lost.add(w)
+            q.append(w)
+
+      # Nodes below the lost ones may keep their distance but lose paths
+      affected = self._descendants(d, lost)
+
+      # Reattach the lost nodes via their best unaffected neighbor
+      heap = []
+      for v in lost:
+        del d[v]
+      for v in lost:
+        best = None
+        for n in adj[v]:
+          dn = d.get(n)
+          if dn is not None and (best is None or dn < best): best = dn
+        if best is not None:
+          heap.append((best + 1, v))
+      heapq.heapify(heap)
+      while heap:
+        h,v = heapq.heappop(heap)
+        if v in d: continue
+        d[v] = h
+        for w in adj[v]:
+          if w in lost and w not in d:
+            heapq.heappush(heap, (h + 1, w))
+
+      affected.update(self._descendants(d, [v for v in lost if v in d]))
+      changes[s] = affected
+
+    return changes
+
+  def _descendants (self, d, roots):
+    """
+    Returns roots plus everything below them in the shortest path DAG d
+    """
+    adj = self._adj
+    seen = set(roots)
+    q = deque(seen)
+    while q:
+      v = q.popleft()
+      dv = d.get(v)
+      if dv is None: continue
+      h = dv + 1
+      for w in adj[v]:
+        if w not in seen and d.get(w) == h:
+          seen.add(w)
+          q.append(w)
+    return seen
+
+  def recompute (self):
+    """
+    Recomputes all distances from scratch (with a PathMatrix)
+    """
+    m = PathMatrix(self._adj)
+    for s in self._adj:
+      self._dist[s] = m.distances(s)
+
+
+class PathMatrix (object):
+  """
+  All-pairs hop counts and next hops for a snapshot of a directed graph
+
+  adjacency maps each node to an iterable of the nodes it links to (so an
+  undirected graph lists each link both ways).  Where there are several
+  shortest paths, next_hop() picks the neighbor which comes first in
+  nodes.  Set use_numpy to force (or avoid) the NumPy implementation.
+  """
+  def __init__ (self, adjacency, use_numpy = None):
+    nodes = list(adjacency)
+    index = dict((n,i) for i,n in enumerate(nodes))
+    for targets in adjacency.values():
+      for m in targets:
+        if m not in index:
+          index[m] = len(nodes)
+          nodes.append(m)
+    self.nodes = nodes
+    self.index = index
+    self._neighbors = [sorted(set(index[m] for m in adjacency.get(n, ())
+                                  if m != n))
+                       for n in nodes]
+
+    if use_numpy is None: use_numpy = numpy is not None
+    if use_numpy and numpy is None:
+      raise RuntimeError("NumPy isn't available")
+    self.uses_numpy = bool(use_numpy)
+    if use_numpy:
+      self._compute_numpy()
+    else:
+      self._compute()
+
+  def __contains__ (self, node):
+    return node in self.index
+
+  def __len__ (self):
+    return len(self.nodes)
+
+  def _compute (self):
+    """
+    BFS from each source, keeping the lowest-numbered first hop
+    """
+    n = len(self.nodes)
+    nbrs = self._neighbors
+    self._dist = dist = []
+    self._next = nexts = []
+    for s in xrange(n):
+      d = [-1] * n
+      h = [-1] * n
+      d[s] = 0
+      q = deque([s])
+      while q:
+        v = q.popleft()
+        dv = d[v] + 1
+        hv = h[v]
+        for w in nbrs[v]:
+          dw = d[w]
+          if dw < 0:
+            d[w] = dv
+            h[w] = w if v == s else hv
+            q.append(w)
+          elif dw == dv and v != s and hv < h[w]:
+            # Every node at the previous level is handled before w is,
+            # so w ends up with the lowest first hop of all its parents
+            h[w] = hv
+      dist.append(d)
+      nexts.append(h)
+
+  def _compute_numpy (self):
+    """
+    BFS from all sources at once, a level per matrix product
+    """
+    n = len(self.nodes)
+    a = numpy.zeros((n, n), dtype = numpy.float32)
+    for i,ns in enumerate(self._neighbors):
+      if ns: a[i, ns] = 1
+    d = numpy.full((n, n), -1, dtype = numpy.int32)
+    numpy.fill_diagonal(d, 0)
+    reached = numpy.eye(n, dtype = bool)
+    frontier = numpy.eye(n, dtype = numpy.float32)
+    level = 0
+    while True:
+      level += 1
+      new = (frontier.dot(a) > 0) & ~reached
+      if not new.any(): break
+      d[new] = level
+      reached |= new
+      frontier = new.astype(numpy.float32)
+
+    # The next hop to j is the first neighbor which is a hop closer to j
+    h = numpy.full((n, n), -1, dtype = numpy.int32)
+    for i,ns in enumerate(self._neighbors):
+      if not ns: continue
+      ns = numpy.array(ns)
+      closer = (d[ns] == d[i] - 1) & (d[i] > 0)
+      found = closer.any(axis = 0)
+      h[i, found] = ns[closer.argmax(axis = 0)[found]]
+
+    self._dist = d.tolist()
+    self._next = h.tolist()
+
+  def distance (self, src, dst):
+    """
+    Returns the number of hops from src to dst or None if unreachable
+    """
+    i = self.index.get(src)
+    j = self.index.get(dst)
+    if i is None or j is None: return None
+    d = self._dist[i][j]
+    if d < 0: return None
+    return d
+
+  def distances (self, src):
+    """
+    Returns a {node:hops} dict of everything src can reach
+    """
+    nodes = self.nodes
+    return dict((nodes[j],d) for j,d in enumerate(self._dist[self.index[src]])
+                if d >= 0)
+
+  def next_hop (self, src, dst):
+    """
+    Returns the neighbor of src on a shortest path to dst (or None)
+    """
+    i = self.index.get(src)
+    j = self.index.get(dst)
+    if i is None or j is None: return None
+    h = self._next[i][j]
+    if h < 0: return None
+    return self.nodes[h]
+
+  def first_hops (self, src, dst):
+    """
+    Returns every neighbor of src on a shortest path to dst, in order
+    """
+    i = self.index.get(src)
+    j = self.index.get(dst)
+    if i is None or j is None: return []
+    want = self._dist[i][j] - 1
+    if want < 0: return []
+    dist = self._dist
+    return [self.nodes[k] for k in self._neighbors[i] if dist[k][j] == want]
+
+  def path (self, src, dst):
+    """
+    Returns a shortest path from src to dst as a list of nodes (or None)
+    """
+    if self.distance(src, dst) is None: return None
+    i = self.index[src]
+    j = self.index[dst]
+    r = [i]
+    while i != j:
+      i = self._next[i][j]
+      r.append(i)
+    nodes = self.nodes
+    return [nodes[k] for k in r]
+
+
+class _PathMapRow (dict):
+  def __init__ (self, matrix, src):
+    self.matrix = matrix
+    self.src = src
+
+  def __missing__ (self, dst):
+    m = self.matrix
+    d = None if m is None else m.distance(self.src, dst)
+    if d is None:
+      r = (None, None)
+    elif d <= 1:
+      r = (d, None)
+    else:
+      r = (d, m.next_hop(self.src, dst))
+    self[dst] = r
+    return r
+
+
+class PathMap (dict):
+  """
+  A [src][dst] -> (distance, intermediate) view of a PathMatrix
+
+  This is the form of the path_map which the forwarding components'
+  Floyd-Warshall used to build: unreachable pairs are (None, None), and
+  the intermediate is None for adjacent nodes.  Here the intermediate is
+  always the next hop, so expanding a path recursively still works.
+  Entries are made when they're first looked up and may be overwritten.
+  """
+  def __init__ (self):
+    super(PathMap, self).__init__()
+    self.matrix = None
+
+  def load (self, matrix):
+    dict.clear(self)
+    self.matrix = matrix
+
+  def clear (self):
+    dict.clear(self)
+    self.matrix = None
+
+  def __missing__ (self, src):
+    row = _PathMapRow(self.matrix, src)
+    self[src] = row
+    return row
@@ -0,0 +1,108 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A MAC address -> location table which is also indexed by location
+
+MacTable is a dict (so lookups cost what they always did), but it also
+keeps the set of addresses learned at each location, so that forgetting
+everything learned on a port -- e.g., when discovery finds out that the
+port is actually connected to another switch -- only touches the
+addresses that were there instead of scanning the whole table.
+"""
+
+
+class MacTable (dict):
+  """
+  A dict of MAC -> location with a reverse index of location -> MACs
+
+  Locations are anything hashable; the forwarding components use
+  (switch, port) tuples.
+  """
+  def __init__ (self, *args, **kw):
+    super(MacTable, self).__init__()
+    self._at = {} # location -> set of MACs
+    self.update(*args, **kw)
+
+  def __setitem__ (self, mac, location):
+    old = self.get(mac)
+    if old is not None:
+      if old == location: return
+      self._unindex(mac, old)
+    dict.__setitem__(self, mac, location)
+    macs = self._at.get(location)
+    if macs is None:
+      self._at[location] = set([mac])
+    else:
+      macs.add(mac)
+
+  def __delitem__ (self, mac):
+    location = self[mac]
+    dict.__delitem__(self, mac)
+    self._unindex(mac, location)
+
+  def _unindex (self, mac, location):
+    macs = self._at.get(location)
+    if macs is None: return
+    macs.discard(mac)
+    if not macs: del self._at[location]
+
+  _missing = object()
+
+  def pop (self, mac, default = _missing):
+    if mac not in self:
+      if default is self._missing: raise KeyError(mac)
+      return default
+    location = self[mac]
+    del self[mac]
+    return location
+
+  def popitem (self):
+    mac,location = dict.popitem(self)
+    self._unindex(mac, location)
+    return mac,location
+
+  def setdefault (self, mac, location = None):
+    if mac not in self:
+      self[mac] = location
+    return self[mac]
+
+  def update (self, *args, **kw):
+    for mac,location in dict(*args, **kw).iteritems():
+      self[mac] = location
+
+  def clear (self):
+    dict.clear(self)
+    self._at.clear()
+
+  def copy (self):
+    return MacTable(self)
+
+  def macs_at (self, location):
+    """
+    Returns the set of MACs learned at a location (don't modify it)
+    """
+    return self._at.get(location, frozenset())
+
+  def forget_location (self, location):
+    """
+    Forgets every MAC learned at a location and returns them
+    """
+    macs = self._at.pop(location, None)
+    if not macs: return ()
+    for mac in macs:
+      dict.__delitem__(self, mac)
+    return macs
+
+  @property
+  def locations (self):
+    return self._at.keys()
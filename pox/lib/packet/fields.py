@@ -0,0 +1,173 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Fast access to common header fields of a raw Ethernet frame
+
+Building a full packet object chain (ethernet -> ipv4 -> tcp ...) is
+relatively expensive, and lots of code only wants to know a few things
+like the MAC addresses and ethertype.  PacketFields pulls those out of the
+raw bytes at fixed offsets without building any packet objects.
+
+Field names and values follow ofp_match (e.g., dl_type is the ethertype
+after any VLAN/SNAP header, and ARP opcode/addresses show up as
+nw_proto/nw_src/nw_dst), so a handler can switch between this and
+ofp_match.from_packet() without surprises.
+"""
+
+import struct
+
+from pox.lib.addresses import EthAddr, IPAddr
+
+_IP_TYPE = 0x0800
+_ARP_TYPE = 0x0806
+_VLAN_TYPE = 0x8100
+_NOT_ETH_TYPE = 0x05ff # OFP_DL_TYPE_NOT_ETH_TYPE
+_VLAN_NONE = 0xffff # OFP_VLAN_NONE
+
+_SNAP = b'\xaa\xaa\x03\x00\x00\x00'
+
+_H = struct.Struct("!H")
+_ipv4_struct = struct.Struct("!BBHHHBBH4s4s")
+_arp_struct = struct.Struct("!HHBBH6s4s6s4s")
+_ports_struct = struct.Struct("!HH")
+_icmp_struct = struct.Struct("!BB")
+
+
+class PacketFields (object):
+  """
+  Header fields of a raw Ethernet frame
+
+  The Ethernet header is decoded when the object is created.  The L3 and
+  L4 fields are decoded the first time any of them is accessed.  Fields
+  which don't apply to the packet (or which are cut off) are None.
+  """
+  __slots__ = ('raw', 'eth_type', 'dl_type', 'dl_vlan', 'dl_vlan_pcp',
+               '_l3_offset', '_dl_src', '_dl_dst', '_nw')
+
+  def __init__ (self, raw):
+    self.raw = raw
+    self._dl_src = None
+    self._dl_dst = None
+    self._nw = None
+
+    if len(raw) < 14:
+      self.eth_type = None
+      self.dl_type = None
+      self.dl_vlan = None
+      self.dl_vlan_pcp = None
+      self._l3_offset = None
+      return
+
+    t = _H.unpack_from(raw, 12)[0]
+    self.eth_type = t
+    offset = 14
+    if t < 1536:
+      # 802.3; only SNAP with a zero OUI carries an ethertype
+      if raw[14:20] == _SNAP and len(raw) >= 22:
+        t = _H.unpack_from(raw, 20)[0]
+        offset = 22
+      else:
+        t = _NOT_ETH_TYPE
+    if t == _VLAN_TYPE and len(raw) >= offset + 4:
+      tci = _H.unpack_from(raw, offset)[0]
+      self.dl_vlan = tci & 0xfff
+      self.dl_vlan_pcp = tci >> 13
+      t = _H.unpack_from(raw, offset + 2)[0]
+      offset += 4
+    else:
+      self.dl_vlan = _VLAN_NONE
+      self.dl_vlan_pcp = 0
+    self.dl_type = t
+    self._l3_offset = offset
+
+  @property
+  def dl_src (self):
+    if self._dl_src is None and self._l3_offset is not None:
+      self._dl_src = EthAddr(self.raw[6:12])
+    return self._dl_src
+
+  @property
+  def dl_dst (self):
+    if self._dl_dst is None and self._l3_offset is not None:
+      self._dl_dst = EthAddr(self.raw[0:6])
+    return self._dl_dst
+
+  # Same as above, but named like pox.lib.packet.ethernet's attributes
+  src = dl_src
+  dst = dl_dst
+
+  def _decode_nw (self):
+    """
+    Decodes L3/L4 into a tuple of
+    (nw_src, nw_dst, nw_proto, nw_tos, tp_src, tp_dst, is_fragment)
+    """
+    raw = self.raw
+    offset = self._l3_offset
+    nw_src = nw_dst = nw_proto = nw_tos = tp_src = tp_dst = None
+    frag = False
+    if self.dl_type == _IP_TYPE and len(raw) >= offset + 20:
+      (vhl, nw_tos, _, _, flags_frag, _, nw_proto, _,
+       src, dst) = _ipv4_struct.unpack_from(raw, offset)
+      nw_src = IPAddr(src)
+      nw_dst = IPAddr(dst)
+      frag = (flags_frag & 0x3fff) != 0 # More fragments or offset
+      offset += (vhl & 0x0f) * 4
+      if nw_proto in (6, 17): # TCP, UDP
+        if len(raw) >= offset + 4:
+          tp_src,tp_dst = _ports_struct.unpack_from(raw, offset)
+      elif nw_proto == 1: # ICMP
+        if len(raw) >= offset + 2:
+          tp_src,tp_dst = _icmp_struct.unpack_from(raw, offset)
+    elif self.dl_type == _ARP_TYPE and len(raw) >= offset + 28:
+      (_, _, _, _, opcode, _, spa, _,
+       tpa) = _arp_struct.unpack_from(raw, offset)
+      if opcode <= 255:
+        nw_proto = opcode
+        nw_src = IPAddr(spa)
+        nw_dst = IPAddr(tpa)
+    self._nw = (nw_src, nw_dst, nw_proto, nw_tos, tp_src, tp_dst, frag)
+    return self._nw
+
+  @property
+  def nw_src (self):
+    return (self._nw or self._decode_nw())[0]
+
+  @property
+  def nw_dst (self):
+    return (self._nw or self._decode_nw())[1]
+
+  @property
+  def nw_proto (self):
+    return (self._nw or self._decode_nw())[2]
+
+  @property
+  def nw_tos (self):
+    return (self._nw or self._decode_nw())[3]
+
+  @property
+  def tp_src (self):
+    return (self._nw or self._decode_nw())[4]
+
+  @property
+  def tp_dst (self):
+    return (self._nw or self._decode_nw())[5]
+
+  @property
+  def is_fragment (self):
+    """
+    True if this is an IPv4 fragment (so the L4 fields may be bogus)
+    """
+    return (self._nw or self._decode_nw())[6]
+
+  def __str__ (self):
+    return "[%s>%s %04x]" % (self.dl_src, self.dl_dst, self.dl_type or 0)
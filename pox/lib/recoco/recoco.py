@@ -25,6 +25,7 @@ import os
 import socket
 import pox.lib.util
 import random
+import heapq
 from types import GeneratorType
 from pox.lib.epoll_select import EpollSelect
 
@@ -583,7 +584,7 @@ class SelectHub (object):
   a scheduler as well as timed wakes (i.e., Sleep()).
   """
   def __init__ (self, scheduler, use_epoll=False, threaded=True):
-    # We store tuples of (elapse-time, task)
+    # We store tuples of (task, rlist, wlist, xlist, timeout)
     self._incoming = Queue() # Threadsafe queue for new items
 
     self._scheduler = scheduler
@@ -593,8 +594,22 @@ class SelectHub (object):
     else:
       self._select_func = select.select
 
+    # task -> the tuple it was registered with
     self._tasks = {}
 
+    # Heap of (timeout, sequence, registration tuple).  Entries aren't
+    # removed when their task is woken for some other reason; they're
+    # just skipped when they reach the top and no longer match _tasks.
+    self._timers = []
+    self._timer_seq = 0
+
+    # fd -> task for each kind of event, kept up to date as tasks come and
+    # go.  The lists passed to select are only rebuilt when these change.
+    self._rl = {}
+    self._wl = {}
+    self._xl = {}
+    self._fd_lists = None
+
     self._thread = None
     if threaded:
       self._thread = Thread(target = self._threadProc)
@@ -636,95 +651,114 @@ class SelectHub (object):
     while not _scheduler._hasQuit:
       _select(tasks, rets)
 
+  def _add (self, stuff):
+    """
+    Starts waiting on a registration tuple from _incoming
+    """
+    task,trl,twl,txl,tto = stuff
+    assert task not in self._tasks
+    self._tasks[task] = stuff
+    if tto is not None:
+      self._timer_seq += 1
+      heapq.heappush(self._timers, (tto, self._timer_seq, stuff))
+    if trl or twl or txl:
+      #NOTE: Everything you select on eventually boils down to file
+      #      descriptors, which are unique, so one task per fd.
+      if trl:
+        for i in trl: self._rl[i] = task
+      if twl:
+        for i in twl: self._wl[i] = task
+      if txl:
+        for i in txl: self._xl[i] = task
+      self._fd_lists = None
+
+  def _wake (self, task, rv):
+    """
+    Stops waiting for a task and schedules it with the given return value
+    """
+    task,trl,twl,txl,tto = self._tasks.pop(task)
+    if trl or twl or txl:
+      for fds,fd_map in ((trl,self._rl), (twl,self._wl), (txl,self._xl)):
+        if not fds: continue
+        for i in fds:
+          if fd_map.get(i) is task: del fd_map[i]
+      self._fd_lists = None
+    # Any timer heap entry will be skipped once it gets to the top
+    self._return(task, rv)
+
+  def _next_timer (self):
+    """
+    Returns the earliest live timer entry or None, discarding stale ones
+    """
+    timers = self._timers
+    tasks = self._tasks
+    while timers:
+      top = timers[0]
+      stuff = top[2]
+      if tasks.get(stuff[0]) is stuff:
+        return top
+      heapq.heappop(timers)
+    return None
+
+  def _wake_expired (self, now):
+    while True:
+      top = self._next_timer()
+      if top is None or top[0] > now: return
+      heapq.heappop(self._timers)
+      self._wake(top[2][0], ([],[],[]))
+
   def _select (self, tasks, rets):
     #print("SelectHub cycle")
 
-    #NOTE: Everything you select on eventually boils down to file descriptors,
-    #      which are unique, obviously.  It might be possible to leverage this
-    #      to reduce hashing cost (i.e. by picking a really good hashing
-    #      function), though this is complicated by wrappers, etc...
-    rl = {}
-    wl = {}
-    xl = {}
-
-    timeout = None
-    timeoutTask = None
-
-    now = time.time()
-
-    expired = None
-
-    #TODO: Fix this.  It's pretty expensive.  There had been some code which
-    #      priority heaped this, but I don't think a fully working version
-    #      ever quite made it.
-    for t,trl,twl,txl,tto in tasks.itervalues():
-      if tto != None:
-        if tto <= now:
-          # Already expired
-          if expired is None: expired = []
-          expired.append(t)
-          if tto-now > 0.1: print("preexpired",tto,now,tto-now)
-          continue
-        tt = tto - now
-        if tt < timeout or timeout is None:
-          timeout = tt
-          timeoutTask = t
+    self._wake_expired(time.time())
 
-      if trl:
-        for i in trl: rl[i] = t
-      if twl:
-        for i in twl: wl[i] = t
-      if txl:
-        for i in txl: xl[i] = t
-
-    if expired:
-      for t in expired:
-        del tasks[t]
-        self._return(t, ([],[],[]))
-
-    if timeout is None: timeout = CYCLE_MAXIMUM
-    ro, wo, xo = self._select_func( rl.keys() + [self._pinger],
-                                    wl.keys(),
-                                    xl.keys(), timeout )
-
-    if len(ro) == 0 and len(wo) == 0 and len(xo) == 0 and timeoutTask != None:
-      # IO is idle - dispatch timers / release timeouts
-      del tasks[timeoutTask]
-      self._return(timeoutTask, ([],[],[]))
+    top = self._next_timer()
+    if top is None:
+      timeout = CYCLE_MAXIMUM
     else:
+      timeout = max(0, top[0] - time.time())
+
+    if self._fd_lists is None:
+      self._fd_lists = (self._rl.keys() + [self._pinger], self._wl.keys(),
+                        self._xl.keys())
+    rl,wl,xl = self._fd_lists
+    ro, wo, xo = self._select_func(rl, wl, xl, timeout)
+
+    if ro or wo or xo:
       # We have IO events
       if self._pinger in ro:
         self._pinger.pongAll()
         while not self._incoming.empty():
           stuff = self._incoming.get(True)
-          task = stuff[0]
-          assert task not in tasks
-          tasks[task] = stuff
+          self._add(stuff)
           self._incoming.task_done()
         if len(ro) == 1 and len(wo) == 0 and len(xo) == 0:
           # Just recycle
+          self._wake_expired(time.time())
           return
-        ro.remove(self._pinger)
+        ro = [i for i in ro if i is not self._pinger]
 
       # At least one thread is going to be resumed
       for i in ro:
-        task = rl[i]
+        task = self._rl[i]
         if task not in rets: rets[task] = ([],[],[])
         rets[task][0].append(i)
       for i in wo:
-        task = wl[i]
+        task = self._wl[i]
         if task not in rets: rets[task] = ([],[],[])
         rets[task][1].append(i)
       for i in xo:
-        task = xl[i]
+        task = self._xl[i]
         if task not in rets: rets[task] = ([],[],[])
         rets[task][2].append(i)
 
       for t,v in rets.iteritems():
-        del tasks[t]
-        self._return(t, v)
+        self._wake(t, v)
       rets.clear()
 
+    # Dispatch timers / release timeouts
+    self._wake_expired(time.time())
+
   def registerSelect (self, task, rlist = None, wlist = None, xlist = None,
                       timeout = None, timeIsAbsolute = False):
     if not timeIsAbsolute:
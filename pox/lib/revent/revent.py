@@ -165,6 +165,9 @@ class Event (object):
   def _invoke (self, handler, *args, **kw):
     return handler(self, *args, **kw)
 
+# Events which don't override _invoke() have their handlers called directly
+_Event_invoke = Event._invoke.im_func
+
 def handleEventException (source, event, args, kw, exc_info):
   """
   Called when an exception is raised by an event handler when the event
@@ -256,62 +259,66 @@ class EventMixin (object):
     Returns the event object, unless it was never created (because there
     were no listeners) in which case returns None.
     """
-    self._eventMixin_init()
+    try:
+      handlers = self._eventMixin_handlers
+    except AttributeError:
+      self._eventMixin_init()
+      handlers = self._eventMixin_handlers
 
-    classCall = False
     if isinstance(event, Event):
       eventType = event.__class__
-      classCall = True
       if event.source is None: event.source = self
-    elif issubclass(event, Event):
-      # Check for early-out
-      if event not in self._eventMixin_handlers:
-        return None
-      if len(self._eventMixin_handlers[event]) == 0:
-        return None
-
-      classCall = True
+      if (self._eventMixin_events is not True
+          and eventType not in self._eventMixin_events):
+        raise ReventError("Event %s not defined on object of type %s"
+                          % (eventType, type(self)))
+      handlers = handlers.get(eventType)
+      if not handlers: return event
+    else:
+      # Early-out before constructing the event if nobody is listening.
+      # addListener() has already checked that eventType is one we raise.
       eventType = event
+      handlers = handlers.get(eventType)
+      if not handlers: return None
       event = eventType(*args, **kw)
       args = ()
       kw = {}
       if event.source is None:
         event.source = self
     #print("raise",event,eventType)
-    if (self._eventMixin_events is not True
-        and eventType not in self._eventMixin_events):
-      raise ReventError("Event %s not defined on object of type %s"
-                        % (eventType, type(self)))
 
-    # Create a copy so that it can be modified freely during event
-    # processing.  It might make sense to change this.
-    handlers = self._eventMixin_handlers.get(eventType, [])
+    # handlers is a tuple which add/removeListener() replace rather than
+    # modify, so listeners can come and go freely during event processing.
+    direct = type(event)._invoke.im_func is _Event_invoke
     for (priority, handler, once, eid) in handlers:
-      if classCall:
-        rv = event._invoke(handler, *args, **kw)
-      else:
+      if direct:
         rv = handler(event, *args, **kw)
+      else:
+        rv = event._invoke(handler, *args, **kw)
       if once: self.removeListener(eid)
-      if rv is None: continue
-      if rv is False:
-        self.removeListener(eid)
-      if rv is True:
-        if classCall: event.halt = True
-        break
-      if type(rv) == tuple:
-        if len(rv) >= 2 and rv[1] == True:
-          self.removeListener(eid)
-        if len(rv) >= 1 and rv[0]:
-          if classCall: event.halt = True
-          break
-        if len(rv) == 0:
-          if classCall: event.halt = True
+      if rv is not None:
+        if rv is True:
+          event.halt = True
           break
-      #if classCall and hasattr(event, "halt") and event.halt:
-      if classCall and event.halt:
+        if rv is False:
+          self.removeListener(eid)
+        elif type(rv) is tuple:
+          if len(rv) >= 2 and rv[1] == True:
+            self.removeListener(eid)
+          if len(rv) == 0 or rv[0]:
+            event.halt = True
+            break
+      if event.halt:
         break
     return event
 
+  def hasListener (self, eventType):
+    """
+    Returns True if anything is listening for eventType
+    """
+    self._eventMixin_init()
+    return bool(self._eventMixin_handlers.get(eventType))
+
   def removeListeners (self, listeners):
     altered = False
     for l in listeners:
@@ -324,6 +331,18 @@ class EventMixin (object):
     """
     return sum((len(x) for x in self._eventMixin_handlers.itervalues()))
 
+  def _eventMixin_filter (self, eventType, field, value):
+    """
+    Removes handler entries for eventType whose given field equals value
+
+    Returns True if any were removed.
+    """
+    handlers = self._eventMixin_handlers[eventType]
+    new = tuple(x for x in handlers if x[field] != value)
+    if len(new) == len(handlers): return False
+    self._eventMixin_handlers[eventType] = new
+    return True
+
   def removeListener (self, handlerOrEID, eventType=None):
     """
     handlerOrEID : a reference to a handler object, an event ID (EID)
@@ -340,40 +359,20 @@ class EventMixin (object):
     if type(handler) == tuple:
       # It's a type/eid pair
       if eventType == None: eventType = handler[0]
-      handlers = self._eventMixin_handlers[eventType]
-      l = len(handlers)
-      self._eventMixin_handlers[eventType] = [x for x in handlers
-                                              if x[3] != handler[1]]
-      altered = altered or l != len(self._eventMixin_handlers[eventType])
+      altered = self._eventMixin_filter(eventType, 3, handler[1])
     elif type(handler) == int:
       # It's an EID
       if eventType == None:
-        for event in self._eventMixin_handlers:
-          handlers = self._eventMixin_handlers[event]
-          l = len(handlers)
-          self._eventMixin_handlers[event] = [x for x in handlers
-                                              if x[3] != handler]
-          altered = altered or l != len(self._eventMixin_handlers[event])
+        for event in self._eventMixin_handlers.keys():
+          if self._eventMixin_filter(event, 3, handler): altered = True
       else:
-        l = len(handlers)
-        handlers = self._eventMixin_handlers[eventType]
-        self._eventMixin_handlers[eventType] = [x for x in handlers
-                                                if x[3] != handler]
-        altered = altered or l != len(self._eventMixin_handlers[event])
+        altered = self._eventMixin_filter(eventType, 3, handler)
     else:
       if eventType == None:
-        for event in self._eventMixin_handlers:
-          handlers = self._eventMixin_handlers[event]
-          l = len(handlers)
-          self._eventMixin_handlers[event] = [x for x in handlers
-                                              if x[1] != handler]
-          altered = altered or l != len(self._eventMixin_handlers[event])
+        for event in self._eventMixin_handlers.keys():
+          if self._eventMixin_filter(event, 1, handler): altered = True
       else:
-        handlers = self._eventMixin_handlers[eventType]
-        l = len(handlers)
-        self._eventMixin_handlers[eventType] = [x for x in handlers
-                                                if x[1] != handler]
-        altered = altered or l != len(self._eventMixin_handlers[eventType])
+        altered = self._eventMixin_filter(eventType, 1, handler)
 
     return altered
 
@@ -431,23 +430,18 @@ class EventMixin (object):
       if fail:
         raise ReventError("Event %s not defined on object of type %s"
                           % (eventType, type(self)))
-    if eventType not in self._eventMixin_handlers:
-      # if no handlers are already registered, initialize
-      handlers = self._eventMixin_handlers[eventType] = []
-      self._eventMixin_handlers[eventType] = handlers
-    else:
-      handlers = self._eventMixin_handlers[eventType]
-
     eid = _generateEventID()
 
     if weak: handler = CallProxy(self, handler, (eventType, eid))
 
     entry = (priority, handler, once, eid)
 
-    handlers.append(entry)
+    handlers = self._eventMixin_handlers.get(eventType, ()) + (entry,)
     if priority is not None:
       # If priority is specified, sort the event handlers
-      handlers.sort(reverse = True, key = operator.itemgetter(0))
+      handlers = tuple(sorted(handlers, reverse = True,
+                              key = operator.itemgetter(0)))
+    self._eventMixin_handlers[eventType] = handlers
 
     return (eventType,eid)
 
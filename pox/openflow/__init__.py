@@ -37,6 +37,7 @@ from pox.lib.revent import *
 from pox.lib.util import dpidToStr
 import libopenflow_01 as of
 from pox.lib.packet.ethernet import ethernet
+from pox.lib.packet.fields import PacketFields
 
 
 class ConnectionHandshakeComplete (Event):
@@ -177,7 +178,11 @@ class PacketIn (Event):
 
   port (int) - number of port the packet came in on
   data (bytes) - raw packet data
+  fields (PacketFields) - common header fields, read straight from data
   parsed (packet subclasses) - pox.lib.packet's parsed version
+
+  Both fields and parsed are only built when first accessed.  If all you
+  need is the ethertype, addresses, or ports, fields is much cheaper.
   """
   def __init__ (self, connection, ofp):
     self.connection = connection
@@ -185,6 +190,7 @@ class PacketIn (Event):
     self.port = ofp.in_port
     self.data = ofp.data
     self._parsed = None
+    self._fields = None
     self.dpid = connection.dpid
 
   def parse (self):
@@ -192,6 +198,15 @@ class PacketIn (Event):
       self._parsed = ethernet(self.data)
     return self._parsed
 
+  @property
+  def fields (self):
+    """
+    The packet's header fields as a pox.lib.packet.fields.PacketFields
+    """
+    if self._fields is None:
+      self._fields = PacketFields(self.data)
+    return self._fields
+
   @property
   def parsed (self):
     """
@@ -0,0 +1,175 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tracks which switch ports share broadcast segments
+
+Discovery reports a 'broadcast' link between every pair of ports which
+hear each other's broadcast discovery packets, so the ports on a shared
+segment (a "cloud") are the connected groups of ports in the graph of
+broadcast links.  Rather than rebuilding that graph and enumerating its
+cliques on every link event, BroadcastSegments keeps the groups up to
+date as links come and go: an added link merges two segments (relabeling
+the smaller one), and a removed link only searches the segment it was in
+to see whether it split.
+
+  segments = BroadcastSegments()
+  ...
+  def _handle_LinkEvent (event):
+    if segments.link_event(event):
+      for ports in segments: ...
+
+Ports are (dpid, port_no) tuples.  When several components share an
+instance, only one should feed it; the others can compare its version
+with the one they last saw.
+"""
+
+
+class BroadcastSegments (object):
+  """
+  The sets of (dpid,port) ports connected by broadcast links
+  """
+  def __init__ (self):
+    self._links = {}   # port -> {port: set of directed Links between them}
+    self._root = {}    # port -> root port of its segment
+    self._members = {} # root port -> set of ports in the segment
+    self.version = 0   # Bumped whenever the segments change
+
+  def __len__ (self):
+    return len(self._members)
+
+  def __iter__ (self):
+    """
+    Iterates over the segments (sets of ports; don't modify them)
+    """
+    return self._members.itervalues()
+
+  def __contains__ (self, port):
+    return port in self._root
+
+  def segment_of (self, port):
+    """
+    Returns the set of ports sharing a segment with port (or None)
+    """
+    root = self._root.get(port)
+    if root is None: return None
+    return self._members[root]
+
+  def links_at (self, port):
+    """
+    Returns the broadcast links attached to a port
+    """
+    r = []
+    for links in self._links.get(port, {}).itervalues():
+      r.extend(links)
+    return r
+
+  def link_event (self, event):
+    """
+    Updates the segments for a discovery LinkEvent
+
+    Returns True if the segments changed.
+    """
+    link = event.link
+    if event.added:
+      if link.link_type != 'broadcast': return False
+      return self.add_link(link)
+    return self.remove_link(link)
+
+  def add_link (self, link):
+    """
+    Adds a broadcast link, returning True if segments merged or grew
+    """
+    a = (link.dpid1, link.port1)
+    b = (link.dpid2, link.port2)
+    if a == b: return False
+    links = self._links.setdefault(a, {}).get(b)
+    if links is None:
+      links = set()
+      self._links[a][b] = links
+      self._links.setdefault(b, {})[a] = links
+    if link in links: return False
+    links.add(link)
+    if len(links) > 1: return False # Other direction already connected them
+
+    ra = self._root.get(a)
+    rb = self._root.get(b)
+    if ra is None and rb is None:
+      self._root[a] = self._root[b] = a
+      self._members[a] = set([a, b])
+    elif rb is None:
+      self._root[b] = ra
+      self._members[ra].add(b)
+    elif ra is None:
+      self._root[a] = rb
+      self._members[rb].add(a)
+    elif ra == rb:
+      return False
+    else:
+      # Relabel the smaller segment
+      if len(self._members[ra]) < len(self._members[rb]):
+        ra,rb = rb,ra
+      moved = self._members.pop(rb)
+      for p in moved:
+        self._root[p] = ra
+      self._members[ra].update(moved)
+    self.version += 1
+    return True
+
+  def remove_link (self, link):
+    """
+    Removes a link, returning True if segments split or shrank
+    """
+    a = (link.dpid1, link.port1)
+    b = (link.dpid2, link.port2)
+    links = self._links.get(a, {}).get(b)
+    if not links or link not in links: return False
+    links.discard(link)
+    if links: return False # Still connected the other way
+    self._unlink(a, b)
+    self._unlink(b, a)
+
+    root = self._root[a]
+    members = self._members.pop(root)
+    for p in (a, b):
+      if p not in self._links:
+        members.discard(p)
+        del self._root[p]
+
+    # See whether the rest still hangs together
+    while members:
+      start = members.pop()
+      seen = set([start])
+      todo = [start]
+      while todo:
+        p = todo.pop()
+        for q in self._links[p]:
+          if q not in seen:
+            seen.add(q)
+            todo.append(q)
+      members -= seen
+      for p in seen:
+        self._root[p] = start
+      self._members[start] = seen
+    self.version += 1
+    return True
+
+  def _unlink (self, a, b):
+    adj = self._links[a]
+    del adj[b]
+    if not adj: del self._links[a]
+
+  def clear (self):
+    self._links.clear()
+    self._root.clear()
+    self._members.clear()
+    self.version += 1
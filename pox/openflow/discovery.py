@@ -32,8 +32,6 @@ import pox.lib.packet as pkt
 
 import struct
 import time
-from collections import namedtuple
-from random import shuffle, random
 
 
 log = core.getLogger()
@@ -42,13 +40,15 @@ log = core.getLogger()
 class LLDPAndBroadcastSender (object):
   """
   Sends out discovery packets
-  """
-
-  SendItem = namedtuple("LLDPSenderItem", ('dpid','port_num','packet'))
 
-  #NOTE: This class keeps the packets to send in a flat list, which makes
-  #      adding/removing them on switch join/leave or (especially) port
-  #      status changes relatively expensive. Could easily be improved.
+  Each cycle is divided into a fixed number of time slots, one per timer
+  tick, and every port is assigned to a slot when it's added.  Adding or
+  removing a port only touches its own slot, and on each tick every
+  switch with ports in that slot gets all of their (prepacked) discovery
+  packets in a single write.  If ports have come or gone, the slots are
+  repacked at the start of the next cycle so that they're evenly filled
+  and each switch's ports share as few slots as possible.
+  """
 
   # Maximum times to run the timer per second
   _sends_per_sec = 15
@@ -65,14 +65,14 @@ class LLDPAndBroadcastSender (object):
       consider the rest of the data to be valid.  We don't use this, but
       other LLDP agents might.  Can't be 0 (this means revoke).
     """
-    # Packets remaining to be sent in this cycle
-    self._this_cycle = []
-
-    # Packets we've already sent in this cycle
-    self._next_cycle = []
-
-    # Packets to send in a batch
-    self._send_chunk_size = 1
+    slots = max(1, int(send_cycle_time * self._sends_per_sec))
+    self._slots = [{} for _ in range(slots)] # [slot] -> {dpid:{port:data}}
+    self._slot_sizes = [0] * slots
+    self._where = {}   # (dpid,port) -> slot
+    self._by_dpid = {} # dpid -> set of ports
+    self._cursor = 0   # Slot new ports go into
+    self._tick = 0     # Slot to send next
+    self._dirty = False # Ports changed since the slots were packed
 
     self._timer = None
     self._ttl = ttl
@@ -102,65 +102,87 @@ class LLDPAndBroadcastSender (object):
     self.del_switch(event.dpid)
 
   def del_switch (self, dpid, set_timer = True):
-    self._this_cycle = [p for p in self._this_cycle if p.dpid != dpid]
-    self._next_cycle = [p for p in self._next_cycle if p.dpid != dpid]
+    for port_num in list(self._by_dpid.get(dpid, ())):
+      self._remove(dpid, port_num)
     if set_timer: self._set_timer()
 
   def del_port (self, dpid, port_num, set_timer = True):
     if port_num > of.OFPP_MAX: return
-    self._this_cycle = [p for p in self._this_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
-    self._next_cycle = [p for p in self._next_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
+    self._remove(dpid, port_num)
     if set_timer: self._set_timer()
 
   def add_port (self, dpid, port_num, port_addr, set_timer = True):
     if port_num > of.OFPP_MAX: return
-    self.del_port(dpid, port_num, set_timer = False)
-    self._next_cycle.append(LLDPAndBroadcastSender.SendItem(dpid, port_num,
-          self.create_packet_out(dpid, port_num, port_addr, 'lldp')))
-    self._next_cycle.append(LLDPAndBroadcastSender.SendItem(dpid, port_num,
-          self.create_packet_out(dpid, port_num, port_addr, 'broadcast')))
+    self._remove(dpid, port_num)
+    data = (self.create_packet_out(dpid, port_num, port_addr, 'lldp')
+            + self.create_packet_out(dpid, port_num, port_addr, 'broadcast'))
+
+    # Fill slots evenly, moving on once the current one has its share
+    slot = self._cursor
+    if self._slot_sizes[slot] > len(self._where) // len(self._slots):
+      slot = self._cursor = (slot + 1) % len(self._slots)
+    self._slots[slot].setdefault(dpid, {})[port_num] = data
+    self._slot_sizes[slot] += 1
+    self._where[(dpid,port_num)] = slot
+    self._by_dpid.setdefault(dpid, set()).add(port_num)
+    self._dirty = True
     if set_timer: self._set_timer()
 
-  def _set_timer (self):
-    if self._timer: self._timer.cancel()
-    self._timer = None
-    num_packets = len(self._this_cycle) + len(self._next_cycle)
-
-    if num_packets == 0: return
-
-    self._send_chunk_size = 1 # One at a time
-    interval = self._send_cycle_time / float(num_packets)
-    if interval < 1.0 / self._sends_per_sec:
-      # Would require too many sends per sec -- send more than one at once
-      interval = 1.0 / self._sends_per_sec
-      chunk = float(num_packets) / self._send_cycle_time / self._sends_per_sec
-      self._send_chunk_size = chunk
+  def _remove (self, dpid, port_num):
+    slot = self._where.pop((dpid,port_num), None)
+    if slot is None: return
+    ports = self._slots[slot][dpid]
+    del ports[port_num]
+    if not ports: del self._slots[slot][dpid]
+    self._slot_sizes[slot] -= 1
+    ports = self._by_dpid[dpid]
+    ports.discard(port_num)
+    if not ports: del self._by_dpid[dpid]
+    self._dirty = True
+
+  def _repack (self):
+    """
+    Refills the slots evenly, keeping each switch's ports together
+    """
+    self._dirty = False
+    old = self._slots
+    slots = self._slots = [{} for _ in old]
+    sizes = self._slot_sizes = [0] * len(slots)
+    where = self._where
+    share = -(-len(where) // len(slots)) # Rounded up
+    slot = 0
+    for dpid,ports in self._by_dpid.iteritems():
+      for port_num in ports:
+        if sizes[slot] >= share: slot += 1
+        slots[slot].setdefault(dpid, {})[port_num] = \
+            old[where[(dpid,port_num)]][dpid][port_num]
+        sizes[slot] += 1
+        where[(dpid,port_num)] = slot
+    self._cursor = slot
 
-    self._timer = Timer(interval,
-                        self._timer_handler, recurring=True)
+  def _set_timer (self):
+    """
+    Starts the timer if there's anything to send (or stops it if not)
+    """
+    if not self._where:
+      if self._timer: self._timer.cancel()
+      self._timer = None
+    elif self._timer is None:
+      interval = self._send_cycle_time / float(len(self._slots))
+      self._timer = Timer(interval, self._timer_handler, recurring=True)
 
   def _timer_handler (self):
     """
     Called by a timer to actually send packets.
 
-    Picks the first packet off this cycle's list, sends it, and then puts
-    it on the next-cycle list.  When this cycle's list is empty, starts
-    the next cycle.
+    Sends the packets for the ports in the next slot, one write per switch.
     """
-    num = int(self._send_chunk_size)
-    fpart = self._send_chunk_size - num
-    if random() < fpart: num += 1
-
-    for _ in range(num):
-      if len(self._this_cycle) == 0:
-        self._this_cycle = self._next_cycle
-        self._next_cycle = []
-        #shuffle(self._this_cycle)
-      item = self._this_cycle.pop(0)
-      self._next_cycle.append(item)
-      core.openflow.sendToDPID(item.dpid, item.packet)
+    if self._tick == 0 and self._dirty:
+      self._repack()
+    slot = self._slots[self._tick]
+    self._tick = (self._tick + 1) % len(self._slots)
+    for dpid,ports in slot.iteritems():
+      core.openflow.sendToDPID(dpid, b''.join(ports.itervalues()))
 
   def create_packet_out (self, dpid, port_num, port_addr,packet_type):
     """
@@ -239,6 +261,48 @@ class LLDPAndBroadcastSender (object):
 
 
 
+_tlv_header = struct.Struct("!H")
+_TTL_HEADER = (pkt.lldp.TTL_TLV << 9) | 2
+
+def _parse_probe (data):
+  """
+  Reads the sender's (dpid,port) straight from one of our own probes
+
+  Our probes (see LLDPAndBroadcastSender) are untagged and start with
+  chassis ID, port ID, TTL and system description TLVs, where the chassis
+  ID and the system description are both "dpid:<hex>" and the port ID is
+  the port number in decimal.  Returns None for anything else, which
+  should go through the full parser.
+  """
+  try:
+    if data[12:14] != b'\x88\xcc': return None
+    h = _tlv_header.unpack_from(data, 14)[0]
+    if h >> 9 != pkt.lldp.CHASSIS_ID_TLV: return None
+    if ord(data[16]) != pkt.chassis_id.SUB_LOCAL: return None
+    end = 16 + (h & 0x1ff)
+    chassis = data[17:end]
+    if not chassis.startswith('dpid:'): return None
+
+    h = _tlv_header.unpack_from(data, end)[0]
+    if h >> 9 != pkt.lldp.PORT_ID_TLV: return None
+    if ord(data[end+2]) != pkt.port_id.SUB_PORT: return None
+    start = end + 3
+    end = end + 2 + (h & 0x1ff)
+    port = data[start:end]
+    if not port.isdigit(): return None
+
+    if _tlv_header.unpack_from(data, end)[0] != _TTL_HEADER: return None
+    end += 4
+
+    h = _tlv_header.unpack_from(data, end)[0]
+    if h >> 9 != pkt.lldp.SYSTEM_DESC_TLV: return None
+    if data[end+2:end+2+(h & 0x1ff)] != chassis: return None
+
+    return int(chassis[5:], 16), int(port)
+  except (struct.error, IndexError, ValueError):
+    return None
+
+
 class LinkEvent (Event):
   """
   Link up/down event
@@ -297,6 +361,117 @@ class Link (LinkBase):
   def __hash__(self):
     return self.dpid1 + self.dpid2 + self.port1 + self.port2
 
+
+class LinkTable (dict):
+  """
+  A dict of Link -> timestamp, also indexed by port, switch, and type
+
+  The indexes are kept up to date by the dict's own methods, so questions
+  like "what's attached to this port?" don't need a scan of every link.
+  A link is indexed by the key object in the dict (re-setting an existing
+  link only updates its timestamp).
+  """
+  _empty = frozenset()
+
+  def __init__ (self, *args, **kw):
+    super(LinkTable, self).__init__()
+    self._at = {}      # (dpid,port) -> set of Links
+    self._on = {}      # dpid -> set of Links
+    self._by_type = {} # link_type -> set of Links
+    self.update(*args, **kw)
+
+  def __setitem__ (self, link, timestamp):
+    if link not in self:
+      self._index(link)
+    dict.__setitem__(self, link, timestamp)
+
+  def __delitem__ (self, link):
+    # Unindex the stored object (its type may differ from link's)
+    link = self.stored(link)
+    dict.__delitem__(self, link)
+    self._unindex(link)
+
+  def stored (self, link):
+    """
+    Returns the key object equal to link (which may be of another type)
+    """
+    for l in self._at.get((link.dpid1,link.port1), ()):
+      if l == link:
+        return l
+    return link
+
+  def _index (self, link):
+    for key,table in (((link.dpid1,link.port1), self._at),
+                      ((link.dpid2,link.port2), self._at),
+                      (link.dpid1, self._on), (link.dpid2, self._on),
+                      (link.link_type, self._by_type)):
+      links = table.get(key)
+      if links is None:
+        table[key] = set([link])
+      else:
+        links.add(link)
+
+  def _unindex (self, link):
+    for key,table in (((link.dpid1,link.port1), self._at),
+                      ((link.dpid2,link.port2), self._at),
+                      (link.dpid1, self._on), (link.dpid2, self._on),
+                      (link.link_type, self._by_type)):
+      links = table.get(key)
+      if links is None: continue
+      links.discard(link)
+      if not links: del table[key]
+
+  _missing = object()
+
+  def pop (self, link, default = _missing):
+    if link not in self:
+      if default is self._missing: raise KeyError(link)
+      return default
+    timestamp = self[link]
+    del self[link]
+    return timestamp
+
+  def popitem (self):
+    link,timestamp = dict.popitem(self)
+    self._unindex(link)
+    return link,timestamp
+
+  def setdefault (self, link, timestamp = None):
+    if link not in self:
+      self[link] = timestamp
+    return self[link]
+
+  def update (self, *args, **kw):
+    for link,timestamp in dict(*args, **kw).iteritems():
+      self[link] = timestamp
+
+  def clear (self):
+    dict.clear(self)
+    self._at.clear()
+    self._on.clear()
+    self._by_type.clear()
+
+  def copy (self):
+    return LinkTable(self)
+
+  def links_at (self, dpid, port):
+    """
+    Returns the set of links with an end at a port (don't modify it)
+    """
+    return self._at.get((dpid,port), self._empty)
+
+  def links_on (self, dpid):
+    """
+    Returns the set of links with an end on a switch (don't modify it)
+    """
+    return self._on.get(dpid, self._empty)
+
+  def links_of_type (self, link_type):
+    """
+    Returns the set of links of a type, e.g. 'lldp' (don't modify it)
+    """
+    return self._by_type.get(link_type, self._empty)
+
 class Discovery (EventMixin):
   """
   Component that attempts to discover network toplogy.
@@ -323,8 +498,20 @@ class Discovery (EventMixin):
     self._install_flow = install_flow
     if link_timeout: self._link_timeout = link_timeout
 
-    self.adjacency = {} # From Link to time.time() stamp
+    self.adjacency = LinkTable() # From Link to time.time() stamp
     self.link_attribute = {}
+
+    # Links by when they'll time out (see _expire_links())
+    self._expiry_wheel = {} # slot -> set of Links
+    self._expiry_slot = {}  # Link -> slot
+
+    # Expiry counters: links expired, links looked at, how overdue
+    # the latest expired link was in the last pass that expired any, and
+    # how long the last pass took
+    self.expired_links = 0
+    self.expiry_checks = 0
+    self.last_expiry_latency = None
+    self.last_expiry_duration = None
     self._sender = LLDPAndBroadcastSender(self.send_cycle_time)
 
     # Listen with a high priority (mostly so we get PacketIns early)
@@ -365,32 +552,75 @@ class Discovery (EventMixin):
 
   def _handle_openflow_ConnectionDown (self, event):
     # Delete all links on this switch
-    self._delete_links([link for link in self.adjacency
-                        if link.dpid1 == event.dpid
-                        or link.dpid2 == event.dpid])
+    self._delete_links(list(self.adjacency.links_on(event.dpid)))
 
   def _expire_links (self):
     """
     Remove apparently dead links
+
+    Links are kept in slots by the check period in which they'll time out
+    and are moved whenever they're heard from, so only the slots which are
+    due need looking at, and only links which are (nearly) dead are in
+    them.
     """
     now = time.time()
+    current = int(now // self._timeout_check_period)
+    expired = []
+    gone = []
+    latency = 0
+    for slot in sorted(s for s in self._expiry_wheel if s <= current):
+      for link in self._expiry_wheel[slot]:
+        self.expiry_checks += 1
+        timestamp = self.adjacency.get(link)
+        if timestamp is None:
+          gone.append(link) # Removed from adjacency behind our back
+        elif timestamp + self._link_timeout < now:
+          # The wheel may hold an old object whose type has since changed
+          expired.append(self.adjacency.stored(link))
+          latency = max(latency, now - timestamp - self._link_timeout)
+    for link in gone:
+      self._unslot(link, self._expiry_slot.pop(link))
 
-    expired = [link for link,timestamp in self.adjacency.iteritems()
-               if timestamp + self._link_timeout < now]
     if expired:
       for link in expired:
         log.info('link timeout: %s', link)
 
       self._delete_links(expired)
+      self.expired_links += len(expired)
+      self.last_expiry_latency = latency
+    self.last_expiry_duration = time.time() - now
+
+  def _refresh_link (self, link):
+    """
+    Marks a link as just heard from
+    """
+    now = time.time()
+    self.adjacency[link] = now
+    slot = int((now + self._link_timeout) // self._timeout_check_period)
+    old = self._expiry_slot.get(link)
+    if old == slot: return
+    if old is not None:
+      self._unslot(link, old)
+    self._expiry_slot[link] = slot
+    links = self._expiry_wheel.get(slot)
+    if links is None:
+      self._expiry_wheel[slot] = set([link])
+    else:
+      links.add(link)
+
+  def _unslot (self, link, slot):
+    links = self._expiry_wheel[slot]
+    links.discard(link)
+    if not links: del self._expiry_wheel[slot]
 
   def _handle_openflow_PacketIn (self, event):
     """
     Receive and process LLDP packets
     """
-    packet = event.parsed
+    fields = event.fields
 
-    if (packet.effective_ethertype != pkt.ethernet.LLDP_TYPE
-          or (packet.dst != pkt.ETHERNET.LLDP_MULTICAST and packet.dst != pkt.ETHERNET.ETHER_BROADCAST)):
+    if (fields.dl_type != pkt.ethernet.LLDP_TYPE
+          or (fields.dl_dst != pkt.ETHERNET.LLDP_MULTICAST and fields.dl_dst != pkt.ETHERNET.ETHER_BROADCAST)):
       if not self._eat_early_packets: return
       if not event.connection.connect_time: return
       enable_time = time.time() - self.send_cycle_time - 1
@@ -398,9 +628,8 @@ class Discovery (EventMixin):
         return EventHalt
       return
 
-    if (packet.effective_ethertype == pkt.ethernet.LLDP_TYPE
-        and packet.dst == pkt.ETHERNET.LLDP_MULTICAST or pkt.ETHERNET.ETHER_BROADCAST):
-      link_type = 'lldp' if packet.dst == pkt.ETHERNET.LLDP_MULTICAST else 'broadcast'
+    link_type = ('lldp' if fields.dl_dst == pkt.ETHERNET.LLDP_MULTICAST
+                 else 'broadcast')
 
     if self._explicit_drop:
       if event.ofp.buffer_id is not None:
@@ -410,23 +639,65 @@ class Discovery (EventMixin):
         msg.in_port = event.port
         event.connection.send(msg)
 
+    # Our own probes can be read straight from the bytes
+    originator = _parse_probe(event.data)
+    if originator is None:
+      originator = self._parse_lldp(event.parsed)
+      if originator is None: return EventHalt
+    originatorDPID,originatorPort = originator
+
+    if originatorDPID not in core.openflow.connections:
+      log.info('Received LLDP packet from unknown switch')
+      return EventHalt
+
+    if (event.dpid, event.port) == (originatorDPID, originatorPort):
+      log.warning("Port received its own LLDP packet; ignoring")
+      return EventHalt
+
+    link = Discovery.Link(originatorDPID, originatorPort, event.dpid, event.port,link_type, available=True)
+    if link not in self.adjacency:
+      self._refresh_link(link)
+      self.link_attribute[link] = link
+      log.info('link detected: %s and the type is %s', link, link.link_type)
+      self.raiseEventNoErrors(LinkEvent, True, link, event)
+    else:
+      if link.link_type is self.link_attribute[link].link_type:
+        self._refresh_link(link)
+      elif link.link_type is 'broadcast' and self.link_attribute[link].link_type is 'lldp':
+        pass
+      elif link.link_type is 'lldp' and self.link_attribute[link].link_type is 'broadcast':
+        self.link_attribute[link] = link
+        self.raiseEventNoErrors(LinkEvent,False,link)
+        del self.adjacency[link]
+        self._refresh_link(link)
+        self.raiseEventNoErrors(LinkEvent,True,link,event)
+      # Just update timestam
+    return EventHalt # Probably nobody else needs this event
+
+  @staticmethod
+  def _parse_lldp (packet):
+    """
+    Gets (dpid,port) of the sender of any LLDP packet we understand
+
+    Logs and returns None if it can't.
+    """
     lldph = packet.find(pkt.lldp)
 
     if lldph is None or not lldph.parsed:
       log.error("LLDP packet could not be parsed")
-      return EventHalt
+      return None
     if len(lldph.tlvs) < 3:
       log.error("LLDP packet without required three TLVs")
-      return EventHalt
+      return None
     if lldph.tlvs[0].tlv_type != pkt.lldp.CHASSIS_ID_TLV:
       log.error("LLDP packet TLV 1 not CHASSIS_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[1].tlv_type != pkt.lldp.PORT_ID_TLV:
       log.error("LLDP packet TLV 2 not PORT_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[2].tlv_type != pkt.lldp.TTL_TLV:
       log.error("LLDP packet TLV 3 not TTL")
-      return EventHalt
+      return None
 
     def lookInSysDesc ():
       r = None
@@ -472,16 +743,12 @@ class Discovery (EventMixin):
 
     if originatorDPID == None:
       log.warning("Couldn't find a DPID in the LLDP packet")
-      return EventHalt
-
-    if originatorDPID not in core.openflow.connections:
-      log.info('Received LLDP packet from unknown switch')
-      return EventHalt
+      return None
 
     # Get port number from port TLV
     if lldph.tlvs[1].subtype != pkt.port_id.SUB_PORT:
       log.warning("Thought we found a DPID, but packet didn't have a port")
-      return EventHalt
+      return None
     originatorPort = None
     if lldph.tlvs[1].id.isdigit():
       # We expect it to be a decimal value
@@ -495,57 +762,32 @@ class Discovery (EventMixin):
     if originatorPort is None:
       log.warning("Thought we found a DPID, but port number didn't " +
                   "make sense")
-      return EventHalt
-
-    if (event.dpid, event.port) == (originatorDPID, originatorPort):
-      log.warning("Port received its own LLDP packet; ignoring")
-      return EventHalt
+      return None
 
-    link = Discovery.Link(originatorDPID, originatorPort, event.dpid, event.port,link_type, available=True)
-    if link not in self.adjacency:
-      self.adjacency[link] = time.time()
-      self.link_attribute[link] = link
-      log.info('link detected: %s and the type is %s', link, link.link_type)
-      self.raiseEventNoErrors(LinkEvent, True, link, event)
-    else:
-      if link.link_type is self.link_attribute[link].link_type:
-        self.adjacency[link] = time.time()
-      elif link.link_type is 'broadcast' and self.link_attribute[link].link_type is 'lldp':
-        pass
-      elif link.link_type is 'lldp' and self.link_attribute[link].link_type is 'broadcast':
-        self.link_attribute[link] = link
-        self.raiseEventNoErrors(LinkEvent,False,link)
-        del self.adjacency[link]
-        self.adjacency[link] = time.time()
-        self.raiseEventNoErrors(LinkEvent,True,link,event)
-      # Just update timestam
-    return EventHalt # Probably nobody else needs this event
+    return originatorDPID,originatorPort
 
   def _delete_links (self, links):
     for link in links:
       self.raiseEventNoErrors(LinkEvent, False, link)
     for link in links:
       self.adjacency.pop(link, None)
+      slot = self._expiry_slot.pop(link, None)
+      if slot is not None:
+        self._unslot(link, slot)
 
   def is_edge_port (self, dpid, port):
     """
     Return True if given port does not connect to another switch
     """
-    for link in self.adjacency:
-      if link.dpid1 == dpid and link.port1 == port:
-        return False
-      if link.dpid2 == dpid and link.port2 == port:
-        return False
-    return True
+    return not self.adjacency.links_at(dpid, port)
 
   def _is_broadcast_port (self,dpid,port):
-
-    for link in self.adjacency:
-      if link.dpid1 == dpid and link.port1 == port and link.link_type =='broadcast':
-        return True
-      if link.dpid2 == dpid and link.port2 == port and link.link_type == 'broadcast':
+    for link in self.adjacency.links_at(dpid, port):
+      if link.link_type == 'broadcast':
         return True
     return False
+
+
 def launch (no_flow = False, explicit_drop = True, link_timeout = None,
             eat_early_packets = False):
   explicit_drop = str_to_bool(explicit_drop)
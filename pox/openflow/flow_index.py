@@ -0,0 +1,300 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An index of the flows a forwarding component has installed along paths
+
+Each flow (a match installed hop by hop along a path of switches) gets
+its own cookie, and the index maps every (dpid, out_port) a flow leaves
+a switch by to the flows using it.  When a link fails, flows_on_link()
+finds just the flows which used it, and reroute() works out the strict
+deletes and adds which move one onto a new path -- touching only the
+switches whose entries actually change.
+
+Hops are (switch, in_port, out_port) tuples, where a switch is anything
+with a dpid and a connection (as in l2_multi).  Each flow also carries an
+opaque route, which is whatever its owner needs to compute a new path.
+
+reroute_flows() does the whole job for a failed link, sending the
+changes through a PathInstaller.
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+import heapq
+import time
+
+log = core.getLogger()
+
+
+class IndexedFlow (object):
+  """
+  A flow installed along a path
+  """
+  __slots__ = ('cookie', 'match', 'route', 'hops', 'expires_at')
+
+  def __init__ (self, cookie, match, route, hops, expires_at):
+    self.cookie = cookie
+    self.match = match
+    self.route = route
+    self.hops = hops
+    self.expires_at = expires_at
+
+  def __repr__ (self):
+    return "<IndexedFlow %x %s hops>" % (self.cookie, len(self.hops))
+
+
+class FlowIndex (object):
+  """
+  Tracks installed flows by cookie and by the ports they use
+  """
+  def __init__ (self, idle_timeout = 0, hard_timeout = 0,
+                priority = of.OFP_DEFAULT_PRIORITY):
+    self.idle_timeout = idle_timeout
+    self.hard_timeout = hard_timeout
+    self.priority = priority
+    self._flows = {}   # cookie -> IndexedFlow
+    self._by_port = {} # (dpid, out_port) -> set of cookies
+    self._deadlines = [] # Heap of (expires_at, cookie)
+    self._next_cookie = 1
+    self.hop_count = 0 # Total entries across all the indexed flows
+
+  def __len__ (self):
+    return len(self._flows)
+
+  def __contains__ (self, flow):
+    return self._flows.get(flow.cookie) is flow
+
+  def get (self, cookie):
+    return self._flows.get(cookie)
+
+  def add (self, match, route, hops):
+    """
+    Indexes a flow which is about to be installed and returns it
+    """
+    cookie = self._next_cookie
+    self._next_cookie = (cookie + 1) & 0xffffFFFFffffFFFF or 1
+    expires_at = None
+    if self.hard_timeout:
+      expires_at = time.time() + self.hard_timeout
+      heapq.heappush(self._deadlines, (expires_at, cookie))
+    flow = IndexedFlow(cookie, match.clone(), route, list(hops), expires_at)
+    self._flows[cookie] = flow
+    self._index(flow)
+    return flow
+
+  def remove (self, flow):
+    if self._flows.get(flow.cookie) is not flow: return
+    del self._flows[flow.cookie]
+    self._unindex(flow)
+
+  def clear (self):
+    """
+    Forgets every flow (e.g., after deleting them all from the switches)
+    """
+    self._flows.clear()
+    self._by_port.clear()
+    del self._deadlines[:]
+    self.hop_count = 0
+
+  def _index (self, flow):
+    by_port = self._by_port
+    for sw,in_port,out_port in flow.hops:
+      key = (sw.dpid, out_port)
+      cookies = by_port.get(key)
+      if cookies is None:
+        by_port[key] = set([flow.cookie])
+      else:
+        cookies.add(flow.cookie)
+    self.hop_count += len(flow.hops)
+
+  def _unindex (self, flow):
+    by_port = self._by_port
+    for sw,in_port,out_port in flow.hops:
+      key = (sw.dpid, out_port)
+      cookies = by_port.get(key)
+      if cookies is None: continue
+      cookies.discard(flow.cookie)
+      if not cookies: del by_port[key]
+    self.hop_count -= len(flow.hops)
+
+  def flows_on_port (self, dpid, port):
+    """
+    Returns the live flows which leave switch dpid by port
+    """
+    cookies = self._by_port.get((dpid, port))
+    if not cookies: return []
+    now = time.time()
+    r = []
+    for cookie in list(cookies):
+      flow = self._flows[cookie]
+      if flow.expires_at is not None and flow.expires_at <= now:
+        self.remove(flow)
+      else:
+        r.append(flow)
+    return r
+
+  def flows_on_link (self, dpid1, port1, dpid2, port2):
+    """
+    Returns the live flows which cross a link in either direction
+    """
+    r = self.flows_on_port(dpid1, port1)
+    other = self.flows_on_port(dpid2, port2)
+    if other:
+      seen = set(f.cookie for f in r)
+      r.extend(f for f in other if f.cookie not in seen)
+    return r
+
+  def flow_removed (self, event):
+    """
+    Forgets a flow's hop when its entry times out
+
+    event is a FlowRemoved.  The rest of the flow's entries may still be
+    installed, so the flow is only forgotten once the last of them is
+    gone.  Explicit deletes (including our own strict deletes when
+    rerouting) are ignored.  Returns the flow if it was forgotten.
+    """
+    if not event.timeout: return None
+    flow = self._flows.get(event.ofp.cookie)
+    if flow is None: return None
+    in_port = event.ofp.match.in_port
+    for hop in flow.hops:
+      if hop[0].dpid == event.dpid and hop[1] == in_port:
+        break
+    else:
+      return None
+    flow.hops.remove(hop)
+    self.hop_count -= 1
+    key = (event.dpid, hop[2])
+    if not any((h[0].dpid, h[2]) == key for h in flow.hops):
+      cookies = self._by_port.get(key)
+      if cookies is not None:
+        cookies.discard(flow.cookie)
+        if not cookies: del self._by_port[key]
+    if flow.hops: return None
+    del self._flows[flow.cookie]
+    return flow
+
+  def expire (self, now = None):
+    """
+    Forgets flows whose hard timeout has passed
+    """
+    if now is None: now = time.time()
+    deadlines = self._deadlines
+    count = 0
+    while deadlines and deadlines[0][0] <= now:
+      expires_at,cookie = heapq.heappop(deadlines)
+      flow = self._flows.get(cookie)
+      if flow is not None and flow.expires_at == expires_at:
+        self.remove(flow)
+        count += 1
+    return count
+
+  def flow_mod (self, flow, in_port, out_port = None):
+    """
+    Returns a flow_mod for one hop of a flow
+
+    With no out_port, it's a strict delete of the hop's entry.
+    """
+    msg = of.ofp_flow_mod()
+    msg.match = flow.match.clone()
+    msg.match.in_port = in_port
+    msg.priority = self.priority
+    msg.cookie = flow.cookie
+    if out_port is None:
+      msg.command = of.OFPFC_DELETE_STRICT
+    else:
+      msg.idle_timeout = self.idle_timeout
+      msg.hard_timeout = self.hard_timeout
+      msg.flags = of.OFPFF_SEND_FLOW_REM
+      msg.actions.append(of.ofp_action_output(port = out_port))
+    return msg
+
+  def reroute (self, flow, hops):
+    """
+    Moves a flow onto new hops (which may be empty)
+
+    Returns a list of (switch, flow_mod) which get the switches from the
+    old hops to the new ones: adds for new or changed hops, and strict
+    deletes for entries the new hops don't overwrite.  Hops which are the
+    same in both get nothing.
+    """
+    if self._flows.get(flow.cookie) is not flow: return []
+    hops = list(hops)
+    old = set(flow.hops)
+    new_entries = set((sw,in_port) for sw,in_port,out_port in hops)
+    r = []
+    for hop in flow.hops:
+      if (hop[0],hop[1]) not in new_entries:
+        r.append((hop[0], self.flow_mod(flow, hop[1])))
+    for hop in hops:
+      if hop not in old:
+        r.append((hop[0], self.flow_mod(flow, hop[1], hop[2])))
+
+    self._unindex(flow)
+    flow.hops = hops
+    if hops:
+      self._index(flow)
+    else:
+      del self._flows[flow.cookie]
+    return r
+
+
+def reroute_flows (app, index, installer, link, get_hops, switch_count):
+  """
+  Moves the flows which used a failed link onto new paths
+
+  Only the affected flows are touched, and only on the switches whose
+  entries change.  Each of those switches gets its flow_mods followed by
+  a single barrier.
+
+  get_hops is called with each flow and returns its new hops (or None if
+  it can't be routed any more, in which case it's removed).  switch_count
+  is how many switches a full clear would send a delete to.  The reroute
+  counters and last_convergence_time of app are updated.  Returns the
+  number of flows moved.
+  """
+  flows = index.flows_on_link(link.dpid1, link.port1,
+                              link.dpid2, link.port2)
+  if not flows: return 0
+
+  # Clearing everything would take a delete per switch and then
+  # reinstalling every flow
+  full_clear = index.hop_count + switch_count
+
+  batches = {}
+  for flow in flows:
+    hops = get_hops(flow) or ()
+    for sw,msg in index.reroute(flow, hops):
+      batches.setdefault(sw, []).append(msg)
+
+  sent = sum(len(msgs) for sw,msgs in batches.iteritems()
+             if sw.connection is not None)
+  txn = installer.begin(_rerouted, app, len(flows), sent, full_clear)
+  for sw,msgs in batches.iteritems():
+    if sw.connection is None: continue
+    for msg in msgs:
+      txn.send(sw.connection, msg)
+  txn.commit()
+
+  app.reroutes += 1
+  app.rerouted_flows += len(flows)
+  app.reroute_flow_mods += sent
+  app.reroute_full_clear_flow_mods += full_clear
+  return len(flows)
+
+
+def _rerouted (txn, app, flows, flow_mods, full_clear):
+  app.last_convergence_time = txn.elapsed
+  log.info("Rerouted %i flows with %i flow_mods in %.1f ms "
+           "(clearing all flows would have taken %i)", flows,
+           flow_mods, txn.elapsed * 1000, full_clear)
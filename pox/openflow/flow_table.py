@@ -21,6 +21,7 @@ from pox.lib.revent import *
 
 import time
 import math
+import bisect
 
 # FlowTable Entries:
 #   match - ofp_match (13-tuple)
@@ -97,7 +98,7 @@ class TableEntry (object):
     if strict:
       return port_matches and self.match == match and self.priority == priority
     else:
-      return port_matches and match.matches_with_wildcards(self.match)
+      return port_matches and match.covers(self.match)
 
   def touch_packet (self, byte_count, now=None):
     """
@@ -192,12 +193,37 @@ class FlowTableModification (Event):
     self.reason = reason
 
 
+class _FlowTuple (object):
+  """
+  The entries of a FlowTable which all have the same match mask
+
+  buckets maps the matched bits of an entry's match (its compiled value
+  ANDed with the mask) to a list of entries with those bits, best first.
+  order_keys is the sorted list of every entry's order key, so
+  order_keys[0] belongs to the best entry in the tuple.
+  """
+  __slots__ = ('mask', 'buckets', 'order_keys')
+
+  def __init__ (self, mask):
+    self.mask = mask
+    self.buckets = {}
+    self.order_keys = []
+
+
 class FlowTable (EventMixin):
   """
   General model of a flow table.
 
   Maintains an ordered list of flow entries, and finds matching entries for
   packets and other entries. Supports expiration of flows.
+
+  Besides the ordered list, entries are indexed with a tuple space: one
+  hash table per distinct match mask (see ofp_match.compiled), keyed by
+  the bits the mask selects.  A packet lookup probes one hash table per
+  mask, best tuples first, and stops as soon as no remaining tuple can
+  beat what it has found.  Strict lookups go straight to the right
+  bucket, and non-strict ones skip every tuple which can't contain a
+  match.
   """
   _eventMixin_events = set([FlowTableModification])
 
@@ -205,8 +231,23 @@ class FlowTable (EventMixin):
     EventMixin.__init__(self)
 
     # Table is a list of TableEntry sorted by descending effective_priority.
+    # Within a priority, newer entries come first.
     self._table = []
 
+    # Order keys for _table (ascending, so in the same order as _table).
+    # An order key is (-effective_priority, -sequence number).
+    self._order_keys = []
+    self._next_seq = 0
+
+    # entry -> (mask, bucket key, order key) as of when it was added
+    self._index = {}
+
+    # mask -> _FlowTuple
+    self._tuples = {}
+
+    # _FlowTuples sorted by their best entry; None when it needs rebuilding
+    self._probe_order = None
+
   def _dirty (self):
     """
     Call when table changes
@@ -220,40 +261,119 @@ class FlowTable (EventMixin):
   def __len__ (self):
     return len(self._table)
 
+  def __contains__ (self, entry):
+    return entry in self._index
+
+  def _get_probe_order (self):
+    if self._probe_order is None:
+      t = [(ft.order_keys[0], ft) for ft in self._tuples.itervalues()]
+      t.sort(key = lambda x: x[0])
+      self._probe_order = t
+    return self._probe_order
+
+  def _sorted (self, entries):
+    """
+    Returns the given entries in table order
+    """
+    index = self._index
+    return sorted(entries, key = lambda e: index[e][2])
+
   def add_entry (self, entry):
     assert isinstance(entry, TableEntry)
-
-    #self._table.append(entry)
-    #self._table.sort(key=lambda e: e.effective_priority, reverse=True)
-
-    # Use binary search to insert at correct place
-    # This is faster even for modest table sizes, and way, way faster
-    # as the tables grow larger.
-    priority = entry.effective_priority
-    table = self._table
-    low = 0
-    high = len(table)
-    while low < high:
-        middle = (low + high) // 2
-        if priority >= table[middle].effective_priority:
-          high = middle
-          continue
-        low = middle + 1
-    table.insert(low, entry)
+    if entry in self._index:
+      raise ValueError("entry is already in the table")
+
+    self._next_seq += 1
+    order_key = (-entry.effective_priority, -self._next_seq)
+    _,value,mask = entry.match.compiled
+    key = value & mask
+
+    # Newer entries sort before older ones of the same priority, so the
+    # insertion point is just like the old binary search.
+    i = bisect.bisect(self._order_keys, order_key)
+    self._order_keys.insert(i, order_key)
+    self._table.insert(i, entry)
+
+    ft = self._tuples.get(mask)
+    if ft is None:
+      ft = self._tuples[mask] = _FlowTuple(mask)
+    bucket = ft.buckets.setdefault(key, [])
+    keys = [self._index[e][2] for e in bucket]
+    bucket.insert(bisect.bisect(keys, order_key), entry)
+    bisect.insort(ft.order_keys, order_key)
+    self._index[entry] = (mask, key, order_key)
+    self._probe_order = None
 
     self._dirty()
 
     self.raiseEvent(FlowTableModification(added=[entry]))
 
+  def _unindex (self, entry):
+    """
+    Removes an entry from the table and its index
+    """
+    try:
+      mask,key,order_key = self._index.pop(entry)
+    except KeyError:
+      raise ValueError("entry is not in the table")
+
+    i = bisect.bisect_left(self._order_keys, order_key)
+    del self._order_keys[i]
+    del self._table[i]
+
+    ft = self._tuples[mask]
+    bucket = ft.buckets[key]
+    bucket.remove(entry)
+    if not bucket:
+      del ft.buckets[key]
+    del ft.order_keys[bisect.bisect_left(ft.order_keys, order_key)]
+    if not ft.order_keys:
+      del self._tuples[mask]
+    self._probe_order = None
+
   def remove_entry (self, entry, reason=None):
     assert isinstance(entry, TableEntry)
-    self._table.remove(entry)
+    self._unindex(entry)
     self._dirty()
     self.raiseEvent(FlowTableModification(removed=[entry], reason=reason))
 
+  def _candidates_covered_by (self, match):
+    """
+    Yields the entries whose matches the given match may cover
+    """
+    _,value,mask = match.compiled
+    for ft_mask,ft in self._tuples.iteritems():
+      if mask & ft_mask != mask: continue # Entries are wider than match
+      if ft_mask == mask:
+        bucket = ft.buckets.get(value & mask)
+        if bucket:
+          for e in bucket: yield e
+      else:
+        for key,bucket in ft.buckets.iteritems():
+          if (key ^ value) & mask == 0:
+            for e in bucket: yield e
+
+  def _candidates_covering (self, match):
+    """
+    Yields the entries whose matches may cover the given match
+    """
+    _,value,mask = match.compiled
+    for ft_mask,ft in self._tuples.iteritems():
+      if mask & ft_mask != ft_mask: continue # Entries are narrower
+      bucket = ft.buckets.get(value & ft_mask)
+      if bucket:
+        for e in bucket: yield e
+
   def matching_entries (self, match, priority=0, strict=False, out_port=None):
-    entry_match = lambda e: e.is_matched_by(match, priority, strict, out_port)
-    return [ entry for entry in self._table if entry_match(entry) ]
+    if strict:
+      _,value,mask = match.compiled
+      ft = self._tuples.get(mask)
+      if ft is None: return []
+      candidates = ft.buckets.get(value & mask, ())
+    else:
+      candidates = self._candidates_covered_by(match)
+    return self._sorted(e for e in candidates
+                        if e.is_matched_by(match, priority, strict, out_port))
 
   def flow_stats (self, match, out_port=None, now=None):
     mc_es = self.matching_entries(match=match, strict=False, out_port=out_port)
@@ -273,22 +393,10 @@ class FlowTable (EventMixin):
                                flow_count=flow_count)
 
   def _remove_specific_entries (self, flows, reason=None):
-    #for entry in flows:
-    #  self._table.remove(entry)
-    #self._table = [entry for entry in self._table if entry not in flows]
     if not flows: return
     self._dirty()
-    remove_flows = set(flows)
-    i = 0
-    while i < len(self._table):
-      entry = self._table[i]
-      if entry in remove_flows:
-        del self._table[i]
-        remove_flows.remove(entry)
-        if not remove_flows: break
-      else:
-        i += 1
-    assert len(remove_flows) == 0
+    for entry in flows:
+      self._unindex(entry)
     self.raiseEvent(FlowTableModification(removed=flows, reason=reason))
 
   def remove_expired_entries (self, now=None):
@@ -317,37 +425,47 @@ class FlowTable (EventMixin):
     on the given in_port, or None if no matching entry is found.
     """
     packet_match = ofp_match.from_packet(packet, in_port, spec_frags = True)
+    _,value,mask = packet_match.compiled
 
-    for entry in self._table:
-      if entry.match.matches_with_wildcards(packet_match,
-                                            consider_other_wildcards=False):
-        return entry
-
-    return None
+    best = None
+    best_key = None
+    for order_key,ft in self._get_probe_order():
+      if best_key is not None and order_key > best_key:
+        # Nothing in this or any later tuple can beat what we have
+        break
+      ft_mask = ft.mask
+      if mask & ft_mask != ft_mask: continue # Needs fields packet lacks
+      bucket = ft.buckets.get(value & ft_mask)
+      if bucket:
+        entry = bucket[0]
+        entry_key = self._index[entry][2]
+        if best_key is None or entry_key < best_key:
+          best = entry
+          best_key = entry_key
+
+    return best
 
   def check_for_overlapping_entry (self, in_entry):
     """
     Tests if the input entry overlaps with another entry in this table.
 
-    Returns true if there is an overlap, false otherwise. Since the table is
-    sorted, there is only a need to check a certain portion of it.
+    Returns true if there is an overlap, false otherwise.  Only entries
+    with the same effective priority which cover or are covered by the
+    input entry are considered, and those are found through the tuple
+    space rather than by walking the table.
     """
-    #NOTE: Assumes that entries are sorted by decreasing effective_priority
     #NOTE: Ambiguous whether matching should be based on effective_priority
     #      or the regular priority.  Doing it based on effective_priority
     #      since that's what actually affects packet matching.
-    #NOTE: We could improve performance by doing a binary search to find the
-    #      right priority entries.
 
     priority = in_entry.effective_priority
+    match = in_entry.match
 
-    for e in self._table:
-      if e.effective_priority < priority:
-        break
-      elif e.effective_priority > priority:
-        continue
-      else:
-        if e.is_matched_by(in_entry.match) or in_entry.is_matched_by(e.match):
-          return True
+    for e in self._candidates_covered_by(match):
+      if e.effective_priority == priority and e.is_matched_by(match):
+        return True
+    for e in self._candidates_covering(match):
+      if e.effective_priority == priority and in_entry.is_matched_by(e.match):
+        return True
 
     return False
@@ -103,10 +103,22 @@ def _read (data, offset, length):
                         % (length, len(data)-offset))
   return (offset+length, data[offset:offset+length])
 
+# Compiled struct.Structs, keyed by format string.  Everything which goes
+# through _unpack() (and _struct()) shares these, so each format is only
+# ever parsed once.
+_structs = {}
+
+def _struct (fmt):
+  s = _structs.get(fmt)
+  if s is None:
+    s = _structs[fmt] = struct.Struct(fmt)
+  return s
+
 def _unpack (fmt, data, offset):
-  size = struct.calcsize(fmt)
+  s = _structs.get(fmt) or _struct(fmt)
+  size = s.size
   if (len(data)-offset) < size: raise UnderrunError()
-  return (offset+size, struct.unpack_from(fmt, data, offset))
+  return (offset+size, s.unpack_from(data, offset))
 
 def _skip (data, offset, num):
   offset += num
@@ -134,6 +146,14 @@ def _readip (data, offset, networkOrder = True):
   (offset, d) = _read(data, offset, 4)
   return (offset, IPAddr(d, networkOrder = networkOrder))
 
+# Codecs for the fixed parts of the most common messages
+_header_struct = _struct("!BBHL")
+_match_pack_struct = _struct("!LH6s6sHBxHBBxxLLHH")
+_flow_mod_struct = _struct("!QHHHHLHH")
+_packet_out_struct = _struct("!LHH")
+_packet_in_struct = _struct("!LHHBx")
+_action_output_struct = _struct("!HHHH")
+
 # ----------------------------------------------------------------------
 
 
@@ -171,6 +191,7 @@ class ofp_base (object):
   attribute to your minimum length.
   """
   __metaclass__ = _ofp_meta
+  __slots__ = ()
 
   def _assert (self):
     r = self._validate()
@@ -197,6 +218,20 @@ class ofp_base (object):
     assert (r-offset) == length, o
     return (r, o)
 
+  def pack_into (self, buf, offset=0):
+    """
+    Packs wire format into a caller-supplied writable buffer
+
+    buf is something like a bytearray which must have room for len(self)
+    bytes starting at offset.  Returns the offset just past what was
+    written.  Classes which can write their fields directly override this;
+    the default just copies the result of pack().
+    """
+    packed = self.pack()
+    end = offset + len(packed)
+    buf[offset:end] = packed
+    return end
+
   def clone (self):
     # Works for any packable+unpackable ofp_base subclass.
     # Can override if you have a better implementation
@@ -543,6 +578,9 @@ NO_BUFFER = 4294967295
 #1. Openflow Header
 class ofp_header (ofp_base):
   _MIN_LENGTH = 8
+  # header_type is a class attribute set by the message decorator
+  __slots__ = ('version', '_xid')
+
   def __init__ (self, **kw):
     self.version = OFP_VERSION
     #self.header_type = None # Set via class decorator
@@ -569,19 +607,27 @@ class ofp_header (ofp_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!BBHL", self.version, self.header_type,
+    return _header_struct.pack(self.version, self.header_type,
         len(self), self.xid)
-    return packed
+
+  def _pack_header_into (self, buf, offset, length):
+    _header_struct.pack_into(buf, offset, self.version, self.header_type,
+        length, self.xid)
+    return offset + 8
 
   def unpack (self, raw, offset=0):
     offset,length = self._unpack_header(raw, offset)
     return offset,length
 
   def _unpack_header (self, raw, offset):
-    offset,(self.version, self.header_type, length, self.xid) = \
-        _unpack("!BBHL", raw, offset)
-    return offset,length
+    if len(raw) - offset < 8: raise UnderrunError()
+    (self.version, header_type, length, self._xid) = \
+        _header_struct.unpack_from(raw, offset)
+    if header_type != getattr(self, 'header_type', None):
+      # Message classes get header_type from their decorator (and the
+      # ones with __slots__ can't have it set), so only write it if needed.
+      self.header_type = header_type
+    return offset+8,length
 
   def __eq__ (self, other):
     if type(self) != type(other): return False
@@ -631,6 +677,7 @@ class ofp_action_base (ofp_base):
   However, ofp_action_header as the spec defines it is not super
   useful for us, as it has the padding in it.
   """
+  __slots__ = ()
   type = None
 
   @classmethod
@@ -924,6 +971,14 @@ class ofp_queue_prop_min_rate (ofp_base):
 class ofp_match (ofp_base):
   adjust_wildcards = True # Set to true to "fix" outgoing wildcards
 
+  # The "real" values of the fields in ofp_match_data live in the
+  # underscored slots; see __getattr__/__setattr__.  Matches keep a
+  # __dict__ too, since applications hang their own attributes off them.
+  __slots__ = ('_locked', '_compiled', 'wildcards', '_in_port', '_dl_src',
+               '_dl_dst', '_dl_vlan', '_dl_vlan_pcp', '_dl_type', '_nw_tos',
+               '_nw_proto', '_nw_src', '_nw_dst', '_tp_src', '_tp_dst',
+               '__dict__')
+
   @classmethod
   def from_packet (cls, packet, in_port = None, spec_frags = False):
     """
@@ -1019,6 +1074,7 @@ class ofp_match (ofp_base):
 
   def __init__ (self, **kw):
     self._locked = False
+    self._compiled = None
 
     for k,v in ofp_match_data.iteritems():
       setattr(self, '_' + k, v[0])
@@ -1098,7 +1154,7 @@ class ofp_match (ofp_base):
     return (ip, b)
 
   def __setattr__ (self, name, value):
-    if name == '_locked':
+    if name == '_locked' or name == '_compiled':
       super(ofp_match,self).__setattr__(name, value)
       return
 
@@ -1106,7 +1162,10 @@ class ofp_match (ofp_base):
       raise AttributeError('match object is locked')
 
     if name not in ofp_match_data:
-      self.__dict__[name] = value
+      object.__setattr__(self, name, value)
+      # Every change ends up here (field setters set the underscored
+      # value and/or wildcards), so this is where the cache is dropped.
+      object.__setattr__(self, '_compiled', None)
       return
 
     if name == 'nw_dst' or name == 'nw_src':
@@ -1132,9 +1191,90 @@ class ofp_match (ofp_base):
       if name == 'nw_dst' or name == 'nw_src':
         # Special handling
         return getattr(self, 'get_' + name)()[0]
-      return self.__dict__['_' + name]
+      return object.__getattribute__(self, '_' + name)
     raise AttributeError("attribute not found: "+name)
 
+  def __getstate__ (self):
+    state = dict(self.__dict__)
+    for k in self.__slots__:
+      if k != '_compiled' and k != '__dict__':
+        state[k] = object.__getattribute__(self, k)
+    return state
+
+  def __setstate__ (self, state):
+    # Bypass __setattr__ so that the lock doesn't get in the way
+    object.__setattr__(self, '_compiled', None)
+    for k,v in state.iteritems():
+      object.__setattr__(self, k, v)
+
+  @property
+  def compiled (self):
+    """
+    Compact integer form of this match: (wildcards, value, mask)
+
+    value has all the fields packed into a single integer (see
+    _match_layout), with wildcarded fields zeroed.  mask has a one for
+    every bit of value which is actually matched, so it also reflects the
+    nw_src/nw_dst prefix lengths.  Note that value keeps whole nw_src and
+    nw_dst addresses even when only a prefix is matched, just like the
+    nw_src/nw_dst attributes do.
+
+    This is computed on first use and cached until the match changes.
+    """
+    c = self._compiled
+    if c is None:
+      c = self._compile()
+      object.__setattr__(self, '_compiled', c)
+    return c
+
+  def _compile (self):
+    wildcards = self.wildcards
+    value = 0
+    mask = 0
+    for name,shift,width,wc_bit in _match_layout:
+      if wildcards & wc_bit: continue
+      v = object.__getattribute__(self, '_' + name)
+      if width == 48:
+        if isinstance(v, EthAddr):
+          v = v.toRaw()
+        elif type(v) is not bytes or len(v) != 6:
+          v = EthAddr(v).toRaw()
+        hi,lo = _eth_int_struct.unpack(v)
+        v = (hi << 32) | lo
+      elif v is None:
+        v = 0
+      elif type(v) not in (int, long):
+        v = v.toUnsigned()
+      value |= v << shift
+      mask |= ((1 << width) - 1) << shift
+
+    for name,shift,get in (('nw_src', _NW_SRC_SHIFT, self.get_nw_src),
+                           ('nw_dst', _NW_DST_SHIFT, self.get_nw_dst)):
+      ip,bits = get()
+      if ip is None: continue
+      if type(ip) not in (int, long):
+        ip = IPAddr(ip).toUnsigned()
+      value |= (ip & 0xffFFffFF) << shift
+      mask |= ((0xffFFffFF << (32 - bits)) & 0xffFFffFF) << shift
+
+    return (wildcards, value, mask)
+
+  def covers (self, other):
+    """
+    True if every packet matching other also matches this
+    """
+    w,v,m = self.compiled
+    ow,ov,om = other.compiled
+    return (m & om) == m and ((v ^ ov) & m) == 0
+
+  def overlaps (self, other):
+    """
+    True if there could be a packet which matches both this and other
+    """
+    w,v,m = self.compiled
+    ow,ov,om = other.compiled
+    return ((v ^ ov) & m & om) == 0
+
   def _validate (self):
     # TODO
     return None
@@ -1162,54 +1302,56 @@ class ofp_match (ofp_base):
 
     return True # Always; we don't actually want an assertion error
 
-  def pack (self, flow_mod=False):
+  def _pack_values (self, flow_mod):
+    """
+    Returns the values to pack with _match_pack_struct
+    """
     assert self._assert()
 
-    packed = b""
     if self.adjust_wildcards and flow_mod:
       wc = self._wire_wildcards(self.wildcards)
       assert self._prereq_warning()
     else:
       wc = self.wildcards
-    packed += struct.pack("!LH", wc, self.in_port or 0)
-    if self.dl_src is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_src) is bytes:
-      packed += self.dl_src
-    else:
-      packed += self.dl_src.toRaw()
-    if self.dl_dst is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_dst) is bytes:
-      packed += self.dl_dst
-    else:
-      packed += self.dl_dst.toRaw()
-
-    def check_ip(val):
-      return (val or 0) if self.dl_type == 0x0800 else 0
-    def check_ip_or_arp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           or self.dl_type == 0x0806 else 0
-    def check_tp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           and self.nw_proto in (1,6,17) else 0
-
-    packed += struct.pack("!HB", self.dl_vlan or 0, self.dl_vlan_pcp or 0)
-    packed += _PAD # Hardcode padding
-    packed += struct.pack("!HBB", self.dl_type or 0,
-        check_ip(self.nw_tos), check_ip_or_arp(self.nw_proto))
-    packed += _PAD2 # Hardcode padding
+
+    def raw_eth (addr):
+      if addr is None: return EMPTY_ETH.toRaw()
+      if type(addr) is bytes: return addr
+      return addr.toRaw()
+
+    dl_type = self.dl_type
+    is_ip = dl_type == 0x0800
+    is_ip_or_arp = is_ip or dl_type == 0x0806
+    nw_proto = self.nw_proto
+    is_tp = is_ip and nw_proto in (1,6,17)
+
     def fix (addr):
       if addr is None: return 0
       if type(addr) is int: return addr & 0xffFFffFF
       if type(addr) is long: return addr & 0xffFFffFF
       return addr.toUnsigned()
 
-    packed += struct.pack("!LLHH", check_ip_or_arp(fix(self.nw_src)),
-        check_ip_or_arp(fix(self.nw_dst)),
-        check_tp(self.tp_src), check_tp(self.tp_dst))
+    if is_ip_or_arp:
+      nw_src = fix(self.nw_src)
+      nw_dst = fix(self.nw_dst)
+    else:
+      nw_src = nw_dst = 0
+
+    return (wc, self.in_port or 0, raw_eth(self.dl_src),
+            raw_eth(self.dl_dst), self.dl_vlan or 0,
+            self.dl_vlan_pcp or 0, dl_type or 0,
+            (self.nw_tos or 0) if is_ip else 0,
+            (nw_proto or 0) if is_ip_or_arp else 0,
+            nw_src, nw_dst,
+            (self.tp_src or 0) if is_tp else 0,
+            (self.tp_dst or 0) if is_tp else 0)
 
-    return packed
+  def pack (self, flow_mod=False):
+    return _match_pack_struct.pack(*self._pack_values(flow_mod))
+
+  def pack_into (self, buf, offset=0, flow_mod=False):
+    _match_pack_struct.pack_into(buf, offset, *self._pack_values(flow_mod))
+    return offset + 40
 
   def _normalize_wildcards (self, wildcards):
     """
@@ -1328,18 +1470,14 @@ class ofp_match (ofp_base):
 
   def unpack (self, raw, offset=0, flow_mod=False):
     _offset = offset
-    offset,(wildcards, self._in_port) = _unpack("!LH",raw, offset)
-    offset,self._dl_src = _readether(raw, offset)
-    offset,self._dl_dst = _readether(raw, offset)
-    offset,(self._dl_vlan, self._dl_vlan_pcp) = \
-        _unpack("!HB", raw, offset)
-    offset = _skip(raw, offset, 1)
-    offset,(self._dl_type, self._nw_tos, self._nw_proto) = \
-        _unpack("!HBB", raw, offset)
-    offset = _skip(raw, offset, 2)
-    offset,self._nw_src = _readip(raw, offset)
-    offset,self._nw_dst = _readip(raw, offset)
-    offset,(self._tp_src, self._tp_dst) = _unpack("!HH", raw, offset)
+    offset,(wildcards, self._in_port, dl_src, dl_dst, self._dl_vlan,
+            self._dl_vlan_pcp, self._dl_type, self._nw_tos, self._nw_proto,
+            nw_src, nw_dst, self._tp_src, self._tp_dst) = \
+        _unpack("!LH6s6sHBxHBBxx4s4sHH", raw, offset)
+    self._dl_src = EthAddr(dl_src)
+    self._dl_dst = EthAddr(dl_dst)
+    self._nw_src = IPAddr(nw_src)
+    self._nw_dst = IPAddr(nw_dst)
 
     # Only unwire wildcards for flow_mod
     self.wildcards = self._normalize_wildcards(
@@ -1360,17 +1498,8 @@ class ofp_match (ofp_base):
     the match object.
     """
 
-    h = self.wildcards
-    for f in ofp_match_data:
-      v = getattr(self, f)
-      if type(v) is int:
-        h ^= v
-      elif type(v) is long:
-        h ^= v
-      else:
-        h ^= hash(v)
-
-    return int(h & 0x7fFFffFF)
+    c = self.compiled
+    return hash((c[0], c[1])) & 0x7fFFffFF
 
   def __hash__ (self):
     self._locked = True
@@ -1380,76 +1509,23 @@ class ofp_match (ofp_base):
     """
     Test whether /this/ match completely encompasses the other match.
 
-    if consider_other_wildcards, then the *other* match must also have
-    no more wildcards than we do (it must be no wider than we are)
+    The *other* match must also have no more wildcards than we do (it
+    must be no wider than we are).  A field we match on can't be decided
+    by a match that wildcards it, so this holds whether or not
+    consider_other_wildcards is set; the argument is kept for
+    compatibility.
 
     Important for non-strict modify flow_mods etc.
     """
     assert assert_type("other", other, ofp_match, none_ok=False)
 
-    # shortcut for equal matches
-    if self == other: return True
-
-    if consider_other_wildcards:
-      # Check that other doesn't have more wildcards than we do -- it
-      # must be narrower (or equal) to us.
-      self_bits  = self.wildcards&~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)
-      other_bits = other.wildcards&~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)
-      if (self_bits | other_bits) != self_bits: return False
-
-    def match_fail (mine, others):
-      if mine is None: return False # Wildcarded
-      return mine != others
-
-    if match_fail(self.in_port, other.in_port): return False
-    if match_fail(self.dl_vlan, other.dl_vlan): return False
-    if match_fail(self.dl_src, other.dl_src): return False
-    if match_fail(self.dl_dst, other.dl_dst): return False
-    if match_fail(self.dl_type, other.dl_type): return False
-    if match_fail(self.nw_proto, other.nw_proto): return False
-    if match_fail(self.tp_src, other.tp_src): return False
-    if match_fail(self.tp_dst, other.tp_dst): return False
-    if match_fail(self.dl_vlan_pcp, other.dl_vlan_pcp): return False
-    if match_fail(self.nw_tos, other.nw_tos): return False
-
-    #FIXME: The two ??? checks below look like they compare other
-    #       wildcards always -- even when consider_other_wildcards=False.
-    #       Is this intentional?  (I think it might be subtly wrong and
-    #       we actually may need to mask off some bits and do the
-    #       inNetwork check or something...)
-
-    self_nw_src = self.get_nw_src()
-    if self_nw_src[0] is not None:
-      other_nw_src = other.get_nw_src()
-      if self_nw_src[1] > other_nw_src[1]: return False #???
-      if not IPAddr(other_nw_src[0]).inNetwork(
-            (self_nw_src[0], self_nw_src[1])): return False
-
-    self_nw_dst = self.get_nw_dst()
-    if self_nw_dst[0] is not None:
-      other_nw_dst = other.get_nw_dst()
-      if self_nw_dst[1] > other_nw_dst[1]: return False #???
-      if not IPAddr(other_nw_dst[0]).inNetwork(
-            (self_nw_dst[0], self_nw_dst[1])): return False
-
-    return True
+    return self.covers(other)
 
   def __eq__ (self, other):
     if type(self) != type(other): return False
-    if self.wildcards != other.wildcards: return False
-    if self.in_port != other.in_port: return False
-    if self.dl_src != other.dl_src: return False
-    if self.dl_dst != other.dl_dst: return False
-    if self.dl_vlan != other.dl_vlan: return False
-    if self.dl_vlan_pcp != other.dl_vlan_pcp: return False
-    if self.dl_type != other.dl_type: return False
-    if self.nw_tos != other.nw_tos: return False
-    if self.nw_proto != other.nw_proto: return False
-    if self.nw_src != other.nw_src: return False
-    if self.nw_dst != other.nw_dst: return False
-    if self.tp_src != other.tp_src: return False
-    if self.tp_dst != other.tp_dst: return False
-    return True
+    c = self.compiled
+    oc = other.compiled
+    return c[0] == oc[0] and c[1] == oc[1]
 
   def __str__ (self):
     return self.__class__.__name__ + "\n  " + self.show('  ').strip()
@@ -1546,6 +1622,8 @@ class ofp_action_generic (ofp_action_base):
 
 @openflow_action('OFPAT_OUTPUT', 0)
 class ofp_action_output (ofp_action_base):
+  __slots__ = ('port', 'max_len')
+
   def __init__ (self, **kw):
     self.port = None # Purposely bad -- require specification
     self.max_len = 0xffFF
@@ -1558,15 +1636,23 @@ class ofp_action_output (ofp_action_base):
 
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHHH", self.type, len(self), self.port,
-                          self.max_len)
-    return packed
+    return _action_output_struct.pack(self.type, 8, self.port, self.max_len)
+
+  def pack_into (self, buf, offset=0):
+    if self.port != OFPP_CONTROLLER:
+      self.max_len = 0
+
+    assert self._assert()
+
+    _action_output_struct.pack_into(buf, offset, self.type, 8, self.port,
+                                    self.max_len)
+    return offset + 8
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length, self.port, self.max_len) = \
+    offset,(type, length, self.port, self.max_len) = \
         _unpack("!HHHH", raw, offset)
+    assert type == self.type
     assert offset - _offset == len(self)
     return offset
 
@@ -2243,6 +2329,10 @@ class ofp_set_config (ofp_header): # uses ofp_switch_config
 @openflow_c_message("OFPT_FLOW_MOD", 14)
 class ofp_flow_mod (ofp_header):
   _MIN_LENGTH = 72
+  __slots__ = ('match', 'cookie', 'command', 'idle_timeout', 'hard_timeout',
+               'priority', '_buffer_id', 'out_port', 'flags', 'actions',
+               'data')
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
     if 'match' in kw:
@@ -2314,20 +2404,36 @@ class ofp_flow_mod (ofp_header):
       buffer_id = NO_BUFFER
 
     assert self._assert()
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += self.match.pack(flow_mod=True)
-    packed += struct.pack("!QHHHHLHH", self.cookie, self.command,
-                          self.idle_timeout, self.hard_timeout,
-                          self.priority, buffer_id, self.out_port,
-                          self.flags)
+    packed = [ofp_header.pack(self),
+              self.match.pack(flow_mod=True),
+              _flow_mod_struct.pack(self.cookie, self.command,
+                                    self.idle_timeout, self.hard_timeout,
+                                    self.priority, buffer_id, self.out_port,
+                                    self.flags)]
     for i in self.actions:
-      packed += i.pack()
+      packed.append(i.pack())
 
     if po:
-      packed += ofp_barrier_request().pack()
-      packed += po.pack()
-    return packed
+      packed.append(ofp_barrier_request().pack())
+      packed.append(po.pack())
+    return b"".join(packed)
+
+  def pack_into (self, buf, offset=0):
+    if self.data:
+      # May turn into several messages; let pack() sort it out
+      return ofp_header.pack_into(self, buf, offset)
+
+    assert self._assert()
+    offset = self._pack_header_into(buf, offset, len(self))
+    offset = self.match.pack_into(buf, offset, flow_mod=True)
+    _flow_mod_struct.pack_into(buf, offset, self.cookie, self.command,
+                               self.idle_timeout, self.hard_timeout,
+                               self.priority, self._buffer_id, self.out_port,
+                               self.flags)
+    offset += 24
+    for i in self.actions:
+      offset = i.pack_into(buf, offset)
+    return offset
 
   def unpack (self, raw, offset=0):
     offset,length = self._unpack_header(raw, offset)
@@ -3530,6 +3636,8 @@ class ofp_generic_stats_body (ofp_stats_body_base):
 @openflow_c_message("OFPT_PACKET_OUT", 13)
 class ofp_packet_out (ofp_header):
   _MIN_LENGTH = 16
+  __slots__ = ('_buffer_id', 'in_port', 'actions', '_data')
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
     self._buffer_id = NO_BUFFER
@@ -3595,13 +3703,34 @@ class ofp_packet_out (ofp_header):
 
     if self.data is not None:
       return b''.join((ofp_header.pack(self),
-        struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
+        _packet_out_struct.pack(self._buffer_id, self.in_port, actions_len),
         actions, self.data))
     else:
       return b''.join((ofp_header.pack(self),
-      struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
+      _packet_out_struct.pack(self._buffer_id, self.in_port, actions_len),
       actions))
 
+  def pack_into (self, buf, offset=0):
+    assert self._assert()
+
+    actions_len = 0
+    for i in self.actions:
+      actions_len += len(i)
+    data = self._data
+    length = 16 + actions_len + len(data)
+
+    offset = self._pack_header_into(buf, offset, length)
+    _packet_out_struct.pack_into(buf, offset, self._buffer_id, self.in_port,
+                                 actions_len)
+    offset += 8
+    for i in self.actions:
+      offset = i.pack_into(buf, offset)
+    if data:
+      end = offset + len(data)
+      buf[offset:end] = data
+      offset = end
+    return offset
+
   def unpack (self, raw, offset=0):
     _offset = offset
     offset,length = self._unpack_header(raw, offset)
@@ -3722,6 +3851,8 @@ class ofp_barrier_request (ofp_header):
 @openflow_s_message("OFPT_PACKET_IN", 10)
 class ofp_packet_in (ofp_header):
   _MIN_LENGTH = 18
+  __slots__ = ('in_port', '_buffer_id', 'reason', '_data', '_total_len')
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
 
@@ -3775,13 +3906,11 @@ class ofp_packet_in (ofp_header):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += struct.pack("!LHHBB", self._buffer_id, self.total_len,
-                          self.in_port, self.reason, 0)
-    packed += self.data
     #TODO: Padding?  See __len__
-    return packed
+    return b"".join((ofp_header.pack(self),
+                     _packet_in_struct.pack(self._buffer_id, self.total_len,
+                                            self.in_port, self.reason),
+                     self.data))
 
   @property
   def is_complete (self):
@@ -3790,9 +3919,9 @@ class ofp_packet_in (ofp_header):
 
   def unpack (self, raw, offset=0):
     offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self._total_len, self.in_port, self.reason,
-            pad) = _unpack("!LHHBB", raw, offset)
-    offset,self.data = _read(raw, offset, length-18)
+    offset,(self._buffer_id, self._total_len, self.in_port, self.reason) = \
+        _unpack("!LHHBx", raw, offset)
+    offset,self._data = _read(raw, offset, length-18)
     assert length == len(self)
     return offset,length
 
@@ -4495,3 +4624,22 @@ ofp_match_data = {
   'tp_src' : (0, OFPFW_TP_SRC),
   'tp_dst' : (0, OFPFW_TP_DST),
 }
+
+# Where each field lives in ofp_match.compiled's value/mask, as
+# (name, shift, width, wildcard bit).  nw_src and nw_dst are handled
+# separately since they can be prefixes.
+_NW_DST_SHIFT = 32
+_NW_SRC_SHIFT = 64
+_match_layout = (
+  ('tp_dst',        0, 16, OFPFW_TP_DST),
+  ('tp_src',       16, 16, OFPFW_TP_SRC),
+  ('nw_proto',     96,  8, OFPFW_NW_PROTO),
+  ('nw_tos',      104,  8, OFPFW_NW_TOS),
+  ('dl_type',     112, 16, OFPFW_DL_TYPE),
+  ('dl_vlan_pcp', 128,  8, OFPFW_DL_VLAN_PCP),
+  ('dl_vlan',     136, 16, OFPFW_DL_VLAN),
+  ('dl_dst',      152, 48, OFPFW_DL_DST),
+  ('dl_src',      200, 48, OFPFW_DL_SRC),
+  ('in_port',     248, 16, OFPFW_IN_PORT),
+)
+_eth_int_struct = _struct("!HL")
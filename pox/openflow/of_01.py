@@ -23,6 +23,7 @@ any other component references it during initialization.
 from pox.core import core
 import pox
 import pox.lib.util
+from pox.lib.util import str_to_bool
 from pox.lib.addresses import EthAddr
 from pox.lib.revent.revent import EventMixin
 import datetime
@@ -36,12 +37,17 @@ log = core.getLogger()
 
 import socket
 import select
+import struct
+from collections import deque
 
 # List where the index is an OpenFlow message type (OFPT_xxx), and
 # the values are unpack functions that unpack the wire format of that
 # type into a message object.
 unpackers = make_type_to_unpacker_table()
 
+# Decodes the version, type, and length fields of an OpenFlow header
+_header_struct = struct.Struct("!BBH")
+
 try:
   PIPE_BUF = select.PIPE_BUF
 except:
@@ -59,6 +65,10 @@ import threading
 import os
 import sys
 from errno import EAGAIN, ECONNRESET, EADDRINUSE, EADDRNOTAVAIL, EMFILE
+from errno import EWOULDBLOCK, EPIPE
+
+# Set to the ssl module by OpenFlow_01_Task if SSL is used
+ssl = None
 
 
 import traceback
@@ -387,113 +397,6 @@ statsHandlerMap = {
 }
 
 
-# Deferred sending should be unusual, so don't worry too much about
-# efficiency
-class DeferredSender (threading.Thread):
-  """
-  Class that handles sending when a socket write didn't complete
-  """
-  def __init__ (self):
-    threading.Thread.__init__(self)
-    core.addListeners(self)
-    self._dataForConnection = {}
-    self._lock = threading.RLock()
-    self._waker = pox.lib.util.makePinger()
-    self.sending = False
-
-    self.start()
-
-  def _handle_GoingDownEvent (self, event):
-    self._waker.ping()
-
-  def _sliceup (self, data):
-    """
-    Takes an array of data bytes, and slices into elements of
-    PIPE_BUF bytes each
-    """
-    out = []
-    while len(data) > PIPE_BUF:
-      out.append(data[0:PIPE_BUF])
-      data = data[PIPE_BUF:]
-    if len(data) > 0:
-      out.append(data)
-    return out
-
-  def send (self, con, data):
-    with self._lock:
-      self.sending = True
-
-      data = self._sliceup(data)
-
-      if con not in self._dataForConnection:
-        self._dataForConnection[con] = data
-      else:
-        self._dataForConnection[con].extend(data)
-
-      self._waker.ping()
-
-  def kill (self, con):
-    with self._lock:
-      try:
-        del self._dataForConnection[con]
-      except:
-        pass
-
-      self._waker.ping()
-
-  def run (self):
-    while core.running:
-
-      with self._lock:
-        cons = self._dataForConnection.keys()
-
-      rlist, wlist, elist = select.select([self._waker], cons, cons, 5)
-      if not core.running: break
-
-      with self._lock:
-        if len(rlist) > 0:
-          self._waker.pongAll()
-
-        for con in elist:
-          try:
-            del self._dataForConnection[con]
-          except:
-            pass
-
-        for con in wlist:
-          try:
-            alldata = self._dataForConnection[con]
-            while len(alldata):
-              data = alldata[0]
-              try:
-                l = con.sock.send(data)
-                if l != len(data):
-                  alldata[0] = data[l:]
-                  break
-                del alldata[0]
-              except socket.error as (errno, strerror):
-                if errno != EAGAIN:
-                  con.msg("DeferredSender/Socket error: " + strerror)
-                  con.disconnect()
-                  del self._dataForConnection[con]
-                break
-              except:
-                con.msg("Unknown error doing deferred sending")
-                break
-            if len(alldata) == 0:
-              try:
-                del self._dataForConnection[con]
-                if len(self._dataForConnection) == 0:
-                  self.sending = False
-                  break
-              except:
-                pass
-          except:
-            try:
-              del self._dataForConnection[con]
-            except:
-              pass
-
 class DummyOFNexus (object):
   def raiseEventNoErrors (self, event, *args, **kw):
     log.warning("%s raised on dummy OpenFlow nexus" % event)
@@ -723,6 +626,23 @@ class Connection (EventMixin):
   # Globally unique identifier for the Connection instance
   ID = 0
 
+  # Maximum number of bytes to try to read from the socket at once, and
+  # the initial size of the receive buffer (which grows if needed).
+  # These can be set with of_01's launch().
+  read_size = 4096
+  buffer_size = 16384
+
+  # Whether to greet the switch with a HELLO as soon as we're created
+  send_hello = True
+
+  # Output queue limits (in bytes).  When more than high_water bytes are
+  # waiting to be written to the switch, we stop reading from it until the
+  # queue drains below low_water.  At most max_send bytes are coalesced
+  # into a single send call.
+  high_water = 4 * 1024 * 1024
+  low_water = 1024 * 1024
+  max_send = 256 * 1024
+
   _aborted_connections = 0
 
   def msg (self, m):
@@ -741,7 +661,21 @@ class Connection (EventMixin):
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
-    self.buf = b''
+
+    # Output queue of data waiting to be written to the switch
+    self._out = deque()
+    self._out_bytes = 0
+    self.send_queue_peak = 0 # Largest the output queue has been (bytes)
+    self.congested = False # Output queue is over high water?
+
+    # Receive buffer.  Bytes between _rstart and _rend have been received
+    # but not yet processed (i.e., they're part of an incomplete message).
+    self._rbuf = bytearray(max(self.buffer_size, self.read_size * 2))
+    self._rview = memoryview(self._rbuf)
+    self._rstart = 0
+    self._rend = 0
+    self._recv_into = getattr(sock, 'recv_into', None)
+
     Connection.ID += 1
     self.ID = Connection.ID
 
@@ -760,7 +694,8 @@ class Connection (EventMixin):
     self.connect_time = None
     self.idle_time = time.time()
 
-    self.send(of.ofp_hello())
+    if self.send_hello:
+      self.send(of.ofp_hello())
 
     self.original_ports = PortCollection()
     self.ports = PortCollection()
@@ -824,11 +759,11 @@ class Connection (EventMixin):
         self.ofnexus.raiseEventNoErrors(ConnectionDown, self)
         self.raiseEventNoErrors(ConnectionDown, self)
 
-    try:
-      #deferredSender.kill(self)
-      pass
-    except:
-      pass
+    with connectionWriter.lock:
+      self._out.clear()
+      self._out_bytes = 0
+      self.congested = False
+      connectionWriter.forget(self)
     try:
       self.sock.shutdown(socket.SHUT_RDWR)
     except:
@@ -839,12 +774,23 @@ class Connection (EventMixin):
     except:
       pass
 
+  @property
+  def send_queue_depth (self):
+    """
+    The number of bytes waiting to be written to the switch
+    """
+    return self._out_bytes
+
   def send (self, data):
     """
     Send data to the switch.
 
     Data should probably either be raw bytes in OpenFlow wire format, or
     an OpenFlow controller-to-switch message object from libopenflow.
+
+    The data is queued, and everything queued for a switch is written
+    together when the connection is flushed (see ConnectionWriter).  This
+    may be called from any thread.
     """
     if self.disconnected: return
     if type(data) is not bytes:
@@ -854,65 +800,174 @@ class Connection (EventMixin):
       assert isinstance(data, of.ofp_header)
       data = data.pack()
 
-    if deferredSender.sending:
-      log.debug("deferred sender is sending!")
-      deferredSender.send(self, data)
-      return
-    try:
-      l = self.sock.send(data)
-      if l != len(data):
-        self.msg("Didn't send complete buffer.")
-        data = data[l:]
-        deferredSender.send(self, data)
-    except socket.error as (errno, strerror):
-      if errno == EAGAIN:
-        self.msg("Out of send buffer space.  " +
-                 "Consider increasing SO_SNDBUF.")
-        deferredSender.send(self, data)
+    with connectionWriter.lock:
+      self._out.append(data)
+      self._out_bytes += len(data)
+      if self._out_bytes > self.send_queue_peak:
+        self.send_queue_peak = self._out_bytes
+      if self._out_bytes > self.high_water and not self.congested:
+        self.congested = True
+        self.msg("Output queue over high water mark (%s bytes)"
+                 % (self._out_bytes,))
+      connectionWriter.mark(self)
+
+  def flush (self):
+    """
+    Writes as much queued data as the socket will take
+
+    Returns True if the queue is now empty.  Only ConnectionWriter calls
+    this, with its lock held.
+    """
+    out = self._out
+    while out:
+      if len(out) == 1:
+        data = out.popleft()
       else:
-        self.msg("Socket error: " + strerror)
-        self.disconnect(defer_event=True)
+        # Coalesce up to max_send bytes into a single write (Python 2
+        # sockets have no sendmsg(), so this is a join rather than writev)
+        chunks = []
+        size = 0
+        while out and size < self.max_send:
+          c = out.popleft()
+          chunks.append(c)
+          size += len(c)
+        data = b''.join(chunks)
+
+      try:
+        l = self.sock.send(data)
+      except socket.error as e:
+        l = 0
+        if e.errno not in (EAGAIN, EWOULDBLOCK):
+          if not (ssl and isinstance(e, ssl.SSLError)
+                  and e.errno == ssl.SSL_ERROR_WANT_WRITE):
+            self.msg("Socket error: " + str(e))
+            out.clear()
+            self._out_bytes = 0
+            self.disconnect(defer_event=True)
+            return True
+
+      self._out_bytes -= l
+      if l != len(data):
+        out.appendleft(data[l:])
+        break
+
+    if self.congested and self._out_bytes <= self.low_water:
+      self.congested = False
+      self.msg("Output queue below low water mark")
+
+    return not out
+
+  def _make_rbuf_room (self):
+    """
+    Ensures there are at least read_size free bytes at the end of _rbuf
+
+    Only the unprocessed tail gets moved, so this is cheap in the usual
+    case where we have consumed whole messages and there's little left.
+    """
+    rbuf = self._rbuf
+    pending = self._rend - self._rstart
+    if pending + self.read_size > len(rbuf):
+      # Need a bigger buffer
+      size = len(rbuf)
+      while pending + self.read_size > size: size *= 2
+      rbuf = bytearray(size)
+      rbuf[0:pending] = self._rview[self._rstart:self._rend]
+      self._rbuf = rbuf
+      self._rview = memoryview(rbuf)
+    elif pending:
+      rbuf[0:pending] = self._rview[self._rstart:self._rend]
+    self._rstart = 0
+    self._rend = pending
 
   def read (self):
     """
     Read data from this connection.  Generally this is just called by the
     main OpenFlow loop below.
 
+    Data is received directly into a preallocated buffer.  Each batch of
+    complete messages is then copied out once and unpacked in place, so
+    bytes are never copied again just because more data arrived after them.
+
+    Returns False if the connection should be closed, and None if the
+    socket is nonblocking and had nothing for us.
+
     Note: This function will block if data is not available.
     """
+    if self._rend + self.read_size > len(self._rbuf):
+      self._make_rbuf_room()
+
     try:
-      d = self.sock.recv(2048)
+      if self._recv_into is not None:
+        l = self._recv_into(self._rview[self._rend:], self.read_size)
+      else:
+        d = self.sock.recv(self.read_size)
+        l = len(d)
+        self._rbuf[self._rend:self._rend+l] = d
+    except socket.error as e:
+      if e.errno in (EAGAIN, EWOULDBLOCK):
+        return None
+      if ssl and isinstance(e, ssl.SSLError):
+        if e.errno == ssl.SSL_ERROR_WANT_READ:
+          return None
+      return False
     except:
       return False
-    if len(d) == 0:
+    if l == 0:
       return False
-    self.buf += d
-    buf_len = len(self.buf)
-
-
-    offset = 0
-    while buf_len - offset >= 8: # 8 bytes is minimum OF message size
-      # We pull the first four bytes of the OpenFlow header off by hand
-      # (using ord) to find the version/length/type so that we can
-      # correctly call libopenflow to unpack it.
-
-      ofp_type = ord(self.buf[offset+1])
-
-      if ord(self.buf[offset]) != of.OFP_VERSION:
+    self._rend += l
+
+    # Find the end of the last complete message in the buffer.  We pull
+    # the version/type/length out of each OpenFlow header by hand so that
+    # we can check them before calling libopenflow to unpack anything.
+    rbuf = self._rbuf
+    start = self._rstart
+    end = self._rend
+    offset = start
+    while end - offset >= 8: # 8 bytes is minimum OF message size
+      version,ofp_type,msg_length = _header_struct.unpack_from(rbuf, offset)
+
+      if version != of.OFP_VERSION:
         if ofp_type == of.OFPT_HELLO:
           # We let this through and hope the other side switches down.
           pass
         else:
           log.warning("Bad OpenFlow version (0x%02x) on connection %s"
-                      % (ord(self.buf[offset]), self))
+                      % (version, self))
           return False # Throw connection away
 
-      msg_length = ord(self.buf[offset+2]) << 8 | ord(self.buf[offset+3])
+      if msg_length < 8:
+        log.warning("Bad OpenFlow message length (%s) on connection %s"
+                    % (msg_length, self))
+        return False
+
+      if end - offset < msg_length: break
+      offset += msg_length
+
+    if offset == start:
+      return True
 
-      if buf_len - offset < msg_length: break
+    self._rstart = offset
+    if offset == end:
+      # Everything consumed; start over at the front of the buffer
+      self._rstart = self._rend = 0
 
-      new_offset,msg = self.unpackers[ofp_type](self.buf, offset)
-      assert new_offset - offset == msg_length
+    data = self._rview[start:offset].tobytes()
+    data_len = offset - start
+    offset = 0
+    while offset < data_len:
+      _,ofp_type,msg_length = _header_struct.unpack_from(data, offset)
+      try:
+        new_offset,msg = self.unpackers[ofp_type](data, offset)
+      except Exception as e:
+        log.warning("Couldn't unpack message of type %s on connection %s "
+                    "(%s)", ofp_type, self, e)
+        return False # Throw connection away
+      if new_offset - offset != msg_length:
+        # The rest of the stream can't be trusted to be framed right
+        log.warning("Message of type %s on connection %s unpacked to %s "
+                    "bytes but its header says %s", ofp_type, self,
+                    new_offset - offset, msg_length)
+        return False # Throw connection away
       offset = new_offset
 
       try:
@@ -924,9 +979,6 @@ class Connection (EventMixin):
                       ("\n" + str(self) + " ").join(str(msg).split('\n')))
         continue
 
-    if offset != 0:
-      self.buf = self.buf[offset:]
-
     return True
 
   def _incoming_stats_reply (self, ofp):
@@ -990,6 +1042,104 @@ def wrap_socket (new_sock):
 
 from pox.lib.recoco.recoco import *
 
+class ConnectionWriter (Task):
+  """
+  Writes data queued by Connection.send() to switches
+
+  Connection.send() just queues data and marks the connection dirty.  Dirty
+  connections are flushed all at once -- either by an OpenFlow listener
+  task at the end of its pass (see hold() and release()), or by this task,
+  which is woken once per batch for sends made elsewhere.  Thus everything
+  sent to a switch within a cycle goes out in a single send call.
+
+  Connections whose sockets are full stay queued here until their sockets
+  are writable again.
+
+  Connection.send() may be called from threads other than the recoco one,
+  so the writer's sets and the connections' output queues are only
+  touched with the lock held.  Sends from other threads are written when
+  the pinger wakes this task.
+  """
+  def __init__ (self):
+    Task.__init__(self)
+    self.lock = threading.RLock()
+    self._dirty = set() # Connections with newly queued data
+    self._blocked = set() # Connections waiting for socket buffer space
+    self._holds = 0
+    self._woken = False
+    self._pinger = pox.lib.util.makePinger()
+
+  def mark (self, con):
+    """
+    Notes that con has data queued
+    """
+    with self.lock:
+      if con in self._dirty: return
+      self._dirty.add(con)
+      if self._holds == 0 and not self._woken:
+        self._woken = True
+        self._pinger.ping()
+
+  def forget (self, con):
+    with self.lock:
+      self._dirty.discard(con)
+      self._blocked.discard(con)
+
+  def hold (self):
+    """
+    Defers flushing until a matching release()
+
+    OpenFlow listener tasks hold the writer while they dispatch incoming
+    messages, so replies generated by the handlers get coalesced.  Never
+    yield while holding.
+    """
+    with self.lock:
+      self._holds += 1
+
+  def release (self):
+    with self.lock:
+      self._holds -= 1
+      if self._holds == 0 and self._dirty:
+        self.flush()
+
+  def flush (self):
+    """
+    Flushes all dirty connections
+    """
+    with self.lock:
+      dirty = self._dirty
+      self._dirty = set()
+      for con in dirty:
+        if con in self._blocked: continue
+        if not con.flush():
+          self._blocked.add(con)
+      if self._blocked and not self._woken:
+        # So that we start waiting on the newly blocked sockets
+        self._woken = True
+        self._pinger.ping()
+
+  def run (self):
+    while core.running:
+      with self.lock:
+        blocked = list(self._blocked)
+      rlist,wlist,elist = yield Select([self._pinger], blocked, blocked, 5)
+      if self._pinger in rlist:
+        self._pinger.pongAll()
+
+      with self.lock:
+        self._woken = False
+        for con in elist:
+          self._blocked.discard(con)
+        for con in wlist:
+          self._blocked.discard(con)
+          if con.disconnected: continue
+          if not con.flush():
+            self._blocked.add(con)
+
+        if self._dirty:
+          self.flush()
+
+
 class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
@@ -1029,10 +1179,10 @@ class OpenFlow_01_Task (Task):
     self.started = True
     return super(OpenFlow_01_Task,self).start()
 
-  def run (self):
-    # List of open sockets/connections to select on
-    sockets = []
-
+  def _make_listener (self):
+    """
+    Creates the listening socket (or returns None on failure)
+    """
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
@@ -1047,109 +1197,147 @@ class OpenFlow_01_Task (Task):
         log.error(" You may have another controller running.")
         log.error(" Use openflow.of_01 --port=<port> to run POX on "
                   "another port.")
-      return
+      return None
 
     listener.listen(16)
     listener.setblocking(0)
-    sockets.append(listener)
 
     log.debug("Listening on %s:%s" %
               (self.address, self.port))
 
+    return listener
+
+  def _accept (self, listener):
+    """
+    Accepts a switch connection from the listener
+
+    Returns a new Connection or None if the connection didn't work out.
+    """
+    new_sock = listener.accept()[0]
+
+    if self.ssl_key or self.ssl_cert or self.ssl_ca_cert:
+      cert_reqs = ssl.CERT_REQUIRED
+      if self.ssl_ca_cert is None:
+        cert_reqs = ssl.CERT_NONE
+      new_sock = ssl.wrap_socket(new_sock, server_side=True,
+          keyfile = self.ssl_key, certfile = self.ssl_cert,
+          ca_certs = self.ssl_ca_cert, cert_reqs = cert_reqs,
+          do_handshake_on_connect = False,
+          suppress_ragged_eofs = True)
+      #FIXME: We currently do a blocking handshake so that SSL errors
+      #       can't occur out of the blue later.  This isn't a good
+      #       thing, but getting around it will take some effort.
+      try:
+        new_sock.setblocking(1)
+        new_sock.do_handshake()
+      except ssl.SSLError as exc:
+        if exc.errno == 8 and "EOF occurred" in exc.strerror:
+          # Annoying, but just ignore
+          pass
+        else:
+          #log.exception("SSL negotiation failed")
+          log.warn("SSL negotiation failed: " + str(exc))
+        return None
+
+    if pox.openflow.debug.pcap_traces:
+      new_sock = wrap_socket(new_sock)
+    new_sock.setblocking(0)
+    # Note that instantiating a Connection object fires a
+    # ConnectionUp event (after negotation has completed)
+    return Connection(new_sock)
+
+  def _handle_exception (self, con, listener):
+    """
+    Deals with an exception while accepting or reading
+
+    Returns (do_break, do_close) -- whether to leave the OpenFlow loop and
+    whether to close con.
+    """
+    def log_tb ():
+      log.exception("Exception reading connection " + str(con))
+
+    do_break = False # Break OpenFlow loop?
+    do_close = True # Close this socket?
+
+    sock_error = None
+    if sys.exc_info()[0] is socket.error:
+      sock_error = sys.exc_info()[1][0]
+
+    if con is listener:
+      do_close = False
+      if sock_error == ECONNRESET:
+        con.info("Connection reset")
+      elif sock_error == EMFILE:
+        log.error("Couldn't accept connection: out of file descriptors.")
+      else:
+        do_close = True
+        log_tb()
+        log.error("Exception on OpenFlow listener.  Aborting.")
+        do_break = True
+    else:
+      # Normal socket
+      if sock_error == ECONNRESET:
+        con.info("Connection reset")
+      else:
+        log_tb()
+
+    return do_break, do_close
+
+  def run (self):
+    # List of open sockets/connections to select on
+    sockets = []
+
+    listener = self._make_listener()
+    if listener is None:
+      return
+    sockets.append(listener)
+
     con = None
     while core.running:
       try:
         while True:
           con = None
-          rlist, wlist, elist = yield Select(sockets, [], sockets, 5)
+          # Don't read from switches we can't keep up with writing to
+          readable = [s for s in sockets
+                      if s is listener or not s.congested]
+          timeout = 5 if len(readable) == len(sockets) else 0.1
+          rlist, wlist, elist = yield Select(readable, [], sockets, timeout)
           if len(rlist) == 0 and len(wlist) == 0 and len(elist) == 0:
             if not core.running: break
 
-          for con in elist:
-            if con is listener:
-              raise RuntimeError("Error on listener socket")
-            else:
-              try:
-                con.close()
-              except:
-                pass
-              try:
-                sockets.remove(con)
-              except:
-                pass
-
-          timestamp = time.time()
-          for con in rlist:
-            if con is listener:
-              new_sock = listener.accept()[0]
-
-              if self.ssl_key or self.ssl_cert or self.ssl_ca_cert:
-                cert_reqs = ssl.CERT_REQUIRED
-                if self.ssl_ca_cert is None:
-                  cert_reqs = ssl.CERT_NONE
-                new_sock = ssl.wrap_socket(new_sock, server_side=True,
-                    keyfile = self.ssl_key, certfile = self.ssl_cert,
-                    ca_certs = self.ssl_ca_cert, cert_reqs = cert_reqs,
-                    do_handshake_on_connect = False,
-                    suppress_ragged_eofs = True)
-                #FIXME: We currently do a blocking handshake so that SSL errors
-                #       can't occur out of the blue later.  This isn't a good
-                #       thing, but getting around it will take some effort.
+          connectionWriter.hold()
+          try:
+            for con in elist:
+              if con is listener:
+                raise RuntimeError("Error on listener socket")
+              else:
                 try:
-                  new_sock.setblocking(1)
-                  new_sock.do_handshake()
-                except ssl.SSLError as exc:
-                  if exc.errno == 8 and "EOF occurred" in exc.strerror:
-                    # Annoying, but just ignore
-                    pass
-                  else:
-                    #log.exception("SSL negotiation failed")
-                    log.warn("SSL negotiation failed: " + str(exc))
-                  continue
-
-              if pox.openflow.debug.pcap_traces:
-                new_sock = wrap_socket(new_sock)
-              new_sock.setblocking(0)
-              # Note that instantiating a Connection object fires a
-              # ConnectionUp event (after negotation has completed)
-              newcon = Connection(new_sock)
-              sockets.append( newcon )
-              #print str(newcon) + " connected"
-            else:
-              con.idle_time = timestamp
-              if con.read() is False:
-                con.close()
-                sockets.remove(con)
+                  con.close()
+                except:
+                  pass
+                try:
+                  sockets.remove(con)
+                except:
+                  pass
+
+            timestamp = time.time()
+            for con in rlist:
+              if con is listener:
+                newcon = self._accept(listener)
+                if newcon is None: continue
+                sockets.append( newcon )
+                #print str(newcon) + " connected"
+              else:
+                con.idle_time = timestamp
+                if con.read() is False:
+                  con.close()
+                  sockets.remove(con)
+          finally:
+            connectionWriter.release()
       except KeyboardInterrupt:
         break
       except:
-        def log_tb ():
-          log.exception("Exception reading connection " + str(con))
-
-        do_break = False # Break OpenFlow loop?
-        do_close = True # Close this socket?
-
-        sock_error = None
-        if sys.exc_info()[0] is socket.error:
-          sock_error = sys.exc_info()[1][0]
-
-        if con is listener:
-          do_close = False
-          if sock_error == ECONNRESET:
-            con.info("Connection reset")
-          elif sock_error == EMFILE:
-            log.error("Couldn't accept connection: out of file descriptors.")
-          else:
-            do_close = True
-            log_tb()
-            log.error("Exception on OpenFlow listener.  Aborting.")
-            do_break = True
-        else:
-          # Normal socket
-          if sock_error == ECONNRESET:
-            con.info("Connection reset")
-          else:
-            log_tb()
+        do_break, do_close = self._handle_exception(con, listener)
 
         if do_close:
           try:
@@ -1170,12 +1358,800 @@ class OpenFlow_01_Task (Task):
     #pox.core.quit()
 
 
+_EPOLLRDHUP = getattr(select, 'EPOLLRDHUP', 0x2000)
+
+class OpenFlow_01_EpollTask (OpenFlow_01_Task):
+  """
+  An OpenFlow listener that keeps its sockets registered with epoll
+
+  OpenFlow_01_Task hands the scheduler a list of every connection on every
+  pass, so each pass (and each disconnect) costs time proportional to the
+  number of switches.  This version owns a persistent epoll object.  Sockets
+  are registered once when they connect and unregistered once when they
+  go away, and the scheduler just waits on the epoll object's descriptor.
+  Only connections with pending events are touched on each pass.
+
+  Switch sockets are registered edge-triggered, so each one is read until
+  it would block.  Linux only.
+  """
+
+  # The most reads done on one connection per pass, so that a single busy
+  # switch can't starve the others.  Connections which still have data
+  # waiting are revisited on the next pass.
+  max_reads = 16
+
+  # The most connections accepted per pass
+  max_accepts = 64
+
+  def run (self):
+    listener = self._make_listener()
+    if listener is None:
+      return
+
+    poller = select.epoll()
+    poller.register(listener.fileno(), select.EPOLLIN)
+
+    cons = {} # fd -> Connection
+    backlog = set() # Connections which may still have unread data
+    paused = set() # Connections not being read due to output congestion
+
+    def close (con):
+      cons.pop(con._epoll_fd, None)
+      backlog.discard(con)
+      paused.discard(con)
+      try:
+        poller.unregister(con._epoll_fd)
+      except Exception:
+        pass
+      try:
+        con.close()
+      except Exception:
+        pass
+
+    def drain (con):
+      # Read until the socket would block (so we get another edge later)
+      if con.congested:
+        # Come back to it once its output has drained
+        backlog.discard(con)
+        paused.add(con)
+        return
+      for _ in xrange(self.max_reads):
+        r = con.read()
+        if r is False:
+          close(con)
+          return
+        if r is None:
+          backlog.discard(con)
+          return
+      backlog.add(con)
+
+    lfd = listener.fileno()
+    while core.running:
+      con = None
+      try:
+        for con in [c for c in paused if not c.congested]:
+          paused.discard(con)
+          backlog.add(con)
+        timeout = 0 if backlog else (0.1 if paused else 5)
+        rlist,_,_ = yield Select([poller], [], [], timeout)
+        events = poller.poll(0) if rlist else ()
+        if not events and not backlog:
+          continue
+
+        timestamp = time.time()
+        connectionWriter.hold()
+        try:
+          for fd,event in events:
+            if fd == lfd:
+              if event & (select.EPOLLERR | select.EPOLLHUP):
+                con = listener
+                raise RuntimeError("Error on listener socket")
+              for _ in xrange(self.max_accepts):
+                con = listener
+                try:
+                  newcon = self._accept(listener)
+                except socket.error as e:
+                  if e.errno == EAGAIN: break
+                  raise
+                if newcon is None: continue
+                newcon._epoll_fd = newcon.fileno()
+                cons[newcon._epoll_fd] = newcon
+                poller.register(newcon._epoll_fd,
+                                select.EPOLLIN | _EPOLLRDHUP | select.EPOLLET)
+              continue
+
+            con = cons.get(fd)
+            if con is None:
+              # Stale; we don't know it anymore
+              try:
+                poller.unregister(fd)
+              except Exception:
+                pass
+              continue
+            con.idle_time = timestamp
+            if event & select.EPOLLERR:
+              close(con)
+            else:
+              # On a hangup, this reads anything left and then sees EOF
+              drain(con)
+
+          for con in list(backlog):
+            if con in backlog and con._epoll_fd in cons:
+              con.idle_time = timestamp
+              drain(con)
+        finally:
+          connectionWriter.release()
+
+      except KeyboardInterrupt:
+        break
+      except:
+        do_break, do_close = self._handle_exception(con, listener)
+
+        if do_close and con is not None:
+          if con is listener:
+            try:
+              listener.close()
+            except Exception:
+              pass
+          else:
+            close(con)
+
+        if do_break:
+          # Leave the OpenFlow loop
+          break
+
+    poller.close()
+    log.debug("No longer listening for connections")
+
+
+# The main process and OpenFlow worker processes (see
+# OpenFlow_01_ShardedTask) talk by exchanging records.  Each is a header of
+# (kind, connection ID, payload length) followed by the payload.
+_shard_record_struct = struct.Struct("!BII")
+
+_SHARD_CONNECT = 1    # W->M: Switch finished HELLO/features (payload: peer)
+_SHARD_MESSAGE = 2    # Both: OpenFlow message(s) from/to a switch
+_SHARD_DISCONNECT = 3 # W->M: Switch is gone
+_SHARD_CLOSE = 4      # M->W: Disconnect a switch
+_SHARD_SUBSCRIBE = 5  # M->W: Filterable OFPTs to forward (payload: types)
+_SHARD_EARLY = 6      # W->M: Message from a switch which isn't up yet, for
+                      #       logging (payload: peer, NUL, message)
+
+# Message types which workers only forward if someone is listening for the
+# corresponding event.  Everything else (aside from ECHO_REQUEST, which
+# workers answer themselves) is always forwarded, since the main process
+# needs it to track connection state or it's a reply to one of its requests.
+_shard_filterable_types = {
+  of.OFPT_PACKET_IN : PacketIn,
+  of.OFPT_FLOW_REMOVED : FlowRemoved,
+}
+
+
+class _ShardSwitch (object):
+  """
+  A switch connection inside an OpenFlow worker process
+  """
+  def __init__ (self, sock, cid, peer):
+    self.sock = sock
+    self.id = cid
+    self.peer = "%s:%s" % peer[:2]
+    self.fd = sock.fileno()
+    self.buf = bytearray()
+    self.out = b''
+    self.up = False # Has the main process been told about us yet?
+    self.description = None # Raw desc stats reply received before features
+
+
+class OpenFlowShardWorker (object):
+  """
+  The loop run in each OpenFlow worker process
+
+  Accepts switches on its own SO_REUSEPORT listening socket, does the
+  HELLO/features part of the handshake, answers echo requests, frames
+  messages, and forwards what the main process wants over the channel.
+  This runs in a forked child, so it sticks to plain sockets and epoll and
+  doesn't touch the core, the scheduler, or logging.  Anything worth
+  logging is sent to the main process instead.
+  """
+  max_accepts = 64
+
+  def __init__ (self, address, port, channel):
+    self.address = address
+    self.port = port
+    self.channel = channel
+    self.switches = {} # fd -> _ShardSwitch
+    self.by_id = {} # cid -> _ShardSwitch
+    self.next_id = 1
+    self.forward = set(_shard_filterable_types) # Until told otherwise
+    self.outbox = [] # Data for the main process not yet sent
+    self.cbuf = bytearray() # Data from the main process not yet handled
+    self.poller = None
+    self._channel_events = select.EPOLLIN
+
+  def run (self):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.setsockopt(socket.SOL_SOCKET,
+                        getattr(socket, 'SO_REUSEPORT', 15), 1)
+    listener.bind((self.address, self.port))
+    listener.listen(16)
+    listener.setblocking(0)
+
+    self.channel.setblocking(0)
+
+    poller = self.poller = select.epoll()
+    lfd = listener.fileno()
+    cfd = self.channel.fileno()
+    poller.register(lfd, select.EPOLLIN)
+    poller.register(cfd, self._channel_events)
+
+    while True:
+      for fd,event in poller.poll(5):
+        if fd == lfd:
+          self._accept(listener)
+        elif fd == cfd:
+          if event & select.EPOLLOUT:
+            if not self._flush_channel(): return
+          if event & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+            if not self._read_channel(): return
+        else:
+          sw = self.switches.get(fd)
+          if sw is None: continue
+          if event & select.EPOLLOUT:
+            self._flush_switch(sw)
+          if event & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+            self._read_switch(sw)
+
+      if not self._flush_channel(): return
+
+  def _record (self, kind, cid, payload = b''):
+    self.outbox.append(_shard_record_struct.pack(kind, cid, len(payload)))
+    if payload: self.outbox.append(payload)
+
+  def _flush_channel (self):
+    """
+    Sends as much of the outbox as the channel will take
+
+    Whatever is left is sent once epoll says the channel is writable.
+    Returns False if the main process is gone.
+    """
+    if self.outbox:
+      data = b''.join(self.outbox)
+      del self.outbox[:]
+      try:
+        l = self.channel.send(data)
+      except socket.error as e:
+        if e.errno not in (EAGAIN, EWOULDBLOCK): return False
+        l = 0
+      if l != len(data):
+        self.outbox.append(data[l:])
+    events = select.EPOLLIN
+    if self.outbox: events |= select.EPOLLOUT
+    if events != self._channel_events:
+      self._channel_events = events
+      self.poller.modify(self.channel.fileno(), events)
+    return True
+
+  def _read_channel (self):
+    """
+    Reads and handles records from the main process
+
+    Returns False if the main process is gone.
+    """
+    try:
+      d = self.channel.recv(65536)
+    except socket.error as e:
+      return e.errno in (EAGAIN, EWOULDBLOCK)
+    if not d: return False
+    self.cbuf += d
+    self._handle_channel(self.cbuf)
+    return True
+
+  def _accept (self, listener):
+    for _ in xrange(self.max_accepts):
+      try:
+        sock,peer = listener.accept()
+      except socket.error:
+        return
+      self._add_switch(sock, peer)
+
+  def _add_switch (self, sock, peer):
+    """
+    Takes on a newly accepted switch, starting with a HELLO
+    """
+    sock.setblocking(0)
+    sw = _ShardSwitch(sock, self.next_id, peer)
+    self.next_id += 1
+    self.switches[sw.fd] = sw
+    self.by_id[sw.id] = sw
+    self.poller.register(sw.fd, select.EPOLLIN)
+    self._send_switch(sw, of.ofp_hello().pack())
+    return sw
+
+  def _drop (self, sw, notify = True):
+    if self.switches.pop(sw.fd, None) is None: return
+    del self.by_id[sw.id]
+    try:
+      self.poller.unregister(sw.fd)
+    except Exception:
+      pass
+    try:
+      sw.sock.close()
+    except Exception:
+      pass
+    if notify and sw.up:
+      self._record(_SHARD_DISCONNECT, sw.id)
+
+  def _send_switch (self, sw, data):
+    if sw.out:
+      sw.out += data
+      return
+    try:
+      l = sw.sock.send(data)
+    except socket.error as e:
+      if e.errno not in (EAGAIN, EWOULDBLOCK):
+        self._drop(sw)
+        return
+      l = 0
+    if l != len(data):
+      sw.out = data[l:]
+      self.poller.modify(sw.fd, select.EPOLLIN | select.EPOLLOUT)
+
+  def _flush_switch (self, sw):
+    data = sw.out
+    sw.out = b''
+    if data:
+      self._send_switch(sw, data)
+    if not sw.out and sw.fd in self.switches:
+      self.poller.modify(sw.fd, select.EPOLLIN)
+
+  def _read_switch (self, sw):
+    try:
+      d = sw.sock.recv(65536)
+    except socket.error as e:
+      if e.errno in (EAGAIN, EWOULDBLOCK): return
+      d = b''
+    if not d:
+      self._drop(sw)
+      return
+
+    buf = sw.buf
+    buf += d
+    end = len(buf)
+    offset = 0
+    forward = []
+    while end - offset >= 8:
+      version,ofp_type,length = _header_struct.unpack_from(buf, offset)
+      if (version != of.OFP_VERSION and ofp_type != of.OFPT_HELLO
+          or length < 8):
+        self._drop(sw)
+        return
+      if end - offset < length: break
+      data = bytes(buf[offset:offset+length])
+      offset += length
+
+      if ofp_type == of.OFPT_ECHO_REQUEST:
+        self._send_switch(sw, data[0] + chr(of.OFPT_ECHO_REPLY) + data[2:])
+      elif sw.up:
+        if ofp_type in _shard_filterable_types:
+          if ofp_type not in self.forward: continue
+        forward.append(data)
+      elif ofp_type == of.OFPT_HELLO:
+        fr = of.ofp_features_request()
+        ss = of.ofp_stats_request(body = of.ofp_desc_stats_request())
+        self._send_switch(sw, fr.pack() + ss.pack())
+      elif (ofp_type == of.OFPT_STATS_REPLY and len(data) >= 10
+            and ord(data[9]) == of.OFPST_DESC):
+        sw.description = data
+      elif ofp_type == of.OFPT_FEATURES_REPLY:
+        sw.up = True
+        self._record(_SHARD_CONNECT, sw.id, sw.peer)
+        if sw.description: forward.append(sw.description)
+        sw.description = None
+        forward.append(data)
+      else:
+        # The main process doesn't know about the switch yet, but this
+        # may explain why it never gets there (e.g., an error in reply
+        # to the features request), so pass it on to be logged
+        self._record(_SHARD_EARLY, sw.id, sw.peer + b'\0' + data)
+    del buf[:offset]
+
+    if forward and sw.fd in self.switches:
+      self._record(_SHARD_MESSAGE, sw.id, b''.join(forward))
+
+  def _handle_channel (self, cbuf):
+    hl = _shard_record_struct.size
+    offset = 0
+    while len(cbuf) - offset >= hl:
+      kind,cid,length = _shard_record_struct.unpack_from(cbuf, offset)
+      if len(cbuf) - offset - hl < length: break
+      payload = bytes(cbuf[offset+hl:offset+hl+length])
+      offset += hl + length
+
+      if kind == _SHARD_SUBSCRIBE:
+        self.forward = set(ord(t) for t in payload)
+        continue
+      sw = self.by_id.get(cid)
+      if sw is None: continue
+      if kind == _SHARD_MESSAGE:
+        self._send_switch(sw, payload)
+      elif kind == _SHARD_CLOSE:
+        self._drop(sw)
+    del cbuf[:offset]
+
+
+class _WorkerSocket (object):
+  """
+  Stands in for the socket of a WorkerConnection
+
+  Sends go to the worker process which owns the switch's real socket, and
+  receives return data the worker forwarded to us.
+  """
+  def __init__ (self, worker, cid, peer):
+    self.worker = worker
+    self.cid = cid
+    self.peer = peer # (host, port)
+    self.pending = deque()
+
+  def send (self, data):
+    # While the channel is backed up, data stays in the connection's own
+    # queue (so its water marks work), and ConnectionWriter retries when
+    # the channel is writable.
+    w = self.worker
+    if w.out and not w.dead:
+      raise socket.error(EAGAIN, "OpenFlow worker channel is full")
+    if not w.send_record(_SHARD_MESSAGE, self.cid, data):
+      raise socket.error(EPIPE, "OpenFlow worker is gone")
+    return len(data)
+
+  def recv_into (self, buffer, nbytes = 0):
+    if not self.pending:
+      raise socket.error(EAGAIN, "No data from worker")
+    d = self.pending.popleft()
+    nbytes = nbytes or len(buffer)
+    if len(d) > nbytes:
+      self.pending.appendleft(d[nbytes:])
+      d = d[:nbytes]
+    buffer[0:len(d)] = d
+    return len(d)
+
+  def shutdown (self, how = None):
+    self.worker.send_record(_SHARD_CLOSE, self.cid)
+
+  def close (self):
+    pass
+
+  def fileno (self):
+    return self.worker.fileno()
+
+  def getpeername (self):
+    return self.peer
+
+
+class WorkerConnection (Connection):
+  """
+  A Connection to a switch whose socket is owned by a worker process
+
+  The worker has already exchanged HELLOs and sent the features and
+  description requests, so we pick the handshake up from the features
+  reply.
+  """
+  send_hello = False
+
+  def __init__ (self, worker, cid, peer):
+    Connection.__init__(self, _WorkerSocket(worker, cid, peer))
+    handlers = HandshakeOpenFlowHandlers()
+    handlers._features_request_sent = True
+    self.handlers = handlers.handlers
+
+  def _deliver (self, data):
+    """
+    Processes OpenFlow message(s) forwarded by the worker
+    """
+    self.idle_time = time.time()
+    self.sock.pending.append(data)
+    while True:
+      r = self.read()
+      if r is None: break
+      if r is False:
+        self.close()
+        break
+
+
+def _parse_peer (peer):
+  """
+  Turns a worker's "host:port" for a switch back into (host, port)
+  """
+  host,_,port = peer.rpartition(':')
+  return (host, int(port))
+
+
+class _ShardWorker (object):
+  """
+  The main process's end of the channel to an OpenFlow worker process
+  """
+  def __init__ (self, pid, sock, wake = None):
+    self.pid = pid
+    self.sock = sock
+    self.sock.setblocking(0)
+    self.rbuf = bytearray()
+    self.out = deque() # Data the channel hasn't taken yet
+    self.lock = threading.Lock() # For out and dead
+    self.wake = wake # Called when out stops being empty or we die
+    self.dead = False # Has sending to the worker failed?
+    self.connections = {} # cid -> WorkerConnection
+    self.forwarding = None # Types last sent in a _SHARD_SUBSCRIBE
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send_record (self, kind, cid, payload = b''):
+    """
+    Sends a record to the worker
+
+    If the channel is backed up, the record is queued for flush().
+    Returns False if the channel has failed.  May be called from any
+    thread.
+    """
+    data = _shard_record_struct.pack(kind, cid, len(payload)) + payload
+    with self.lock:
+      if self.dead: return False
+      if self.out:
+        self.out.append(data)
+        return True
+      try:
+        l = self.sock.send(data)
+      except socket.error as e:
+        if e.errno not in (EAGAIN, EWOULDBLOCK):
+          self._failed(e)
+          return False
+        l = 0
+      if l == len(data): return True
+      self.out.append(data[l:])
+    if self.wake: self.wake()
+    return True
+
+  def flush (self):
+    """
+    Sends as much queued data as the channel will take
+
+    Called when the channel is writable.
+    """
+    with self.lock:
+      if not self.out: return
+      data = b''.join(self.out)
+      self.out.clear()
+      try:
+        l = self.sock.send(data)
+      except socket.error as e:
+        if e.errno not in (EAGAIN, EWOULDBLOCK):
+          self._failed(e)
+          return
+        l = 0
+      if l != len(data):
+        self.out.append(data[l:])
+
+  def _failed (self, e):
+    """
+    Marks the channel dead after a send error (called with lock held)
+
+    Whoever is sending doesn't get the exception.  The connections are
+    cleaned up by the task which owns the worker (see lost()).
+    """
+    if self.dead: return
+    self.dead = True
+    self.out.clear()
+    log.warn("Lost channel to OpenFlow worker %s: %s", self.pid, e)
+    if self.wake: self.wake()
+
+  def read (self):
+    """
+    Reads and dispatches records from the worker
+
+    Returns False if the worker is gone.
+    """
+    try:
+      d = self.sock.recv(65536)
+    except socket.error as e:
+      if e.errno in (EAGAIN, EWOULDBLOCK): return True
+      return False
+    if not d: return False
+
+    rbuf = self.rbuf
+    rbuf += d
+    hl = _shard_record_struct.size
+    offset = 0
+    while len(rbuf) - offset >= hl:
+      kind,cid,length = _shard_record_struct.unpack_from(rbuf, offset)
+      if len(rbuf) - offset - hl < length: break
+      payload = bytes(rbuf[offset+hl:offset+hl+length])
+      offset += hl + length
+
+      if kind == _SHARD_MESSAGE:
+        con = self.connections.get(cid)
+        if con is not None:
+          con._deliver(payload)
+      elif kind == _SHARD_CONNECT:
+        self.connections[cid] = WorkerConnection(self, cid,
+                                                 _parse_peer(payload))
+      elif kind == _SHARD_DISCONNECT:
+        con = self.connections.pop(cid, None)
+        if con is not None and not con.disconnected:
+          con.disconnect()
+      elif kind == _SHARD_EARLY:
+        self._log_early(payload)
+    del rbuf[:offset]
+    return True
+
+  def _log_early (self, payload):
+    """
+    Logs a message a switch sent its worker before it finished connecting
+    """
+    peer,_,data = payload.partition(b'\0')
+    try:
+      msg = unpackers[ord(data[1])](data, 0)[1]
+    except Exception:
+      log.warning("Bad message from %s before it connected", peer)
+      return
+    if msg.header_type == of.OFPT_ERROR:
+      log.warning("%s sent an error before it connected:\n%s", peer, msg)
+    else:
+      log.debug("Ignoring %s from %s before it connected",
+                of.ofp_type_map.get(msg.header_type), peer)
+
+  def lost (self):
+    """
+    Called when the worker goes away
+    """
+    for con in self.connections.values():
+      if not con.disconnection_raised:
+        con.disconnect("worker exited")
+    self.connections.clear()
+    try:
+      self.sock.close()
+    except Exception:
+      pass
+
+
+class OpenFlow_01_ShardedTask (OpenFlow_01_Task):
+  """
+  Spreads OpenFlow connections across several worker processes
+
+  Each worker is forked from the main process and binds its own listening
+  socket with SO_REUSEPORT, so the kernel spreads incoming switches among
+  them.  Workers own the sockets for the switches they accept.  They do
+  the HELLO/features exchange, answer echo requests, and frame messages,
+  and they forward messages to the main process over a local socketpair.
+  Message types in _shard_filterable_types are only forwarded while
+  something is listening for the corresponding event.
+
+  In the main process, each switch is represented by a WorkerConnection,
+  which behaves like any other Connection (raising events, being found by
+  core.openflow.sendToDPID(), etc.), except that its sends are routed to
+  the worker that owns the switch.
+
+  Linux only, and SSL and pcap traces are not supported.
+  """
+
+  # How often to check which filterable messages have listeners (seconds)
+  subscription_interval = 1
+
+  def __init__ (self, workers = 2, *args, **kw):
+    self.worker_count = int(workers)
+    self.workers = []
+    self._subscription_time = 0
+    self._pinger = pox.lib.util.makePinger() # Pinged by workers' wake
+    super(OpenFlow_01_ShardedTask, self).__init__(*args, **kw)
+
+  def _spawn_workers (self):
+    for i in range(self.worker_count):
+      ours,theirs = socket.socketpair()
+      pid = os.fork()
+      if pid == 0:
+        # We're the worker
+        ours.close()
+        for w in self.workers:
+          w.sock.close()
+        status = 0
+        try:
+          OpenFlowShardWorker(self.address, self.port, theirs).run()
+        except KeyboardInterrupt:
+          pass
+        except:
+          traceback.print_exc()
+          status = 1
+        os._exit(status)
+      theirs.close()
+      self.workers.append(_ShardWorker(pid, ours, self._pinger.ping))
+    log.debug("Started %s OpenFlow workers on %s:%s",
+              len(self.workers), self.address, self.port)
+
+  def _handle_DownEvent (self, event):
+    import signal
+    for w in self.workers:
+      try:
+        os.kill(w.pid, signal.SIGTERM)
+        os.waitpid(w.pid, 0)
+      except Exception:
+        pass
+
+  def _has_listeners (self, event_type, sources):
+    for s in sources:
+      if isinstance(s, EventMixin) and s.hasListener(event_type):
+        return True
+    return False
+
+  def _update_subscriptions (self):
+    """
+    Tells workers which filterable messages to forward
+    """
+    now = time.time()
+    if now - self._subscription_time < self.subscription_interval: return
+    self._subscription_time = now
+
+    sources = set()
+    for w in self.workers:
+      for con in w.connections.itervalues():
+        sources.add(con)
+        sources.add(con.ofnexus)
+    if core.hasComponent('openflow'):
+      sources.add(core.openflow)
+
+    forward = set(t for t,e in _shard_filterable_types.iteritems()
+                  if self._has_listeners(e, sources))
+    payload = b''.join(chr(t) for t in sorted(forward))
+    for w in self.workers:
+      if w.forwarding != payload:
+        w.forwarding = payload
+        w.send_record(_SHARD_SUBSCRIBE, 0, payload)
+
+  def run (self):
+    self._spawn_workers()
+    core.addListenerByName("DownEvent", self._handle_DownEvent)
+
+    while core.running and self.workers:
+      w = None
+      try:
+        for w in [w for w in self.workers if w.dead]:
+          w.lost()
+          self.workers.remove(w)
+        if not self.workers: break
+        wlist = [w for w in self.workers if w.out]
+        rlist,wlist,elist = yield Select([self._pinger] + self.workers,
+                                         wlist, self.workers,
+                                         self.subscription_interval)
+        if self._pinger in rlist:
+          self._pinger.pongAll()
+          rlist.remove(self._pinger)
+        for w in wlist:
+          w.flush()
+        connectionWriter.hold()
+        try:
+          for w in set(rlist + elist):
+            if w.dead: continue
+            if w in elist or w.read() is False:
+              log.warn("OpenFlow worker %s exited", w.pid)
+              w.lost()
+              self.workers.remove(w)
+        finally:
+          connectionWriter.release()
+        self._update_subscriptions()
+      except KeyboardInterrupt:
+        break
+      except:
+        log.exception("Exception handling OpenFlow worker %s",
+                      w.pid if w else None)
+
+    log.debug("No longer handling OpenFlow workers")
+
+
 
 # Used by the Connection class
-deferredSender = None
+connectionWriter = None
 
 def launch (port=6633, address="0.0.0.0", name=None,
             private_key=None, certificate=None, ca_cert=None,
+            read_size=None, buffer_size=None, epoll=False, workers=None,
             __INSTANCE__=None):
   """
   Start a listener for OpenFlow connections
@@ -1184,7 +2160,24 @@ def launch (port=6633, address="0.0.0.0", name=None,
   combinations and pointing to reasonable key/cert files.  These have the same
   meanings as with Open vSwitch's old test controller, but they are more
   flexible (e.g., ca-cert can be skipped).
+
+  --read_size is the most bytes read from a switch socket at once, and
+  --buffer_size is the initial size of each connection's receive buffer.
+  These are shared by all listeners.
+
+  --epoll uses a listener which keeps switch sockets registered with its
+  own epoll object rather than handing the scheduler a list of every
+  socket on each pass.  This scales better to many switches (Linux only).
+
+  --workers=N forks N worker processes which each accept switches on a
+  SO_REUSEPORT socket, deal with the handshake, echoes and message framing,
+  and forward messages to this process (Linux only, no SSL).
   """
+  if read_size is not None:
+    Connection.read_size = int(read_size)
+  if buffer_size is not None:
+    Connection.buffer_size = int(buffer_size)
+
   if name is None:
     basename = "of_01"
     counter = 1
@@ -1197,15 +2190,32 @@ def launch (port=6633, address="0.0.0.0", name=None,
     log.warn("of_01 '%s' already started", name)
     return None
 
-  global deferredSender
-  if not deferredSender:
-    deferredSender = DeferredSender()
+  global connectionWriter
+  if not connectionWriter:
+    connectionWriter = ConnectionWriter()
+    connectionWriter.start()
 
   if of._logger is None:
     of._logger = core.getLogger('libopenflow_01')
 
-  l = OpenFlow_01_Task(port = int(port), address = address,
-                       ssl_key = private_key, ssl_cert = certificate,
-                       ssl_ca_cert = ca_cert)
+  kw = {}
+  if workers is not None:
+    if not hasattr(select, 'epoll'):
+      raise RuntimeError("OpenFlow workers are not available on this "
+                         "platform")
+    if private_key or certificate or ca_cert:
+      raise RuntimeError("OpenFlow workers do not support SSL")
+    task_class = OpenFlow_01_ShardedTask
+    kw['workers'] = int(workers)
+  elif str_to_bool(epoll):
+    if not hasattr(select, 'epoll'):
+      raise RuntimeError("epoll is not available on this platform")
+    task_class = OpenFlow_01_EpollTask
+  else:
+    task_class = OpenFlow_01_Task
+
+  l = task_class(port = int(port), address = address,
+                 ssl_key = private_key, ssl_cert = certificate,
+                 ssl_ca_cert = ca_cert, **kw)
   core.register(name, l)
   return l
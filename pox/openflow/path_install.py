@@ -0,0 +1,317 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pipelined installation of flows along paths
+
+Installing a path hop by hop with a barrier after every flow_mod costs a
+barrier (and a reply) per hop per path.  A PathInstaller instead lets any
+number of transactions queue messages for switches, and then flushes
+them all at once (on the next pass of the scheduler): each switch gets
+everything queued for it followed by a single barrier.  A transaction
+completes, and its callback is called, once every switch it sent to has
+answered the barrier which followed its messages.
+
+  txn = installer.begin(packet_out_when_done, event) # Calls it(txn, event)
+  for sw,in_port,out_port in path:
+    txn.send(sw.connection, flow_mod_for(sw, in_port, out_port))
+  txn.commit()
+
+The owner passes BarrierIns to barrier_in() and calls expire() now and
+then; transactions which haven't completed within the timeout fail.
+
+Forwarding components installing paths for PacketIns can use a
+PendingInstalls on top of this, which holds further PacketIns for a flow
+while its path is going in rather than installing it again.
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.revent import Event
+from pox.lib.util import dpid_to_str
+from collections import deque
+import time
+
+log = core.getLogger()
+
+
+def _call_later (func):
+  core.callLater(func)
+
+
+class Transaction (object):
+  """
+  A group of messages which completes when its switches have barriered
+  """
+  def __init__ (self, installer, callback, args, kw):
+    self.installer = installer
+    self.started = time.time()
+    self.expires_at = self.started + installer.timeout
+    self.message_count = 0
+    self.done = False
+    self.failed = False
+    self._callback = callback
+    self._args = args
+    self._kw = kw
+    self._committed = False
+    self._queued = False # Has messages waiting for a flush
+    self._barriers = []  # (dpid,xid)s this is waiting on
+    self._waiting = 0
+
+  @property
+  def elapsed (self):
+    return time.time() - self.started
+
+  def send (self, connection, msg):
+    """
+    Queues a message for a switch
+    """
+    self.installer._queue(self, connection, msg)
+
+  def commit (self):
+    """
+    Marks the transaction as complete; it finishes once acknowledged
+    """
+    self._committed = True
+    if self._waiting == 0 and not self._queued:
+      self._finish()
+
+  def _finish (self):
+    if self.done or self.failed: return
+    self.done = True
+    self.installer.completed += 1
+    if self._callback is not None:
+      self._callback(self, *self._args, **self._kw)
+
+
+class PathInstaller (object):
+  """
+  Batches messages from many transactions into one barrier per switch
+  """
+  def __init__ (self, timeout = 4, defer = None):
+    """
+    timeout is how long a transaction has to complete
+
+    defer is called with a function to call once the current work is
+    done (core.callLater by default).
+    """
+    self.timeout = timeout
+    self._defer = defer or _call_later
+    self._queued = {}     # connection -> [messages]
+    self._queued_txns = {} # connection -> [transactions]
+    self._flush_pending = False
+    self._barriers = {}   # (dpid,xid) -> [transactions]
+    self._pending = deque() # Transactions which sent something, oldest first
+
+    # Counters
+    self.flushes = 0
+    self.messages = 0
+    self.barriers = 0
+    self.completed = 0
+    self.failed = 0
+
+  def begin (self, callback = None, *args, **kw):
+    """
+    Starts a transaction
+
+    callback is called with the transaction (and args and kw) when it
+    completes.
+    """
+    return Transaction(self, callback, args, kw)
+
+  def _queue (self, txn, connection, msg):
+    msgs = self._queued.get(connection)
+    if msgs is None:
+      self._queued[connection] = [msg]
+      self._queued_txns[connection] = [txn]
+    else:
+      msgs.append(msg)
+      txns = self._queued_txns[connection]
+      if txns[-1] is not txn: txns.append(txn)
+    txn._queued = True
+    txn.message_count += 1
+    if txn.message_count == 1:
+      self._pending.append(txn)
+    if not self._flush_pending:
+      self._flush_pending = True
+      self._defer(self.flush)
+
+  def flush (self):
+    """
+    Sends everything queued, with a barrier after each switch's messages
+    """
+    self._flush_pending = False
+    if not self._queued: return
+    queued = self._queued
+    queued_txns = self._queued_txns
+    self._queued = {}
+    self._queued_txns = {}
+    self.flushes += 1
+
+    for connection,msgs in queued.iteritems():
+      for msg in msgs:
+        connection.send(msg)
+      barrier = of.ofp_barrier_request()
+      connection.send(barrier)
+      self.messages += len(msgs) + 1
+      self.barriers += 1
+
+      key = (connection.dpid, barrier.xid)
+      txns = queued_txns[connection]
+      self._barriers[key] = txns
+      for txn in txns:
+        txn._queued = False
+        txn._barriers.append(key)
+        txn._waiting += 1
+
+    self.expire()
+
+  def barrier_in (self, event):
+    """
+    Handles a BarrierIn, returning True if it was one of ours
+    """
+    txns = self._barriers.pop((event.dpid,event.xid), None)
+    if txns is None: return False
+    for txn in txns:
+      txn._waiting -= 1
+      if txn._waiting == 0 and txn._committed:
+        txn._finish()
+    return True
+
+  def expire (self):
+    """
+    Fails transactions which have run out of time
+    """
+    now = time.time()
+    pending = self._pending
+    killed = 0
+    while pending:
+      txn = pending[0]
+      if not (txn.done or txn.failed):
+        if txn.expires_at > now: break
+        txn.failed = True
+        killed += 1
+        for key in txn._barriers:
+          self._barriers.pop(key, None)
+      pending.popleft()
+    if killed:
+      self.failed += killed
+      log.error("%i paths failed to install" % (killed,))
+    return killed
+
+
+class PathInstalled (Event):
+  """
+  Fired when a path is installed
+  """
+  def __init__ (self, path):
+    self.path = path
+
+
+class PendingInstalls (object):
+  """
+  PacketIns held while the paths for their flows are being installed
+
+  The first PacketIn for a flow starts installing its path, and later ones
+  for the same flow (up to max_held of them) wait for it to finish instead
+  of starting installs of their own.  The app passed in raises
+  PathInstalled when a path is in, and counts held and dropped PacketIns
+  in its redundant_installs_avoided and held_packets_dropped.  If the
+  install fails, the switch's buffers holding those packets are freed.
+  """
+  def __init__ (self, installer, max_held = 8):
+    self.installer = installer
+    self.max_held = max_held
+    # (dpid,compiled match) -> (Transaction, [ofp_packet_ins])
+    # The first ofp_packet_in is the one the install is for.
+    self._pending = {}
+
+  def __len__ (self):
+    return len(self._pending)
+
+  def clear (self):
+    self._pending.clear()
+
+  def begin (self, app, path, match, packet_in = None):
+    """
+    Starts a transaction installing a path
+
+    If packet_in is given, it (and whatever is held for match meanwhile)
+    is sent back through the first switch's table once the path is in.
+    """
+    key = None
+    if packet_in is not None:
+      key = (path[0][0].dpid, match.compiled)
+    txn = self.installer.begin(self._installed, app, path, packet_in, key)
+    if key is not None:
+      self._pending[key] = (txn, [packet_in])
+    return txn
+
+  def _installed (self, txn, app, path, packet, key):
+    if packet:
+      first_switch = path[0][0].dpid
+      log.debug("Sending delayed packet out %s"
+                % (dpid_to_str(first_switch),))
+      packets = [packet]
+      pending = self._pending.get(key)
+      if pending is not None and pending[0] is txn:
+        del self._pending[key]
+        packets = pending[1]
+      for p in packets:
+        msg = of.ofp_packet_out(data=p,
+            action=of.ofp_action_output(port=of.OFPP_TABLE))
+        core.openflow.sendToDPID(first_switch, msg)
+
+    app.raiseEvent(PathInstalled(path))
+
+  def hold (self, app, dpid, match, event, drop):
+    """
+    Holds (or drops) a PacketIn for a flow whose path is being installed
+
+    drop is called to get rid of the packet if too many are held already.
+    Returns True if the PacketIn was taken care of.
+    """
+    key = (dpid, match.compiled)
+    pending = self._pending.get(key)
+    if pending is None: return False
+    txn,held = pending
+    if txn.done or txn.failed:
+      del self._pending[key]
+      if txn.failed: self._release(key[0], held)
+      return False
+    app.redundant_installs_avoided += 1
+    if len(held) <= self.max_held:
+      held.append(event.ofp)
+    else:
+      app.held_packets_dropped += 1
+      drop()
+    return True
+
+  def expire (self):
+    """
+    Expires the installer, and drops what was held for failed installs
+    """
+    self.installer.expire()
+    for key,(txn,held) in self._pending.items():
+      if txn.failed:
+        del self._pending[key]
+        self._release(key[0], held)
+
+  @staticmethod
+  def _release (dpid, packet_ins):
+    """
+    Frees the buffers of PacketIns which will never be sent
+    """
+    for p in packet_ins:
+      if p.buffer_id is None: continue
+      msg = of.ofp_packet_out(buffer_id = p.buffer_id, in_port = p.in_port)
+      core.openflow.sendToDPID(dpid, msg)
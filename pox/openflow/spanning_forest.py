@@ -0,0 +1,221 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Keeps a spanning forest of the switches up to date as links come and go
+
+The switches are connected by an edge wherever discovery has seen LLDP
+links in both directions between two ports, and SpanningForest keeps a
+spanning tree of each connected group of switches.  An added edge which
+joins two trees becomes a tree edge (and the smaller tree is relabeled);
+any other edge is a spare.  When a tree edge goes away, one side of it
+is searched for a spare which reconnects the two halves, and only if
+there isn't one does the tree split.
+
+  forest = SpanningForest()
+  ...
+  def _handle_LinkEvent (event):
+    forest.link_event(event)
+    for dpid,port in forest.pop_changed(): ...
+
+Ports are (dpid, port_no) tuples, and pop_changed() returns the ones
+which have joined or left the tree since it was last called.
+"""
+
+
+class SpanningForest (object):
+  """
+  A spanning forest over the switches joined by symmetric LLDP links
+  """
+  def __init__ (self):
+    self._directed = set() # (dpid1,port1,dpid2,port2) for each link seen
+    self._adj = {}         # dpid -> {dpid: set of edges between them}
+    self._tree_adj = {}    # dpid -> {dpid: tree edge between them}
+    self._tree_ports = {}  # port -> number of tree edges at it
+    self._root = {}        # dpid -> root dpid of its tree
+    self._members = {}     # root dpid -> set of dpids in the tree
+    self._changed = set()  # Ports which joined or left the tree
+
+  def is_tree_port (self, dpid, port):
+    """
+    Returns True if a tree edge ends at the port
+    """
+    return (dpid,port) in self._tree_ports
+
+  def tree_of (self, dpid):
+    """
+    Returns the set of switches in dpid's tree (don't modify it)
+    """
+    root = self._root.get(dpid)
+    if root is None: return frozenset([dpid])
+    return self._members[root]
+
+  def tree_edges (self):
+    """
+    Returns the tree edges as (dpid1,port1,dpid2,port2) tuples
+    """
+    return set(e for n in self._tree_adj.itervalues() for e in n.itervalues())
+
+  def pop_changed (self):
+    """
+    Returns (and forgets) the ports which joined or left the tree
+    """
+    changed = self._changed
+    self._changed = set()
+    return changed
+
+  def link_event (self, event):
+    """
+    Updates the forest for a discovery LinkEvent
+
+    Returns True if the edges between switches changed.
+    """
+    link = event.link
+    if event.added:
+      if link.link_type != 'lldp': return False
+      return self.add_link(link)
+    return self.remove_link(link)
+
+  def add_link (self, link):
+    """
+    Adds a directed link, returning True if it completed an edge
+    """
+    d = (link.dpid1, link.port1, link.dpid2, link.port2)
+    if d in self._directed: return False
+    self._directed.add(d)
+    if link.dpid1 == link.dpid2: return False
+    if (link.dpid2, link.port2, link.dpid1, link.port1) not in self._directed:
+      return False
+    self._add_edge(self._edge(d))
+    return True
+
+  def remove_link (self, link):
+    """
+    Removes a directed link, returning True if it broke an edge
+    """
+    d = (link.dpid1, link.port1, link.dpid2, link.port2)
+    if d not in self._directed: return False
+    self._directed.discard(d)
+    if link.dpid1 == link.dpid2: return False
+    if (link.dpid2, link.port2, link.dpid1, link.port1) not in self._directed:
+      return False
+    self._remove_edge(self._edge(d))
+    return True
+
+  @staticmethod
+  def _edge (d):
+    if (d[0],d[1]) < (d[2],d[3]): return d
+    return (d[2],d[3],d[0],d[1])
+
+  def _add_edge (self, e):
+    a = e[0]
+    b = e[2]
+    edges = self._adj.setdefault(a, {}).get(b)
+    if edges is None:
+      edges = set()
+      self._adj[a][b] = edges
+      self._adj.setdefault(b, {})[a] = edges
+    edges.add(e)
+
+    ra = self._root.get(a)
+    rb = self._root.get(b)
+    if ra is not None and ra == rb: return # A spare
+    self._set_tree_edge(e)
+    if ra is None and rb is None:
+      self._root[a] = self._root[b] = a
+      self._members[a] = set([a, b])
+    elif rb is None:
+      self._root[b] = ra
+      self._members[ra].add(b)
+    elif ra is None:
+      self._root[a] = rb
+      self._members[rb].add(a)
+    else:
+      # Relabel the smaller tree
+      if len(self._members[ra]) < len(self._members[rb]):
+        ra,rb = rb,ra
+      moved = self._members.pop(rb)
+      for s in moved:
+        self._root[s] = ra
+      self._members[ra].update(moved)
+
+  def _remove_edge (self, e):
+    a = e[0]
+    b = e[2]
+    edges = self._adj[a][b]
+    edges.discard(e)
+    if not edges:
+      del self._adj[a][b]
+      del self._adj[b][a]
+      if not self._adj[a]: del self._adj[a]
+      if not self._adj[b]: del self._adj[b]
+    if self._tree_adj.get(a, {}).get(b) != e: return # Was a spare
+    self._unset_tree_edge(e)
+
+    if edges:
+      # Another edge between the same switches can take over
+      self._set_tree_edge(next(iter(edges)))
+      return
+
+    # Find a's side of the tree, and look for a spare leaving it
+    side = set([a])
+    todo = [a]
+    while todo:
+      for t in self._tree_adj.get(todo.pop(), {}):
+        if t not in side:
+          side.add(t)
+          todo.append(t)
+    for s in side:
+      for t,edges in self._adj.get(s, {}).iteritems():
+        if t not in side:
+          self._set_tree_edge(next(iter(edges)))
+          return
+
+    # The tree splits in two
+    members = self._members.pop(self._root[a])
+    for part,root in ((side, a), (members - side, b)):
+      if len(part) == 1:
+        del self._root[root]
+        continue
+      for s in part:
+        self._root[s] = root
+      self._members[root] = part
+
+  def _set_tree_edge (self, e):
+    self._tree_adj.setdefault(e[0], {})[e[2]] = e
+    self._tree_adj.setdefault(e[2], {})[e[0]] = e
+    for p in ((e[0],e[1]), (e[2],e[3])):
+      n = self._tree_ports.get(p, 0)
+      self._tree_ports[p] = n + 1
+      if n == 0: self._changed.add(p)
+
+  def _unset_tree_edge (self, e):
+    for s,t in ((e[0],e[2]), (e[2],e[0])):
+      adj = self._tree_adj[s]
+      del adj[t]
+      if not adj: del self._tree_adj[s]
+    for p in ((e[0],e[1]), (e[2],e[3])):
+      n = self._tree_ports[p] - 1
+      if n:
+        self._tree_ports[p] = n
+      else:
+        del self._tree_ports[p]
+        self._changed.add(p)
+
+  def clear (self):
+    self._directed.clear()
+    self._adj.clear()
+    self._tree_adj.clear()
+    self._changed.update(self._tree_ports)
+    self._tree_ports.clear()
+    self._root.clear()
+    self._members.clear()
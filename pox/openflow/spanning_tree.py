@@ -35,6 +35,8 @@ import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
+from pox.openflow.broadcast_segments import BroadcastSegments
+from pox.openflow.spanning_forest import SpanningForest
 from pox.lib.util import dpidToStr
 from pox.lib.recoco import Timer
 import time
@@ -48,6 +50,18 @@ all_switches_set = set()
 
 node_to_be_down = {}
 
+# Ports sharing broadcast segments (also used by l2_multi).  Only
+# track_broadcast_segments() feeds it; users compare its version.
+broadcast_segments = BroadcastSegments()
+
+# broadcast_segments.version when we last looked
+_segments_version = broadcast_segments.version
+
+_tracking_segments = False
+
+# The spanning tree, kept up to date by link events
+spanning_forest = SpanningForest()
+
 # Might be nice if we made this accessible on core...
 # _adj = defaultdict(lambda:defaultdict(lambda:[]))
 
@@ -55,6 +69,9 @@ def _calc_spanning_tree():
   """
 Calculates the actual spanning tree
 
+This works it out from scratch (for l2_flowvisor); this component uses
+spanning_forest.
+
 Returns it as dictionary where the keys are DPID1, and the
 values are tuples of (DPID2, port-num), where port-num
 is the port on DPID1 connecting to DPID2.
@@ -73,9 +90,7 @@ is the port on DPID1 connecting to DPID2.
 
   # Cull links -- we want a single symmetric link connecting nodes
   for s1 in switches:
-    for s2 in switches:
-      if s2 not in adj[s1]:
-        continue
+    for s2 in list(adj[s1]):
       if not isinstance(adj[s1][s2], list):
         continue
       assert s1 is not s2
@@ -126,6 +141,11 @@ is the port on DPID1 connecting to DPID2.
 # be up to date.
 _prev = defaultdict(lambda: defaultdict(lambda: None))
 
+# Ports whose flood bits may need changing, and switches which need all of
+# their ports checked (they've connected since they were last updated)
+_dirty_ports = set()
+_unsynced = set()
+
 # If True, we set ports down when a switch connects
 _noflood_by_default = False
 
@@ -137,6 +157,7 @@ _hold_down = False
 def _handle_ConnectionUp(event):
   # When a switch connects, forget about previous port states
   _prev[event.dpid].clear()
+  _unsynced.add(event.dpid)
 
   if _noflood_by_default:
     con = event.connection
@@ -156,19 +177,49 @@ def _handle_ConnectionUp(event):
               kw={'force_dpid': event.dpid})
 
 
+def track_broadcast_segments():
+  """
+Keeps broadcast_segments up to date with discovery's LinkEvents
+
+Anything using broadcast_segments should call this once discovery is
+up (repeat calls do nothing).  The segments are updated before other
+LinkEvent handlers run, so they can tell whether an event changed them
+by comparing broadcast_segments.version with what it was last time.
+"""
+  global _tracking_segments
+  if _tracking_segments: return
+  _tracking_segments = True
+
+  def _handle_LinkEvent(event):
+    broadcast_segments.link_event(event)
+  core.openflow_discovery.addListenerByName("LinkEvent", _handle_LinkEvent,
+                                            priority=1000)
+
+
 def _handle_LinkEvent(event):
+  global _segments_version
+  segments_changed = broadcast_segments.version != _segments_version
+  _segments_version = broadcast_segments.version
+  spanning_forest.link_event(event)
+  # Either end may have stopped or started being an edge/broadcast port
+  _dirty_ports.update(event.link.end)
   if event.link.link_type is 'lldp':
 
     # When links change, update spanning tree
     (dp1, p1), (dp2, p2) = event.link.end
-    if _prev[dp1][p1] is False:
+    if _prev[dp1][p1] is False and event.removed:
       if _prev[dp2][p2] is False:
-        # We're disabling this link; who cares if it's up or down?
+        # We'd disabled this link; who cares if it's gone?  (An added
+        # one may have just joined the tree, though.)
         # log.debug("Ignoring link status for %s", event.link)
         return
-    _update_tree()
+    if event.added:
+      _update_tree()
+    else:
+      # Discovery only forgets the link once the event is over
+      core.callLater(_update_tree)
 
-  elif event.link.link_type is 'broadcast':
+  elif event.link.link_type is 'broadcast' and segments_changed:
     update_sw_cloud_site_domain()
 
 
@@ -176,13 +227,24 @@ def _update_tree(force_dpid=None):
   """
 Update spanning tree
 
+Only ports which might have changed are looked at: those which have
+joined or left the spanning tree, those at the ends of links which have
+come or gone, and all ports of switches which have (re)connected.
+
 force_dpid specifies a switch we want to update even if we are supposed
 to be holding down changes.
 """
 
-  # Get a spanning tree
-  tree = _calc_spanning_tree()
-  log.debug("Spanning tree updated")
+  _dirty_ports.update(spanning_forest.pop_changed())
+  todo = defaultdict(set)  # dpid -> ports (None for all of them)
+  for sw, port_no in _dirty_ports:
+    todo[sw].add(port_no)
+  for sw in _unsynced:
+    todo[sw] = None
+  if force_dpid is not None:
+    todo[force_dpid] = None
+  _dirty_ports.clear()
+  _unsynced.clear()
 
   # Connections born before this time are old enough that a complete
   # discovery cycle should have completed (and, thus, all of their
@@ -192,7 +254,7 @@ to be holding down changes.
   # Now modify ports as needed
   try:
     change_count = 0
-    for sw, ports in tree.iteritems():
+    for sw, port_nos in todo.iteritems():
       con = core.openflow.getConnection(sw)
       if con is None: continue  # Must have disconnected
       if con.connect_time is None: continue  # Not fully connected
@@ -204,12 +266,19 @@ to be holding down changes.
             # .. but we'll allow it anyway
             pass
           else:
+            if port_nos is None:
+              _unsynced.add(sw)
+            else:
+              _dirty_ports.update((sw, p) for p in port_nos)
             continue
 
-      tree_ports = [p[1] for p in ports]
-      for p in con.ports.itervalues():
-        if p.port_no < of.OFPP_MAX:
-          flood = p.port_no in tree_ports
+      if port_nos is None:
+        ports = con.ports.itervalues()
+      else:
+        ports = (con.ports.get(p) for p in port_nos)
+      for p in ports:
+        if p is not None and p.port_no < of.OFPP_MAX:
+          flood = spanning_forest.is_tree_port(sw, p.port_no)
           if not flood:
             if core.openflow_discovery.is_edge_port(sw, p.port_no) or \
                     core.openflow_discovery._is_broadcast_port(sw,p.port_no):
@@ -232,6 +301,7 @@ to be holding down changes.
       log.info("%i ports changed", change_count)
   except:
     _prev.clear()
+    _unsynced.update(todo)
     log.exception("Couldn't push spanning tree")
 
 
@@ -331,15 +401,12 @@ def _set_switches_clouds_sites():
   clouds_set = set()
   switches_set = set()
   sites_set = set()
-  cloud_g = nx.Graph()
-
-  for link in generator_for_link('broadcast'):
-    cloud_g.add_edge(Switch(link.dpid1, link.port1), Switch(link.dpid2, link.port2))
 
-  for clique in nx.find_cliques(cloud_g):
+  for ports in broadcast_segments:
     cloud = Cloud()
     clouds_set.add(cloud)
-    for sw in clique:
+    for dpid,port_number in ports:
+      sw = Switch(dpid, port_number)
       sw.cloud = cloud
       cloud.switches.add(sw)
       switches_set.add(sw)
@@ -447,7 +514,7 @@ def generator_for_link(link_type=None):
     log.debug('type is not correct')
     return None
   else:
-    return (l for l in core.openflow_discovery.adjacency if l.link_type is link_type)
+    return (l for l in core.openflow_discovery.adjacency.links_of_type(link_type))
 
 
 _dirty_switches = {}  # A map dpid_with_dirty_ports->Timer
@@ -455,8 +522,8 @@ _coalesce_period = 2  # Seconds to wait between features requests
 
 
 def _tag_broadcast_link(dpid,port_number):
-  for link in generator_for_link('broadcast'):
-    if ((dpid,port_number) == (link.dpid1,link.port1)) or ((dpid,port_number) == (link.dpid2, link.port2)):
+  for link in core.openflow_discovery.adjacency.links_at(dpid, port_number):
+    if link.link_type is 'broadcast':
       link.available = False
 
 
@@ -589,6 +656,7 @@ def launch(no_flood=False, hold_down=False):
     _hold_down = True
 
   def start_spanning_tree():
+    track_broadcast_segments()
     core.openflow.addListenerByName("ConnectionUp", _handle_ConnectionUp)
     core.openflow_discovery.addListenerByName("LinkEvent", _handle_LinkEvent,priority=100)
     log.debug("Spanning tree component ready")
@@ -363,7 +363,7 @@ class OFSyncFlowTable (EventMixin):
       if(command == OFSyncFlowTable.REMOVE):
         self._pending = [(cmd,pentry) for cmd,pentry in self._pending
                          if not (cmd == OFSyncFlowTable.ADD
-                                 and entry.matches_with_wildcards(pentry))]
+                                 and entry.match.covers(pentry.match))]
       elif(command == OFSyncFlowTable.REMOVE_STRICT):
         self._pending = [(cmd,pentry) for cmd,pentry in self._pending
                          if not (cmd == OFSyncFlowTable.ADD
@@ -429,8 +429,10 @@ class OFSyncFlowTable (EventMixin):
       for op in self._pending_barrier_to_ops[barrier.xid]:
         (command, entry) = op
         if(command == OFSyncFlowTable.ADD):
-          self.flow_table.add_entry(entry)
-          added.append(entry)
+          # A resync reinstalls entries which are already in the table
+          if entry not in self.flow_table:
+            self.flow_table.add_entry(entry)
+            added.append(entry)
         else:
           removed.extend(self.flow_table.remove_matching_entries(entry.match,
               entry.priority, strict=command == OFSyncFlowTable.REMOVE_STRICT))
@@ -0,0 +1,95 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.flow_hash import *
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.openflow.libopenflow_01 import ofp_match
+
+
+def flows (count):
+  return [ofp_match(dl_type = 0x800, nw_proto = 6,
+                    nw_src = IPAddr("10.0.%i.%i" % (i >> 8, i & 0xff)),
+                    nw_dst = IPAddr("10.1.0.1"),
+                    tp_src = 1024 + i, tp_dst = 80)
+          for i in range(count)]
+
+
+class FlowHashTest (unittest.TestCase):
+  def test_flow_key (self):
+    h = Rendezvous()
+    a,b = flows(2)
+    self.assertNotEqual(h.flow_key(a), h.flow_key(b))
+    self.assertEqual(h.flow_key(a), h.flow_key(flows(1)[0]))
+    # Non-IP falls back to the MACs
+    l2 = [ofp_match(dl_src = EthAddr("00:00:00:00:00:0%i" % (i,)),
+                    dl_dst = EthAddr("00:00:00:00:00:09"), dl_type = 0x806)
+          for i in (1,2)]
+    self.assertNotEqual(h.flow_key(l2[0]), h.flow_key(l2[1]))
+    # Configurable fields
+    h = Rendezvous(fields = "nw_dst,tp_dst")
+    self.assertEqual(h.flow_key(a), h.flow_key(b))
+
+  def _check (self, h, remap_limit):
+    keys = [h.flow_key(m) for m in flows(4000)]
+    paths = ["p%i" % (i,) for i in range(8)]
+    table = h.build(paths)
+    before = [h.select(table, k) for k in keys]
+    for p in paths:
+      share = before.count(p) / float(len(keys))
+      self.assertTrue(0.08 < share < 0.17, (p, share))
+
+    # Remove a path; (almost) only its flows should move
+    table = h.build(paths[1:])
+    after = [h.select(table, k) for k in keys]
+    moved = sum(1 for x,y in zip(before, after) if x != y and x != "p0")
+    self.assertTrue(moved <= remap_limit * len(keys), moved)
+    self.assertFalse("p0" in after)
+
+    # Weights
+    table = h.build(paths[:2], [1, 3])
+    picks = [h.select(table, k) for k in keys]
+    share = picks.count("p1") / float(len(keys))
+    self.assertTrue(0.7 < share < 0.8, share)
+
+  def test_rendezvous (self):
+    self._check(Rendezvous(), 0)
+
+  def test_rendezvous_extreme_hashes (self):
+    import pox.lib.flow_hash as flow_hash
+    h = Rendezvous()
+    table = h.build(["a", "b"], [1, 2])
+    mix64 = flow_hash._mix64
+    try:
+      for value in (0, flow_hash._M64):
+        flow_hash._mix64 = lambda x: value
+        self.assertTrue(h.select(table, 1) in ("a", "b"))
+    finally:
+      flow_hash._mix64 = mix64
+
+  def test_maglev (self):
+    self._check(Maglev(), 0.1)
+    self.assertRaises(RuntimeError, Maglev, table_size = 250)
+    self.assertEqual(len(Maglev().build(["a", "b"])), 251)
+
+  def test_get_flow_hash (self):
+    self.assertTrue(isinstance(get_flow_hash("maglev"), Maglev))
+    self.assertRaises(RuntimeError, get_flow_hash, "xor")
+
+
+if __name__ == '__main__':
+  unittest.main()
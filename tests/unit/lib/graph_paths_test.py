@@ -0,0 +1,161 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.graph.paths import ShortestPaths, PathMatrix, PathMap
+import pox.lib.graph.paths as paths
+
+
+def all_paths (sp):
+  """
+  Returns {(src,dst):set(paths)} for every reachable pair
+  """
+  r = {}
+  for s in sp.nodes:
+    for t in sp.distances(s):
+      r[(s,t)] = set(sp.paths(s, t))
+  return r
+
+
+class ShortestPathsTest (unittest.TestCase):
+  def test_paths (self):
+    sp = ShortestPaths()
+    for a,b in ((1,2), (2,4), (1,3), (3,4), (4,5)):
+      sp.add_link(a, b)
+    self.assertEqual(sp.distance(1, 5), 3)
+    self.assertEqual(sorted(sp.paths(1, 5)), [(1,2,4,5), (1,3,4,5)])
+    self.assertEqual(list(sp.paths(5, 5)), [(5,)])
+    sp.add_node(6)
+    self.assertEqual(sp.distance(1, 6), None)
+    self.assertEqual(list(sp.paths(1, 6)), [])
+
+    self.assertEqual(sp.count_paths(1, 5), 2)
+    self.assertEqual(sorted(sp.sample_paths(1, 5, 5)), [(1,2,4,5), (1,3,4,5)])
+    self.assertEqual(len(sp.sample_paths(1, 5, 1)), 1)
+
+    changes = sp.remove_link(2, 4)
+    self.assertEqual(sorted(sp.paths(1, 5)), [(1,3,4,5)])
+    self.assertTrue(5 in changes[1])
+    self.assertFalse(3 in changes.get(1, ()))
+
+  def test_sample_paths (self):
+    """ test bounded sampling on a fabric with many equal-cost paths """
+    sp = ShortestPaths()
+    # Five tiers of four switches, fully meshed between tiers
+    for tier in range(4):
+      for a in range(4):
+        for b in range(4):
+          sp.add_link((tier,a), (tier+1,b))
+    src,dst = (0,0),(4,0)
+    self.assertEqual(sp.count_paths(src, dst), 64)
+    every = set(sp.paths(src, dst))
+    self.assertEqual(len(every), 64)
+    self.assertEqual(set(sp.sample_paths(src, dst, 100)), every)
+    some = sp.sample_paths(src, dst, 8)
+    self.assertEqual(len(set(some)), 8)
+    self.assertTrue(set(some) <= every)
+    # Spread out: they don't all share the same hop at any tier
+    for tier in (1,2,3):
+      self.assertTrue(len(set(p[tier] for p in some)) > 1)
+
+  def test_random_updates (self):
+    """ compare incremental updates against recomputing from scratch """
+    rng = random.Random(1234)
+    nodes = range(16)
+    sp = ShortestPaths()
+    for n in nodes: sp.add_node(n)
+    before = all_paths(sp)
+    for i in range(200):
+      a,b = rng.sample(nodes, 2)
+      removed = None
+      if sp.has_link(a, b):
+        changes = sp.remove_link(a, b)
+      elif rng.random() < 0.03:
+        changes = sp.remove_node(a)
+        sp.add_node(a)
+        removed = a
+      else:
+        changes = sp.add_link(a, b)
+      after = all_paths(sp)
+
+      fresh = ShortestPaths()
+      for n in nodes: fresh.add_node(n)
+      for n in nodes:
+        for m in sp.neighbors(n): fresh.add_link(n, m)
+      fresh.recompute()
+      self.assertEqual(after, all_paths(fresh))
+
+      for pair in set(before) | set(after):
+        if pair[0] == removed: continue
+        if before.get(pair) != after.get(pair):
+          self.assertTrue(pair[1] in changes.get(pair[0], ()), pair)
+      before = after
+
+
+class PathMatrixTest (unittest.TestCase):
+  def random_graph (self, seed):
+    """
+    Returns an incrementally built ShortestPaths and its adjacency
+    """
+    rng = random.Random(seed)
+    sp = ShortestPaths()
+    for n in range(30): sp.add_node(n)
+    for i in range(45):
+      sp.add_link(*rng.sample(range(30), 2))
+    return sp, dict((n, list(sp.neighbors(n))) for n in range(30))
+
+  def check (self, use_numpy):
+    for seed in range(5):
+      sp,adj = self.random_graph(seed)
+      m = PathMatrix(adj, use_numpy = use_numpy)
+      for s in range(30):
+        self.assertEqual(m.distances(s), sp.distances(s))
+        for t in range(30):
+          d = sp.distance(s, t)
+          self.assertEqual(m.distance(s, t), d)
+          if d is None or s == t:
+            self.assertEqual(m.path(s, t), None if d is None else [s])
+            continue
+          firsts = sorted(set(p[1] for p in sp.paths(s, t)),
+                          key = m.index.get)
+          self.assertEqual(m.first_hops(s, t), firsts)
+          self.assertEqual(m.next_hop(s, t), firsts[0])
+          self.assertTrue(tuple(m.path(s, t)) in set(sp.paths(s, t)))
+
+  def test_python (self):
+    self.check(False)
+
+  @unittest.skipIf(paths.numpy is None, "NumPy isn't installed")
+  def test_numpy (self):
+    self.check(True)
+
+  def test_path_map (self):
+    pm = PathMap()
+    self.assertEqual(pm[1][2], (None, None))
+    pm.load(PathMatrix({1:[2], 2:[1,3], 3:[2]}, use_numpy = False))
+    self.assertEqual(pm[1][1], (0, None))
+    self.assertEqual(pm[1][2], (1, None))
+    self.assertEqual(pm[1][3], (2, 2))
+    self.assertEqual(pm[1][4], (None, None))
+    pm.clear()
+    self.assertIs(pm.matrix, None)
+    self.assertEqual(pm[1][3], (None, None))
+
+
+if __name__ == '__main__':
+  unittest.main()
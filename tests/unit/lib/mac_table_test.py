@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.mac_table import MacTable
+from pox.lib.addresses import EthAddr
+
+
+def mac (i):
+  return EthAddr("00:00:00:00:%02x:%02x" % (i >> 8, i & 0xff))
+
+
+class MacTableTest (unittest.TestCase):
+  def check (self, t):
+    """
+    Checks the reverse index against a scan of the table
+    """
+    expected = {}
+    for m,loc in t.iteritems():
+      expected.setdefault(loc, set()).add(m)
+    self.assertEqual(sorted(expected), sorted(t.locations))
+    for loc,macs in expected.iteritems():
+      self.assertEqual(t.macs_at(loc), macs)
+
+  def test_basic (self):
+    t = MacTable()
+    t[mac(1)] = ("s1", 1)
+    t[mac(2)] = ("s1", 1)
+    t[mac(3)] = ("s2", 4)
+    self.assertEqual(t.get(mac(1)), ("s1", 1))
+    self.assertEqual(t.macs_at(("s1", 1)), set([mac(1), mac(2)]))
+
+    # A host moves
+    t[mac(2)] = ("s2", 4)
+    self.assertEqual(t.macs_at(("s1", 1)), set([mac(1)]))
+    self.assertEqual(t.macs_at(("s2", 4)), set([mac(2), mac(3)]))
+
+    self.assertEqual(sorted(t.forget_location(("s2", 4))), [mac(2), mac(3)])
+    self.assertEqual(t.keys(), [mac(1)])
+    self.assertEqual(t.forget_location(("s2", 4)), ())
+    self.assertEqual(t.macs_at(("s2", 4)), frozenset())
+
+    self.assertEqual(t.pop(mac(1)), ("s1", 1))
+    self.assertEqual(t.pop(mac(1), None), None)
+    self.assertRaises(KeyError, t.pop, mac(1))
+    self.assertEqual(len(t), 0)
+    self.assertEqual(t.locations, [])
+
+  def test_random (self):
+    rng = random.Random(3)
+    t = MacTable()
+    for i in range(2000):
+      m = mac(rng.randrange(100))
+      op = rng.random()
+      if op < 0.6:
+        t[m] = ("s%i" % rng.randrange(5), rng.randrange(4))
+      elif op < 0.8:
+        t.pop(m, None)
+      elif op < 0.95:
+        if m in t: del t[m]
+      else:
+        t.forget_location(("s%i" % rng.randrange(5), rng.randrange(4)))
+    self.check(t)
+    self.check(t.copy())
+    t.clear()
+    self.check(t)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.lib.packet as pkt
+from pox.lib.packet.fields import PacketFields
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.openflow.libopenflow_01 import ofp_match
+
+_FIELDS = ('dl_src', 'dl_dst', 'dl_type', 'dl_vlan', 'dl_vlan_pcp',
+           'nw_src', 'nw_dst', 'nw_proto', 'nw_tos', 'tp_src', 'tp_dst')
+
+
+def _eth (payload, type, vlan=None):
+  e = pkt.ethernet(src=EthAddr("00:00:00:00:00:01"),
+                   dst=EthAddr("ff:ff:ff:ff:ff:ff"))
+  if vlan is not None:
+    v = pkt.vlan(id=vlan, pcp=3, eth_type=type)
+    v.payload = payload
+    e.type = pkt.ethernet.VLAN_TYPE
+    e.payload = v
+  else:
+    e.type = type
+    e.payload = payload
+  return e
+
+
+class PacketFieldsTest (unittest.TestCase):
+  def _check (self, e):
+    raw = e.pack()
+    f = PacketFields(raw)
+    m = ofp_match.from_packet(pkt.ethernet(raw))
+    for name in _FIELDS:
+      self.assertEqual(getattr(f, name), getattr(m, name), name)
+
+  def test_tcp (self):
+    ip = pkt.ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                  protocol=pkt.ipv4.TCP_PROTOCOL, tos=0x20)
+    ip.payload = pkt.tcp(srcport=1234, dstport=80, off=5)
+    self._check(_eth(ip, pkt.ethernet.IP_TYPE))
+
+  def test_vlan_udp (self):
+    ip = pkt.ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                  protocol=pkt.ipv4.UDP_PROTOCOL)
+    ip.payload = pkt.udp(srcport=53, dstport=5353)
+    self._check(_eth(ip, pkt.ethernet.IP_TYPE, vlan=42))
+
+  def test_arp (self):
+    a = pkt.arp(opcode=pkt.arp.REQUEST, hwsrc=EthAddr("00:00:00:00:00:01"),
+                protosrc=IPAddr("10.0.0.1"), protodst=IPAddr("10.0.0.2"))
+    self._check(_eth(a, pkt.ethernet.ARP_TYPE))
+
+  def test_runt (self):
+    f = PacketFields(b'\x00' * 10)
+    self.assertIsNone(f.dl_type)
+    self.assertIsNone(f.dl_src)
+    self.assertIsNone(f.nw_src)
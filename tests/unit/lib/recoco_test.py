@@ -0,0 +1,160 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import socket
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.lib.recoco.recoco as recoco
+from pox.lib.recoco.recoco import SelectHub
+
+
+class FakeClock (object):
+  def __init__ (self):
+    self.now = 0
+  def time (self):
+    return self.now
+
+
+class FakeScheduler (object):
+  _hasQuit = False
+  def __init__ (self):
+    self.woken = [] # (task, rv)
+  def fast_schedule (self, task):
+    self.woken.append((task, task.rv))
+
+
+class FakeTask (object):
+  def __init__ (self, name):
+    self.name = name
+    self.rv = None
+  def __repr__ (self):
+    return self.name
+
+
+class SelectHubTest (unittest.TestCase):
+  """
+  Drives an unthreaded SelectHub by hand with a fake clock
+
+  Each cycle pings the hub first, so select() never actually waits.
+  """
+  def setUp (self):
+    self.saved_time = recoco.time
+    self.clock = recoco.time = FakeClock()
+    self.scheduler = FakeScheduler()
+    self.hub = SelectHub(self.scheduler, threaded=False)
+    self.socks = []
+
+  def tearDown (self):
+    recoco.time = self.saved_time
+    for s in self.socks:
+      s.close()
+
+  def socketpair (self):
+    a,b = socket.socketpair()
+    self.socks += [a, b]
+    return a, b
+
+  def cycle (self, now = None):
+    """
+    Runs one pass of the hub, returning the tasks it woke
+    """
+    if now is not None: self.clock.now = now
+    self.hub._cycle()
+    self.hub._select(self.hub._tasks, {})
+    woken = self.scheduler.woken
+    self.scheduler.woken = []
+    return woken
+
+  def test_timer_order (self):
+    tasks = [FakeTask(str(i)) for i in range(5)]
+    deadlines = [3, 1, 4, 2, 100]
+    for t,d in zip(tasks, deadlines):
+      self.hub.registerTimer(t, d, timeIsAbsolute = True)
+    woken = self.cycle(10)
+    self.assertEqual([t for t,rv in woken],
+                     [tasks[1], tasks[3], tasks[0], tasks[2]])
+    self.assertEqual(woken[0][1], ([],[],[]))
+    self.assertEqual(self.cycle(99), [])
+    self.assertEqual([t for t,rv in self.cycle(100)], [tasks[4]])
+    self.assertEqual(self.hub._next_timer(), None)
+
+  def test_stale_timers (self):
+    a,b = self.socketpair()
+    rescheduled = FakeTask("rescheduled")
+    cancelled = FakeTask("cancelled")
+    other = FakeTask("other") # Keeps the stale entries off the top
+    self.hub.registerTimer(other, 5, timeIsAbsolute = True)
+    self.hub.registerSelect(rescheduled, [a], timeout = 10,
+                            timeIsAbsolute = True)
+    self.hub.registerSelect(cancelled, [b], timeout = 10,
+                            timeIsAbsolute = True)
+    self.assertEqual(self.cycle(), [])
+
+    # Both are woken by IO before their timeouts...
+    a.send(b'x')
+    b.send(b'x')
+    woken = self.cycle()
+    self.assertEqual(dict(woken), {rescheduled:([a],[],[]),
+                                   cancelled:([b],[],[])})
+    a.recv(1)
+    b.recv(1)
+
+    # ...and one waits again with a later deadline
+    self.hub.registerTimer(rescheduled, 20, timeIsAbsolute = True)
+    self.assertEqual(self.cycle(), [])
+    self.assertEqual(len(self.hub._timers), 4)
+
+    # The old entries are skipped
+    self.assertEqual([t for t,rv in self.cycle(15)], [other])
+    self.assertEqual([t for t,rv in self.cycle(20)], [rescheduled])
+    self.assertEqual(self.hub._timers, [])
+
+  def test_fd_interest (self):
+    a,b = self.socketpair()
+    hub = self.hub
+    t1 = FakeTask("t1")
+    t2 = FakeTask("t2")
+    hub.registerSelect(t1, [a])
+    hub.registerSelect(t2, [b], [b])
+    self.cycle()
+    self.assertEqual(hub._rl, {a:t1, b:t2})
+    self.assertEqual(hub._wl, {b:t2})
+
+    # t2 is woken by b being writable, and goes away
+    self.assertEqual(self.cycle(), [(t2, ([],[b],[]))])
+    self.assertEqual(hub._wl, {})
+    self.assertEqual(hub._rl, {a:t1})
+    self.cycle()
+    self.assertEqual(hub._fd_lists, ([a, hub._pinger], [], []))
+
+    # t1 is woken by a being readable, and comes back to write to it
+    b.send(b'x')
+    self.assertEqual(self.cycle(), [(t1, ([a],[],[]))])
+    a.recv(1)
+    hub.registerSelect(t1, None, [a])
+    self.assertEqual(self.cycle(), [])
+    self.assertEqual(hub._fd_lists, None)
+    self.assertEqual(hub._rl, {})
+    self.assertEqual(hub._wl, {a:t1})
+    self.assertEqual(self.cycle(), [(t1, ([],[a],[]))])
+    self.assertEqual(hub._rl, {})
+    self.assertEqual(hub._wl, {})
+    self.cycle()
+    self.assertEqual(hub._fd_lists, ([hub._pinger], [], []))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.revent import *
+
+
+class Ping (Event):
+  def __init__ (self, n = 0):
+    self.n = n
+
+class Pong (Event):
+  pass
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping, Pong])
+
+
+class ReventTest (unittest.TestCase):
+  def test_no_listeners (self):
+    s = Source()
+    self.assertEqual(s.raiseEvent(Ping, 1), None)
+    e = Pong()
+    self.assertTrue(s.raiseEvent(e) is e)
+
+  def test_undefined_event (self):
+    s = Source()
+    self.assertRaises(ReventError, s.addListener, Event, lambda e: None)
+    self.assertRaises(ReventError, s.raiseEvent, Event())
+
+  def test_args_and_priority (self):
+    s = Source()
+    seen = []
+    s.addListener(Ping, lambda e: seen.append(('a', e.n)))
+    s.addListener(Ping, lambda e: seen.append(('b', e.n)), priority = 5)
+    s.addListener(Ping, lambda e: seen.append(('c', e.n)), priority = 1)
+    e = s.raiseEvent(Ping, 3)
+    self.assertEqual(e.n, 3)
+    self.assertEqual(seen, [('b',3), ('c',3), ('a',3)])
+
+  def test_halt_and_remove (self):
+    s = Source()
+    seen = []
+    def h (name, rv):
+      def handler (event):
+        seen.append(name)
+        return rv
+      return handler
+    s.addListener(Ping, h('once', None), once = True)
+    s.addListener(Ping, h('remove', EventRemove))
+    s.addListener(Ping, h('false', False))
+    s.addListener(Ping, h('halt', EventHalt))
+    s.addListener(Ping, h('never', None))
+    self.assertTrue(s.raiseEvent(Ping).halt)
+    self.assertEqual(seen, ['once', 'remove', 'false', 'halt'])
+    del seen[:]
+    s.raiseEvent(Ping)
+    self.assertEqual(seen, ['halt'])
+    s.addListener(Pong, h('hr', EventHaltAndRemove), priority = 1)
+    s.addListener(Pong, h('pong', True))
+    s.raiseEvent(Pong)
+    s.raiseEvent(Pong)
+    self.assertEqual(seen, ['halt', 'hr', 'pong'])
+
+  def test_changes_during_raise (self):
+    s = Source()
+    seen = []
+    def first (event):
+      seen.append(1)
+      s.removeListener(second)
+      s.addListener(Ping, lambda e: seen.append(3))
+    def second (event):
+      seen.append(2)
+    s.addListener(Ping, first)
+    s.addListener(Ping, second)
+    s.raiseEvent(Ping)
+    self.assertEqual(seen, [1, 2])
+    s.removeListener(first)
+    s.raiseEvent(Ping)
+    self.assertEqual(seen, [1, 2, 3])
+
+  def test_remove_listener (self):
+    s = Source()
+    f = lambda e: None
+    l1 = s.addListener(Ping, f)
+    l2 = s.addListener(Pong, f)
+    self.assertEqual(s._eventMixin_get_listener_count(), 2)
+    self.assertTrue(s.removeListener(l1))
+    self.assertFalse(s.removeListener(l1))
+    self.assertTrue(s.removeListener(l2[1], Pong))
+    s.addListener(Ping, f)
+    s.addListener(Pong, f)
+    self.assertTrue(s.removeListener(f))
+    self.assertEqual(s._eventMixin_get_listener_count(), 0)
+
+  def test_has_listener (self):
+    s = Source()
+    self.assertFalse(s.hasListener(Ping))
+    l = s.addListener(Ping, lambda e: None)
+    self.assertTrue(s.hasListener(Ping))
+    self.assertFalse(s.hasListener(Pong))
+    s.removeListener(l)
+    self.assertFalse(s.hasListener(Ping))
+
+
+if __name__ == '__main__':
+  unittest.main()
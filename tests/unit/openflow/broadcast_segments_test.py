@@ -0,0 +1,104 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.broadcast_segments import BroadcastSegments
+from pox.openflow.discovery import Link, LinkEvent
+
+
+def link (a, b, link_type = 'broadcast'):
+  return Link(a[0], a[1], b[0], b[1], link_type, True)
+
+
+def components (links):
+  """
+  Connected groups of ports, found the slow way
+  """
+  adj = {}
+  for l in links:
+    a,b = l.end
+    adj.setdefault(a, set()).add(b)
+    adj.setdefault(b, set()).add(a)
+  r = []
+  seen = set()
+  for p in adj:
+    if p in seen: continue
+    group = set([p])
+    todo = [p]
+    while todo:
+      for q in adj[todo.pop()]:
+        if q not in group:
+          group.add(q)
+          todo.append(q)
+    seen |= group
+    r.append(sorted(group))
+  return sorted(r)
+
+
+class BroadcastSegmentsTest (unittest.TestCase):
+  def test_basic (self):
+    s = BroadcastSegments()
+    a,b,c,d = (1,1),(2,1),(3,1),(4,2)
+    self.assertTrue(s.add_link(link(a, b)))
+    self.assertFalse(s.add_link(link(b, a))) # Other direction
+    self.assertTrue(s.add_link(link(c, d)))
+    self.assertEqual(len(s), 2)
+    self.assertTrue(s.add_link(link(b, c)))
+    self.assertEqual(s.segment_of(a), set([a, b, c, d]))
+    self.assertEqual(len(s.links_at(b)), 3)
+
+    # Still joined the other way
+    self.assertFalse(s.remove_link(link(a, b)))
+    self.assertTrue(s.remove_link(link(b, a)))
+    self.assertFalse(a in s)
+    self.assertEqual(s.segment_of(b), set([b, c, d]))
+    self.assertTrue(s.remove_link(link(b, c)))
+    self.assertEqual(sorted(s), [set([c, d])])
+    self.assertFalse(s.remove_link(link(b, c)))
+
+  def test_link_event (self):
+    s = BroadcastSegments()
+    a,b = (1,1),(2,1)
+    self.assertFalse(s.link_event(LinkEvent(True, link(a, b, 'lldp'))))
+    self.assertTrue(s.link_event(LinkEvent(True, link(a, b))))
+    self.assertFalse(s.link_event(LinkEvent(True, link(a, b))))
+    # Removals count whatever their type
+    self.assertTrue(s.link_event(LinkEvent(False, link(a, b, 'lldp'))))
+    self.assertEqual(len(s), 0)
+
+  def test_random (self):
+    rng = random.Random(7)
+    ports = [(d, p) for d in range(1, 7) for p in range(1, 3)]
+    s = BroadcastSegments()
+    links = set()
+    for i in range(600):
+      l = link(*rng.sample(ports, 2))
+      if l in links and rng.random() < 0.6:
+        links.discard(l)
+        s.remove_link(l)
+      else:
+        links.add(l)
+        s.add_link(l)
+      self.assertEqual(sorted(sorted(x) for x in s), components(links))
+      for group in s:
+        for p in group:
+          self.assertIs(s.segment_of(p), group)
+
+
+if __name__ == '__main__':
+  unittest.main()
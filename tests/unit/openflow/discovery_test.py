@@ -0,0 +1,294 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+import struct
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.openflow.discovery as discovery
+from pox.openflow.discovery import Link, LinkTable, LLDPAndBroadcastSender
+from pox.openflow.discovery import Discovery, LinkEvent, _parse_probe
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+
+
+def link (d1, p1, d2, p2, link_type = 'lldp'):
+  return Link(d1, p1, d2, p2, link_type, True)
+
+
+class LinkTableTest (unittest.TestCase):
+  def check (self, t):
+    """
+    Checks the indexes against scans of the table
+    """
+    for l in t:
+      for d,p in l.end:
+        self.assertTrue(l in t.links_at(d, p))
+        self.assertTrue(l in t.links_on(d))
+      self.assertTrue(l in t.links_of_type(l.link_type))
+    for index in (t._at, t._on, t._by_type):
+      for links in index.itervalues():
+        self.assertTrue(links)
+        for l in links:
+          self.assertTrue(l in t)
+
+  def test_basic (self):
+    t = LinkTable()
+    a = link(1, 1, 2, 1)
+    b = link(2, 2, 3, 1, 'broadcast')
+    t[a] = 1
+    t[b] = 2
+    t[link(1, 1, 2, 1)] = 3 # Just a new timestamp
+    self.assertEqual(t[a], 3)
+    self.assertEqual(t.links_at(2, 1), set([a]))
+    self.assertEqual(t.links_on(2), set([a, b]))
+    self.assertEqual(t.links_of_type('broadcast'), set([b]))
+    self.assertEqual(t.links_at(4, 1), frozenset())
+
+    # Replacing a link with one of another type, as discovery does
+    del t[link(2, 2, 3, 1, 'lldp')]
+    t[link(2, 2, 3, 1, 'lldp')] = 4
+    self.assertEqual(t.links_of_type('broadcast'), frozenset())
+    self.assertEqual(len(t.links_of_type('lldp')), 2)
+
+    self.assertEqual(t.pop(a), 3)
+    self.assertEqual(t.pop(a, None), None)
+    self.assertRaises(KeyError, t.pop, a)
+    self.assertEqual(t.links_on(1), frozenset())
+    self.check(t)
+
+  def test_random (self):
+    rng = random.Random(5)
+    t = LinkTable()
+    for i in range(1000):
+      d1,d2 = rng.sample(range(1, 6), 2)
+      l = link(d1, rng.randrange(1, 3), d2, rng.randrange(1, 3),
+               rng.choice(('lldp', 'broadcast')))
+      if l in t and rng.random() < 0.5:
+        del t[l]
+      else:
+        t[l] = i
+    self.check(t)
+    self.check(t.copy())
+    t.clear()
+    self.check(t)
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.sent = []
+  def sendToDPID (self, dpid, data):
+    self.sent.append((dpid, data))
+
+
+class LLDPAndBroadcastSenderTest (unittest.TestCase):
+  def setUp (self):
+    self.old = core.components.get('openflow')
+    self.openflow = core.components['openflow'] = FakeOpenFlow()
+    self.sender = LLDPAndBroadcastSender(1)
+    self.slots = len(self.sender._slots)
+
+  def tearDown (self):
+    if self.old is None:
+      del core.components['openflow']
+    else:
+      core.components['openflow'] = self.old
+
+  def add (self, dpid, ports):
+    for p in ports:
+      self.sender.add_port(dpid, p, EthAddr("02:00:00:00:00:%02x" % p),
+                           set_timer = False)
+
+  def cycle (self):
+    """
+    Runs a whole cycle, returning {dpid:[ports in each write]}
+    """
+    del self.openflow.sent[:]
+    for i in range(self.slots):
+      self.sender._timer_handler()
+    r = {}
+    for dpid,data in self.openflow.sent:
+      msgs = 0
+      while data:
+        self.assertEqual(ord(data[1]), of.OFPT_PACKET_OUT)
+        data = data[struct.unpack("!H", data[2:4])[0]:]
+        msgs += 1
+      self.assertEqual(msgs % 2, 0) # LLDP and broadcast for each port
+      r.setdefault(dpid, []).append(msgs // 2)
+    return r
+
+  def test_cycle (self):
+    self.add(1, range(1, 4))
+    sent = self.cycle()
+    self.assertEqual(sum(sent[1]), 3)
+
+    self.add(2, range(1, 2 * self.slots + 1))
+    sent = self.cycle()
+    self.assertEqual(sum(sent[2]), 2 * self.slots)
+    # Spread over the cycle, and coalesced within slots
+    self.assertTrue(self.slots // 2 <= len(sent[2]) < 2 * self.slots)
+    self.assertEqual(sum(sent[1]), 3)
+
+    self.sender.del_port(2, 5, set_timer = False)
+    self.sender.add_port(2, 5, EthAddr("02:00:00:00:00:05"),
+                         set_timer = False) # Re-adding doesn't duplicate
+    self.sender.del_switch(1, set_timer = False)
+    self.sender.add_port(3, of.OFPP_LOCAL, EthAddr("02:00:00:00:00:ff"),
+                         set_timer = False)
+    sent = self.cycle()
+    self.assertEqual(sorted(sent), [2])
+    self.assertEqual(sum(sent[2]), 2 * self.slots)
+
+    self.sender.del_switch(2, set_timer = False)
+    self.assertEqual(self.cycle(), {})
+    self.assertEqual(self.sender._slot_sizes, [0] * self.slots)
+
+
+class ProbeParseTest (unittest.TestCase):
+  addr = EthAddr("02:00:00:00:00:01")
+
+  def test_own_probes (self):
+    for dpid,port in ((1, 1), (0xabcdef123456, 65534), (2**63 + 5, 12)):
+      for make in (LLDPAndBroadcastSender._create_discovery_packet,
+                   LLDPAndBroadcastSender._create_broadcast_discovery_packet):
+        raw = make(dpid, port, self.addr, 120).pack()
+        self.assertEqual(_parse_probe(raw), (dpid, port))
+        self.assertEqual(Discovery._parse_lldp(pkt.ethernet(raw)),
+                         (dpid, port))
+        for i in range(len(raw) - 2): # All but the end TLV is needed
+          self.assertEqual(_parse_probe(raw[:i]), None)
+
+  def test_foreign_lldp (self):
+    """ other LLDP goes to the full parser """
+    eth = LLDPAndBroadcastSender._create_discovery_packet(5, 3, self.addr,
+                                                          120)
+    lldph = eth.payload
+    lldph.tlvs[0] = pkt.chassis_id(subtype = pkt.chassis_id.SUB_MAC,
+                                   id = '\x00\x00\x00\x00\x00\x05')
+    del lldph.tlvs[3] # No system description
+    raw = eth.pack()
+    self.assertEqual(_parse_probe(raw), None)
+    self.assertEqual(Discovery._parse_lldp(pkt.ethernet(raw)), (5, 3))
+
+    eth = LLDPAndBroadcastSender._create_discovery_packet(5, 3, self.addr,
+                                                          120)
+    vlan = pkt.vlan(id = 10, eth_type = eth.type, next = eth.payload)
+    eth.type = pkt.ethernet.VLAN_TYPE
+    eth.payload = vlan
+    raw = eth.pack()
+    self.assertEqual(_parse_probe(raw), None)
+    self.assertEqual(Discovery._parse_lldp(pkt.ethernet(raw)), (5, 3))
+    self.assertEqual(_parse_probe("x" * 100), None)
+
+
+class FakePacketIn (object):
+  """
+  Just enough of a PacketIn for Discovery to take a probe from it
+  """
+  class ofp (object):
+    buffer_id = None
+
+  def __init__ (self, eth, dpid, port):
+    self.parsed = eth
+    self.data = eth.pack()
+    self.fields = eth
+    eth.dl_type = eth.type
+    eth.dl_dst = eth.dst
+    self.dpid = dpid
+    self.port = port
+
+
+class FakeConnections (object):
+  def __init__ (self, dpids):
+    self.connections = set(dpids)
+
+
+class FakeClock (object):
+  def __init__ (self):
+    self.now = 1000.0
+  def time (self):
+    return self.now
+
+
+class LinkExpiryTest (unittest.TestCase):
+  def setUp (self):
+    self.clock = discovery.time = FakeClock()
+    self.discovery = Discovery(install_flow = False)
+    self.removed = []
+    self.discovery.addListener(LinkEvent,
+                               lambda e: self.removed.append(e.link))
+
+  def tearDown (self):
+    discovery.time = time
+
+  def test_expire (self):
+    d = self.discovery
+    dead = link(1, 1, 2, 1)
+    refreshed = link(2, 1, 1, 1)
+    gone = link(1, 2, 3, 1)
+    for l in (dead, refreshed, gone):
+      d._refresh_link(l)
+    self.clock.now += d._link_timeout / 2.0
+    for i in range(100):
+      d._refresh_link(link(4, i, 5, i))
+    d._refresh_link(refreshed)
+    d._delete_links([gone])
+    del self.removed[:]
+
+    self.clock.now += d._link_timeout / 2.0 + 1
+    d._expire_links()
+    self.assertEqual(self.removed, [dead])
+    self.assertEqual(set(d.adjacency), set([refreshed] +
+                     [link(4, i, 5, i) for i in range(100)]))
+    self.assertEqual(d.expired_links, 1)
+    self.assertEqual(d.expiry_checks, 1) # Live links weren't looked at
+    self.assertTrue(0 < d.last_expiry_latency <= d._timeout_check_period)
+
+    # Removed without going through discovery
+    del d.adjacency[refreshed]
+    self.clock.now += d._link_timeout
+    d._expire_links()
+    self.assertEqual(d.expired_links, 101)
+    self.assertEqual(d._expiry_wheel, {})
+    self.assertEqual(d._expiry_slot, {})
+
+  def test_type_swap (self):
+    """ a broadcast link that turns out to be LLDP expires as LLDP """
+    d = self.discovery
+    old = core.components.get('openflow')
+    core.components['openflow'] = FakeConnections([1, 2])
+    try:
+      addr = EthAddr("02:00:00:00:00:01")
+      make = LLDPAndBroadcastSender._create_broadcast_discovery_packet
+      d._handle_openflow_PacketIn(FakePacketIn(make(1, 1, addr, 120), 2, 1))
+      self.clock.now += 0.1 # Same slot of the wheel
+      make = LLDPAndBroadcastSender._create_discovery_packet
+      d._handle_openflow_PacketIn(FakePacketIn(make(1, 1, addr, 120), 2, 1))
+    finally:
+      core.components['openflow'] = old
+    events = []
+    d.addListener(LinkEvent,
+                  lambda e: events.append((e.added, e.link.link_type)))
+    self.clock.now += d._link_timeout + d._timeout_check_period
+    d._expire_links()
+    self.assertEqual(events, [(False, 'lldp')])
+    self.assertEqual(len(d.adjacency), 0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.flow_index import *
+from pox.openflow.path_install import PathInstaller
+import pox.openflow.libopenflow_01 as of
+from tests.unit.openflow.install_fakes import *
+
+
+class FakeFlowRemoved (object):
+  def __init__ (self, cookie, dpid, in_port, timeout = True):
+    self.ofp = of.ofp_flow_removed(cookie = cookie,
+                                   match = of.ofp_match(in_port = in_port))
+    self.dpid = dpid
+    self.timeout = timeout
+
+
+class FakeLink (object):
+  def __init__ (self, dpid1, port1, dpid2, port2):
+    self.dpid1 = dpid1
+    self.port1 = port1
+    self.dpid2 = dpid2
+    self.port2 = port2
+
+
+class FlowIndexTest (unittest.TestCase):
+  def setUp (self):
+    self.s = dict((i, FakeSwitch(i)) for i in range(1, 5))
+    self.index = FlowIndex(idle_timeout = 10, hard_timeout = 30)
+    self.match = of.ofp_match(dl_type = 0x800, nw_proto = 6, tp_dst = 80)
+
+  def path (self, *hops):
+    return [(self.s[d], i, o) for d,i,o in hops]
+
+  def test_flows_on_link (self):
+    s = self.s
+    a = self.index.add(self.match, "a", self.path((1,5,1), (2,1,2), (4,1,5)))
+    b = self.index.add(self.match, "b", self.path((4,5,1), (2,2,1), (1,1,5)))
+    c = self.index.add(self.match, "c", self.path((1,6,2), (3,1,2), (4,2,6)))
+    self.assertEqual(len(self.index), 3)
+    self.assertEqual(self.index.hop_count, 9)
+    self.assertNotEqual(a.cookie, b.cookie)
+
+    # The 2-4 link is port 2 on s2 and port 1 on s4
+    on = self.index.flows_on_link(2, 2, 4, 1)
+    self.assertEqual(sorted(f.route for f in on), ["a", "b"])
+    self.assertEqual(self.index.flows_on_port(3, 2), [c])
+    self.assertEqual(self.index.flows_on_port(3, 1), [])
+
+    self.index.remove(b)
+    self.assertEqual(self.index.flows_on_link(2, 2, 4, 1), [a])
+    self.assertEqual(self.index.hop_count, 6)
+
+  def test_reroute (self):
+    s = self.s
+    a = self.index.add(self.match, "a", self.path((1,5,1), (2,1,2), (4,1,5)))
+    msgs = self.index.reroute(a, self.path((1,5,2), (3,1,2), (4,2,5)))
+    # s1 just changes its output, s2's entry goes, s3 gets a new one, and
+    # s4 gets a new one for the new in_port while the old one goes
+    r = [(sw.dpid, m.command, m.match.in_port,
+          [x.port for x in m.actions]) for sw,m in msgs]
+    self.assertEqual(sorted(r), [
+        (1, of.OFPFC_ADD, 5, [2]),
+        (2, of.OFPFC_DELETE_STRICT, 1, []),
+        (3, of.OFPFC_ADD, 1, [2]),
+        (4, of.OFPFC_ADD, 2, [5]),
+        (4, of.OFPFC_DELETE_STRICT, 1, []),
+    ])
+    for sw,m in msgs:
+      self.assertEqual(m.cookie, a.cookie)
+      if m.command == of.OFPFC_ADD:
+        self.assertEqual(m.flags, of.OFPFF_SEND_FLOW_REM)
+        self.assertEqual(m.hard_timeout, 30)
+
+    self.assertEqual(self.index.flows_on_link(2, 2, 4, 1), [])
+    self.assertEqual(self.index.flows_on_port(3, 2), [a])
+
+    # No path at all removes it everywhere
+    msgs = self.index.reroute(a, ())
+    self.assertEqual(len(msgs), 3)
+    self.assertTrue(all(m.command == of.OFPFC_DELETE_STRICT
+                        for sw,m in msgs))
+    self.assertEqual(len(self.index), 0)
+    self.assertEqual(self.index.hop_count, 0)
+    self.assertEqual(self.index.reroute(a, ()), [])
+
+  def test_flow_removed (self):
+    a = self.index.add(self.match, "a", self.path((1,5,1), (2,1,5)))
+    removed = self.index.flow_removed
+    self.assertIs(removed(FakeFlowRemoved(a.cookie, 1, 5, False)), None)
+    self.assertTrue(a in self.index)
+
+    # One hop timing out leaves the other indexed
+    self.assertIs(removed(FakeFlowRemoved(a.cookie, 1, 5)), None)
+    self.assertTrue(a in self.index)
+    self.assertEqual(self.index.flows_on_port(1, 1), [])
+    self.assertEqual(self.index.flows_on_port(2, 5), [a])
+    self.assertEqual(self.index.hop_count, 1)
+    self.assertIs(removed(FakeFlowRemoved(a.cookie, 1, 5)), None) # Again
+
+    self.assertIs(removed(FakeFlowRemoved(a.cookie, 2, 1)), a)
+    self.assertFalse(a in self.index)
+    self.assertEqual(self.index.flows_on_port(2, 5), [])
+    self.assertEqual(self.index.hop_count, 0)
+
+  def test_expire (self):
+    a = self.index.add(self.match, "a", self.path((1,5,1), (2,1,5)))
+    b = self.index.add(self.match, "b", self.path((1,6,1), (2,1,6)))
+    a.expires_at = 0
+    self.assertEqual(self.index.flows_on_port(1, 1), [b])
+    self.assertEqual(self.index.expire(), 0)
+    self.assertEqual(self.index.expire(time.time() + 31), 1)
+    self.assertEqual(len(self.index), 0)
+    self.assertEqual(self.index._deadlines, [])
+
+  def test_reroute_flows (self):
+    a = self.index.add(self.match, "a", self.path((1,5,1), (2,1,2), (4,1,5)))
+    b = self.index.add(self.match, "b", self.path((1,6,2), (3,1,2), (4,2,6)))
+    flushes = []
+    installer = PathInstaller(defer = flushes.append)
+    app = FakeApp()
+    new = {"a" : self.path((1,5,2), (3,1,2), (4,2,5))}
+    moved = reroute_flows(app, self.index, installer, FakeLink(2,2,4,1),
+                          lambda flow: new.get(flow.route), 4)
+    self.assertEqual(moved, 1)
+    self.assertEqual(app.reroutes, 1)
+    self.assertEqual(app.rerouted_flows, 1)
+    self.assertEqual(app.reroute_flow_mods, 5)
+    self.assertEqual(app.reroute_full_clear_flow_mods, 6 + 4)
+
+    for f in flushes: f()
+    for dpid in (1, 2, 3, 4):
+      con = self.s[dpid].connection
+      self.assertIsInstance(con.sent[-1], of.ofp_barrier_request)
+      installer.barrier_in(FakeBarrierIn(dpid, con.sent[-1].xid))
+    self.assertIsNot(app.last_convergence_time, None)
+    self.assertEqual(sorted(f.route for f in
+                            self.index.flows_on_port(3, 2)), ["a", "b"])
+
+    # Nothing uses the link any more
+    self.assertEqual(reroute_flows(app, self.index, installer,
+                                   FakeLink(2,2,4,1), None, 4), 0)
+    self.assertEqual(app.reroutes, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -111,7 +111,40 @@ class FlowTableTest(unittest.TestCase):
       t.remove_expired_entries(now=time)
       self.assertEqual(sorted([e.cookie for e in t.entries]), remaining)
 
-  # def test_check_for_overlap_entries(self):
+  def test_entry_for_packet(self):
+    """ test that lookups find the best entry across different masks """
+    import pox.lib.packet as pkt
+    e = pkt.ethernet(src=EthAddr("00:00:00:00:00:01"), dst=EthAddr("00:00:00:00:00:02"), type=pkt.ethernet.IP_TYPE)
+    ip = pkt.ipv4(srcip=IPAddr("1.2.3.4"), dstip=IPAddr("1.2.3.5"), protocol=pkt.ipv4.UDP_PROTOCOL)
+    ip.payload = pkt.udp(srcport=1234, dstport=53)
+    e.payload = ip
+    packet = pkt.ethernet(e.pack())
+
+    t = FlowTable()
+    self.assertEqual(t.entry_for_packet(packet, 1), None)
+    t.add_entry(TableEntry(priority=1, cookie=0x1, match=ofp_match()))
+    t.add_entry(TableEntry(priority=5, cookie=0x2, match=ofp_match(dl_type=0x800, nw_src="1.2.3.0/24")))
+    t.add_entry(TableEntry(priority=5, cookie=0x3, match=ofp_match(dl_type=0x800, nw_src="1.2.4.0/24")))
+    t.add_entry(TableEntry(priority=9, cookie=0x4, match=ofp_match(dl_type=0x806)))
+    self.assertEqual(t.entry_for_packet(packet, 1).cookie, 0x2)
+    # newer entries win among equal priorities
+    t.add_entry(TableEntry(priority=5, cookie=0x5, match=ofp_match(dl_type=0x800, nw_proto=17)))
+    self.assertEqual(t.entry_for_packet(packet, 1).cookie, 0x5)
+    # exact matches beat everything
+    t.add_entry(TableEntry(priority=0, cookie=0x6, match=ofp_match.from_packet(packet, 1)))
+    self.assertEqual(t.entry_for_packet(packet, 1).cookie, 0x6)
+    self.assertEqual(t.entry_for_packet(packet, 2).cookie, 0x5)
+    t.remove_matching_entries(ofp_match(dl_type=0x800), strict=False)
+    self.assertEqual(t.entry_for_packet(packet, 1).cookie, 0x1)
+    self.assertEqual([e.cookie for e in t._table], [4, 1])
+
+  def test_check_for_overlapping_entry(self):
+    t = FlowTable()
+    t.add_entry(TableEntry(priority=5, match=ofp_match(dl_type=0x800, nw_src="1.2.3.0/24")))
+    self.assertTrue(t.check_for_overlapping_entry(TableEntry(priority=5, match=ofp_match(dl_type=0x800, nw_src="1.2.3.4"))))
+    self.assertTrue(t.check_for_overlapping_entry(TableEntry(priority=5, match=ofp_match(dl_type=0x800))))
+    self.assertFalse(t.check_for_overlapping_entry(TableEntry(priority=6, match=ofp_match(dl_type=0x800))))
+    self.assertFalse(t.check_for_overlapping_entry(TableEntry(priority=5, match=ofp_match(dl_type=0x800, nw_src="1.2.4.0/24"))))
 
 
 
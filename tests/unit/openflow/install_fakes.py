@@ -0,0 +1,58 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Fakes shared by the path_install and flow_index tests
+"""
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.sent = []
+  def send (self, msg):
+    self.sent.append(msg)
+
+
+class FakeSwitch (object):
+  """
+  An l2_multi-style Switch, with a FakeConnection unless given one
+  """
+  def __init__ (self, dpid, connection = None):
+    self.dpid = dpid
+    if connection is None: connection = FakeConnection(dpid)
+    self.connection = connection
+  def __repr__ (self):
+    return "s%s" % (self.dpid,)
+
+
+class FakeBarrierIn (object):
+  def __init__ (self, dpid, xid):
+    self.dpid = dpid
+    self.xid = xid
+
+
+class FakeApp (object):
+  """
+  Has the counters path_install and flow_index update, and keeps events
+  """
+  def __init__ (self):
+    self.events = []
+    self.redundant_installs_avoided = 0
+    self.held_packets_dropped = 0
+    self.reroutes = 0
+    self.rerouted_flows = 0
+    self.reroute_flow_mods = 0
+    self.reroute_full_clear_flow_mods = 0
+    self.last_convergence_time = None
+  def raiseEvent (self, event):
+    self.events.append(event)
@@ -135,6 +135,39 @@ class ofp_match_test(unittest.TestCase):
     assertMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.127"))
     assertNoMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.128"))
 
+  def test_overlaps(self):
+    """ ofp_match: test the overlaps method """
+    a = ofp_match(dl_type=0x800, nw_src="10.0.0.0/8")
+    b = ofp_match(dl_type=0x800, nw_dst="11.0.0.1", tp_dst=80)
+    self.assertTrue(a.overlaps(b))
+    self.assertTrue(b.overlaps(a))
+    self.assertFalse(a.covers(b))
+    self.assertFalse(b.covers(a))
+
+    b.nw_src = "10.1.0.0/16"
+    self.assertTrue(a.overlaps(b))
+    self.assertTrue(a.covers(b))
+
+    # changing a field must drop the cached compiled form
+    b.nw_src = "12.0.0.0/16"
+    self.assertFalse(a.overlaps(b))
+    b.nw_src = None
+    self.assertTrue(a.overlaps(b))
+    a.dl_type = 0x806
+    self.assertFalse(a.overlaps(b))
+
+  def test_extra_attributes(self):
+    """ ofp_match: applications can still set their own attributes """
+    import pickle
+    m = ofp_match(in_port=1, dl_type=0x800, nw_src="10.0.0.0/8")
+    m.app_note = "hello"
+    self.assertEqual(m.app_note, "hello")
+    m2 = pickle.loads(pickle.dumps(m))
+    self.assertEqual(m2.app_note, "hello")
+    self.assertEqual(m2, m)
+    self.assertEqual(m2.compiled, m.compiled)
+    self.assertEqual(m2.nw_src, IPAddr("10.0.0.0"))
+
 class ofp_command_test(unittest.TestCase):
   # custom map of POX class to header type, for validation
   ofp_type = {
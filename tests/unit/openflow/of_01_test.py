@@ -0,0 +1,390 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import socket
+import select
+import struct
+import threading
+import logging
+from errno import EAGAIN
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.openflow.of_01 as of_01
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import OpenFlowNexus, OpenFlowConnectionArbiter
+from pox.core import core
+
+
+class ConnectionReadTest (unittest.TestCase):
+  def setUp (self):
+    self.old_writer = of_01.connectionWriter
+    of_01.connectionWriter = of_01.ConnectionWriter() # Not started
+    self.sock,self.switch = socket.socketpair()
+    self.con = of_01.Connection(self.sock)
+    self.seen = []
+    self.con.handlers = [lambda con, msg: self.seen.append(msg)] * 256
+
+  def tearDown (self):
+    of_01.connectionWriter = self.old_writer
+    self.sock.close()
+    self.switch.close()
+
+  def test_read (self):
+    data = b''.join(of.ofp_echo_request(xid=i, body="x"*i).pack()
+                    for i in range(20))
+    self.switch.sendall(data[:-3])
+    self.assertTrue(self.con.read())
+    self.switch.sendall(data[-3:])
+    self.assertTrue(self.con.read())
+    self.assertEqual([m.xid for m in self.seen], range(20))
+
+  def test_length_mismatch (self):
+    """ a message whose header length disagrees with its body is fatal """
+    raw = of.ofp_barrier_request(xid=1).pack()
+    raw = raw[:2] + struct.pack("!H", 16) + raw[4:] + b"\0" * 8
+    self.switch.sendall(raw + of.ofp_echo_request(xid=2).pack())
+    self.assertFalse(self.con.read())
+    self.assertEqual(self.seen, [])
+
+
+
+class ConnectionWriterTest (unittest.TestCase):
+  def setUp (self):
+    self.old_writer = of_01.connectionWriter
+    self.writer = of_01.connectionWriter = of_01.ConnectionWriter()
+    self.sock,self.switch = socket.socketpair()
+    self.sock.setblocking(0)
+    self.con = of_01.Connection(self.sock)
+
+  def tearDown (self):
+    of_01.connectionWriter = self.old_writer
+    self.sock.close()
+    self.switch.close()
+
+  def test_threaded_sends (self):
+    """ sends from other threads don't corrupt the queue """
+    msg = of.ofp_echo_request(body="x" * 100).pack()
+    received = []
+    def recv ():
+      while True:
+        d = self.switch.recv(65536)
+        if not d: break
+        received.append(d)
+    reader = threading.Thread(target=recv)
+    reader.start()
+    def send ():
+      for i in range(2000):
+        self.con.send(msg)
+    senders = [threading.Thread(target=send) for i in range(4)]
+    for t in senders: t.start()
+    def pump ():
+      # What the writer task does when the socket is writable again
+      with self.writer.lock:
+        self.writer.forget(self.con)
+        self.con.flush()
+    while any(t.is_alive() for t in senders):
+      self.writer.flush()
+      pump()
+    for t in senders: t.join()
+    while self.con.send_queue_depth:
+      pump()
+    self.sock.shutdown(socket.SHUT_WR)
+    reader.join()
+    data = b''.join(received)
+    hello = len(of.ofp_hello().pack())
+    self.assertEqual(data[hello:], msg * 8000)
+
+
+def recv_messages (sock):
+  """
+  Reads everything waiting on sock and unpacks it as OpenFlow messages
+  """
+  data = b''
+  while True:
+    try:
+      d = sock.recv(65536)
+    except socket.error as e:
+      if e.errno == EAGAIN: break
+      raise
+    if not d: break
+    data += d
+  msgs = []
+  offset = 0
+  while offset < len(data):
+    offset,msg = of_01.unpackers[ord(data[offset+1])](data, offset)
+    msgs.append(msg)
+  return msgs
+
+
+class LogCapture (logging.Handler):
+  def __init__ (self):
+    logging.Handler.__init__(self)
+    self.records = []
+  def emit (self, record):
+    self.records.append(record)
+
+
+class ShardTest (unittest.TestCase):
+  """
+  Drives workers and the main process's ends of their channels
+
+  The channels and the switches' connections to the workers are
+  socketpairs, and everything is pumped by hand.
+  """
+  def setUp (self):
+    self.old_writer = of_01.connectionWriter
+    of_01.connectionWriter = of_01.ConnectionWriter() # Not started
+    self.saved = dict((n, core.components.get(n))
+                      for n in ('openflow', 'OpenFlowConnectionArbiter'))
+    self.nexus = OpenFlowNexus()
+    core.components['openflow'] = self.nexus
+    core.components['OpenFlowConnectionArbiter'] = \
+        OpenFlowConnectionArbiter(self.nexus)
+    self.closers = []
+
+  def tearDown (self):
+    of_01.connectionWriter = self.old_writer
+    for n,c in self.saved.iteritems():
+      if c is None:
+        core.components.pop(n, None)
+      else:
+        core.components[n] = c
+    for c in self.closers:
+      c.close()
+
+  def make_worker (self):
+    """
+    Returns an OpenFlowShardWorker and the main process's _ShardWorker
+    """
+    ours,theirs = socket.socketpair()
+    theirs.setblocking(0)
+    worker = of_01.OpenFlowShardWorker('127.0.0.1', 0, theirs)
+    worker.poller = select.epoll()
+    worker.poller.register(theirs.fileno(), select.EPOLLIN)
+    shard = of_01._ShardWorker(0, ours)
+    self.closers += [ours, theirs, worker.poller]
+    return worker, shard
+
+  def to_main (self, worker, shard):
+    """
+    Passes records to the main process, and sends any replies
+    """
+    self.assertTrue(worker._flush_channel())
+    self.assertTrue(shard.read())
+    of_01.connectionWriter.flush()
+
+  def connect (self, worker, shard, dpid, port = 40000):
+    """
+    Takes a switch through the handshake
+
+    Returns the worker's _ShardSwitch, the switch's socket, and the
+    WorkerConnection.
+    """
+    switch,theirs = socket.socketpair()
+    switch.setblocking(0)
+    self.closers += [switch, theirs]
+    sw = worker._add_switch(theirs, ('10.0.0.1', port))
+    self.assertEqual([type(m) for m in recv_messages(switch)], [of.ofp_hello])
+
+    switch.sendall(of.ofp_hello().pack())
+    worker._read_switch(sw)
+    self.assertEqual([type(m) for m in recv_messages(switch)],
+                     [of.ofp_features_request, of.ofp_stats_request])
+
+    switch.sendall(of.ofp_features_reply(datapath_id = dpid).pack())
+    worker._read_switch(sw)
+    self.to_main(worker, shard)
+    con = shard.connections[sw.id]
+
+    # The main process finishes the handshake through the worker
+    self.assertTrue(worker._read_channel())
+    barriers = [m for m in recv_messages(switch)
+                if isinstance(m, of.ofp_barrier_request)]
+    self.assertEqual(len(barriers), 1)
+    switch.sendall(of.ofp_barrier_reply(xid = barriers[0].xid).pack())
+    worker._read_switch(sw)
+    self.to_main(worker, shard)
+    return sw, switch, con
+
+  def test_handshake (self):
+    ups = []
+    self.nexus.addListenerByName("ConnectionUp", ups.append)
+    worker,shard = self.make_worker()
+    sw,switch,con = self.connect(worker, shard, 5)
+    self.assertEqual([e.connection for e in ups], [con])
+    self.assertEqual(con.dpid, 5)
+    self.assertTrue(self.nexus.getConnection(5) is con)
+    self.assertEqual(con.sock.getpeername(), ('10.0.0.1', 40000))
+
+  def test_early_error (self):
+    capture = LogCapture()
+    logging.getLogger(of_01.log.name).addHandler(capture)
+    try:
+      worker,shard = self.make_worker()
+      switch,theirs = socket.socketpair()
+      self.closers += [switch, theirs]
+      sw = worker._add_switch(theirs, ('10.0.0.1', 40000))
+      switch.sendall(of.ofp_hello().pack() + of.ofp_error(
+          type = of.OFPET_BAD_REQUEST, code = of.OFPBRC_BAD_TYPE).pack())
+      worker._read_switch(sw)
+      self.to_main(worker, shard)
+    finally:
+      logging.getLogger(of_01.log.name).removeHandler(capture)
+    self.assertEqual(shard.connections, {})
+    warnings = [r.getMessage() for r in capture.records
+                if r.levelno == logging.WARNING]
+    self.assertEqual(len(warnings), 1)
+    self.assertTrue("10.0.0.1:40000 sent an error" in warnings[0])
+
+  def test_echo (self):
+    worker,shard = self.make_worker()
+    sw,switch,con = self.connect(worker, shard, 5)
+    switch.sendall(of.ofp_echo_request(xid = 99).pack())
+    worker._read_switch(sw)
+    replies = recv_messages(switch)
+    self.assertEqual([(type(m), m.xid) for m in replies],
+                     [(of.ofp_echo_reply, 99)])
+    self.assertEqual(worker.outbox, [])
+
+  def test_subscriptions (self):
+    worker,shard = self.make_worker()
+    sw,switch,con = self.connect(worker, shard, 5)
+    task = of_01.OpenFlow_01_ShardedTask.__new__(
+        of_01.OpenFlow_01_ShardedTask)
+    task.workers = [shard]
+    task._subscription_time = 0
+    packet_ins = []
+    packet_in = of.ofp_packet_in(in_port = 1, data = b'x' * 60).pack()
+
+    # Nobody is listening, so PacketIns stay in the worker
+    task._update_subscriptions()
+    self.assertTrue(worker._read_channel())
+    self.assertEqual(worker.forward, set())
+    switch.sendall(packet_in)
+    worker._read_switch(sw)
+    self.assertEqual(worker.outbox, [])
+
+    con.addListenerByName("PacketIn", packet_ins.append)
+    task._subscription_time = 0
+    task._update_subscriptions()
+    self.assertTrue(worker._read_channel())
+    self.assertEqual(worker.forward, set([of.OFPT_PACKET_IN]))
+    switch.sendall(packet_in)
+    worker._read_switch(sw)
+    self.to_main(worker, shard)
+    self.assertEqual([e.port for e in packet_ins], [1])
+
+  def test_send_to_dpid (self):
+    worker1,shard1 = self.make_worker()
+    worker2,shard2 = self.make_worker()
+    sw1,switch1,con1 = self.connect(worker1, shard1, 1)
+    sw2,switch2,con2 = self.connect(worker2, shard2, 2, 40001)
+    recv_messages(switch1)
+    recv_messages(switch2)
+
+    self.assertTrue(self.nexus.sendToDPID(2, of.ofp_echo_request(xid = 7)))
+    of_01.connectionWriter.flush()
+    self.assertTrue(worker1._read_channel())
+    self.assertTrue(worker2._read_channel())
+    self.assertEqual(recv_messages(switch1), [])
+    self.assertEqual([m.xid for m in recv_messages(switch2)], [7])
+
+  def test_channel_full (self):
+    """
+    Sends back up in the connection's queue while the channel is full
+    """
+    worker,shard = self.make_worker()
+    sw,switch,con = self.connect(worker, shard, 5)
+    con.high_water = 256 * 1024
+    con.low_water = 0
+    writer = of_01.connectionWriter
+    body = b'x' * 60000
+    while not shard.out:
+      con.send(of.ofp_echo_request(body = body))
+      writer.flush()
+    self.assertEqual(con.send_queue_depth, 0)
+
+    # The channel is full, so these stay with the connection
+    for i in range(5):
+      con.send(of.ofp_echo_request(body = body))
+    writer.flush()
+    self.assertTrue(con.congested)
+    self.assertTrue(con in writer._blocked)
+    sent = con.send_queue_depth
+
+    # Drain the channel, as the worker and the writer's task would
+    while shard.out or con.send_queue_depth:
+      worker._read_channel()
+      recv_messages(switch)
+      shard.flush()
+      con.flush()
+    self.assertFalse(con.congested)
+    self.assertTrue(sent > 0)
+
+  def test_worker_gone (self):
+    """
+    A failed send marks the worker dead rather than raising to the sender
+    """
+    worker,shard = self.make_worker()
+    sw,switch,con = self.connect(worker, shard, 5)
+    woken = []
+    shard.wake = lambda: woken.append(True)
+    downs = []
+    self.nexus.addListenerByName("ConnectionDown", downs.append)
+
+    worker.channel.close()
+    con.send(of.ofp_echo_request())
+    of_01.connectionWriter.flush()
+    self.assertTrue(shard.dead)
+    self.assertTrue(woken)
+    self.assertTrue(con.disconnected)
+    self.assertFalse(shard.send_record(of_01._SHARD_SUBSCRIBE, 0))
+
+    shard.lost()
+    self.assertEqual([e.connection for e in downs], [con])
+
+  def test_channel_backlog (self):
+    """
+    Records the channel won't take yet are kept until it's writable
+    """
+    worker,shard = self.make_worker()
+    payload = b'x' * 65536
+    for i in range(64):
+      worker._record(of_01._SHARD_MESSAGE, 1, payload)
+    self.assertTrue(worker._flush_channel())
+    self.assertTrue(worker.outbox)
+    self.assertTrue(worker._channel_events & select.EPOLLOUT)
+
+    received = 0
+    while worker.outbox:
+      while True:
+        try:
+          received += len(shard.sock.recv(1 << 20))
+        except socket.error:
+          break
+      self.assertTrue(worker._flush_channel())
+    while True:
+      try:
+        received += len(shard.sock.recv(1 << 20))
+      except socket.error:
+        break
+    hl = of_01._shard_record_struct.size
+    self.assertEqual(received, 64 * (hl + len(payload)))
+    self.assertEqual(worker._channel_events, select.EPOLLIN)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,190 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.path_install import *
+import pox.openflow.libopenflow_01 as of
+from tests.unit.openflow.install_fakes import *
+
+
+class PathInstallerTest (unittest.TestCase):
+  def setUp (self):
+    self.deferred = []
+    self.installer = PathInstaller(timeout = 4,
+                                   defer = self.deferred.append)
+    self.cons = dict((i, FakeConnection(i)) for i in range(1, 4))
+    self.done = []
+
+  def callback (self, txn, name):
+    self.done.append(name)
+
+  def install (self, name, dpids):
+    txn = self.installer.begin(self.callback, name)
+    for dpid in dpids:
+      txn.send(self.cons[dpid], of.ofp_flow_mod())
+    txn.commit()
+    return txn
+
+  def reply (self, dpid):
+    """
+    Answers the barriers sent to a switch
+    """
+    for msg in self.cons[dpid].sent:
+      if isinstance(msg, of.ofp_barrier_request):
+        self.installer.barrier_in(FakeBarrierIn(dpid, msg.xid))
+
+  def test_one_barrier_per_switch (self):
+    a = self.install("a", [1, 2, 3])
+    b = self.install("b", [3, 2])
+    self.assertEqual(len(self.deferred), 1)
+    self.assertEqual(self.cons[1].sent, [])
+
+    self.installer.flush()
+    kinds = [type(m) for m in self.cons[2].sent]
+    self.assertEqual(kinds, [of.ofp_flow_mod, of.ofp_flow_mod,
+                             of.ofp_barrier_request])
+    self.assertEqual(self.installer.barriers, 3)
+    self.assertEqual(self.installer.messages, 8)
+
+    self.reply(2)
+    self.reply(3)
+    self.assertEqual(self.done, ["b"])
+    self.assertTrue(b.done)
+    self.assertFalse(a.done)
+    self.reply(1)
+    self.assertEqual(self.done, ["b", "a"])
+    self.assertEqual(self.installer.completed, 2)
+
+    # Stray and repeated barriers are ignored
+    self.assertFalse(self.installer.barrier_in(FakeBarrierIn(1, 12345)))
+    self.reply(1)
+    self.assertEqual(self.done, ["b", "a"])
+
+  def test_empty (self):
+    self.install("a", [])
+    self.assertEqual(self.done, ["a"])
+    self.assertEqual(self.deferred, [])
+
+  def test_expire (self):
+    a = self.install("a", [1, 2])
+    self.installer.flush()
+    self.reply(1)
+    self.assertEqual(self.installer.expire(), 0)
+    a.expires_at = 0
+    self.assertEqual(self.installer.expire(), 1)
+    self.assertTrue(a.failed)
+    self.reply(2)
+    self.assertEqual(self.done, [])
+    self.assertEqual(self.installer._barriers, {})
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.sent = []
+  def sendToDPID (self, dpid, msg):
+    self.sent.append((dpid, msg))
+
+
+class FakePacketIn (object):
+  def __init__ (self, buffer_id):
+    self.ofp = of.ofp_packet_in(in_port = 5, buffer_id = buffer_id)
+
+
+class PendingInstallsTest (unittest.TestCase):
+  def setUp (self):
+    self.installer = PathInstaller(timeout = 4, defer = lambda f: None)
+    self.cons = dict((i, FakeConnection(i)) for i in range(1, 3))
+    from pox.core import core
+    self.core = core
+    self.old_openflow = core.components.get('openflow')
+    self.openflow = FakeOpenFlow()
+    core.components['openflow'] = self.openflow
+    self.pending = PendingInstalls(self.installer, max_held = 2)
+    self.app = FakeApp()
+    self.match = of.ofp_match(dl_type = 0x800, tp_dst = 80)
+    self.path = [(FakeSwitch(1, self.cons[1]), 5, 1),
+                 (FakeSwitch(2, self.cons[2]), 1, 5)]
+
+  def tearDown (self):
+    if self.old_openflow is None:
+      del self.core.components['openflow']
+    else:
+      self.core.components['openflow'] = self.old_openflow
+
+  def reply (self, dpid):
+    for msg in self.cons[dpid].sent:
+      if isinstance(msg, of.ofp_barrier_request):
+        self.installer.barrier_in(FakeBarrierIn(dpid, msg.xid))
+
+  def begin (self):
+    txn = self.pending.begin(self.app, self.path, self.match,
+                             FakePacketIn(1).ofp)
+    for sw,in_port,out_port in self.path:
+      txn.send(sw.connection, of.ofp_flow_mod())
+    txn.commit()
+    self.installer.flush()
+    return txn
+
+  def test_hold (self):
+    dropped = []
+    hold = lambda p: self.pending.hold(self.app, 1, self.match.clone(),
+                                       FakePacketIn(p),
+                                       lambda: dropped.append(p))
+    self.assertFalse(hold(0))
+    self.begin()
+    self.assertFalse(self.pending.hold(self.app, 2, self.match,
+                                       FakePacketIn(0), None))
+    for p in (2, 3, 4):
+      self.assertTrue(hold(p))
+    self.assertEqual(dropped, [4])
+    self.assertFalse(self.match._locked)
+    self.assertEqual(self.app.redundant_installs_avoided, 3)
+    self.assertEqual(self.app.held_packets_dropped, 1)
+
+    self.reply(1)
+    self.reply(2)
+    self.assertEqual([m.buffer_id for d,m in self.openflow.sent], [1, 2, 3])
+    self.assertTrue(all(m.actions[0].port == of.OFPP_TABLE
+                        for d,m in self.openflow.sent))
+    self.assertEqual([d for d,m in self.openflow.sent], [1, 1, 1])
+    self.assertEqual([e.path for e in self.app.events], [self.path])
+    self.assertEqual(len(self.pending), 0)
+
+  def test_expire (self):
+    txn = self.begin()
+    self.pending.hold(self.app, 1, self.match, FakePacketIn(2), None)
+    self.pending.hold(self.app, 1, self.match, FakePacketIn(None), None)
+    self.assertEqual(len(self.pending), 1)
+    self.pending.expire()
+    self.assertEqual(len(self.pending), 1)
+    txn.expires_at = 0
+    self.pending.expire()
+    self.assertTrue(txn.failed)
+    self.assertEqual(len(self.pending), 0)
+
+    # The buffered packets are released without being forwarded
+    self.assertEqual([(d,m.buffer_id,m.in_port,m.actions)
+                      for d,m in self.openflow.sent],
+                     [(1,1,5,[]), (1,2,5,[])])
+    self.reply(1)
+    self.reply(2)
+    self.assertEqual(len(self.openflow.sent), 2)
+    self.assertEqual(self.app.events, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,133 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.spanning_forest import SpanningForest
+from pox.openflow.discovery import Link, LinkEvent
+
+
+def link (d1, p1, d2, p2, link_type = 'lldp'):
+  return Link(d1, p1, d2, p2, link_type, True)
+
+
+def components (edges):
+  """
+  Connected groups of switches, found the slow way
+  """
+  adj = {}
+  for e in edges:
+    adj.setdefault(e[0], set()).add(e[2])
+    adj.setdefault(e[2], set()).add(e[0])
+  r = []
+  seen = set()
+  for s in adj:
+    if s in seen: continue
+    group = set([s])
+    todo = [s]
+    while todo:
+      for t in adj[todo.pop()]:
+        if t not in group:
+          group.add(t)
+          todo.append(t)
+    seen |= group
+    r.append(sorted(group))
+  return sorted(r)
+
+
+class SpanningForestTest (unittest.TestCase):
+  def check (self, f, links):
+    """
+    Checks that f's tree edges span the symmetric links in links
+
+    links is a set of (dpid1,port1,dpid2,port2) tuples.
+    """
+    edges = set()
+    for d in links:
+      if d[0] == d[2]: continue
+      if (d[2],d[3],d[0],d[1]) in links:
+        edges.add(f._edge(d))
+    tree = f.tree_edges()
+    self.assertTrue(tree <= edges)
+    groups = components(edges)
+    self.assertEqual(components(tree), groups)
+    self.assertEqual(len(tree), sum(len(g) - 1 for g in groups))
+    for g in groups:
+      for s in g:
+        self.assertEqual(f.tree_of(s), set(g))
+    ports = set()
+    for e in tree:
+      ports.add((e[0],e[1]))
+      ports.add((e[2],e[3]))
+    self.assertEqual(set(f._tree_ports), ports)
+    return ports
+
+  def test_basic (self):
+    f = SpanningForest()
+    self.assertFalse(f.add_link(link(1, 1, 2, 1)))
+    self.assertEqual(f.tree_edges(), set())
+    self.assertTrue(f.add_link(link(2, 1, 1, 1))) # Now it's symmetric
+    self.assertEqual(f.pop_changed(), set([(1,1), (2,1)]))
+    f.add_link(link(2, 2, 3, 1))
+    f.add_link(link(3, 1, 2, 2))
+    f.add_link(link(3, 2, 1, 2))
+    f.add_link(link(1, 2, 3, 2)) # Closes a loop
+    self.assertEqual(len(f.tree_edges()), 2)
+    self.assertEqual(f.pop_changed(), set([(2,2), (3,1)]))
+    self.assertFalse(f.is_tree_port(1, 2))
+
+    # Losing a tree edge brings in the spare
+    self.assertTrue(f.remove_link(link(2, 2, 3, 1)))
+    self.assertEqual(f.pop_changed(), set([(2,2), (3,1), (1,2), (3,2)]))
+    self.assertTrue(f.is_tree_port(1, 2))
+    self.assertEqual(f.tree_of(3), set([1, 2, 3]))
+
+    # And then the tree splits
+    f.link_event(LinkEvent(False, link(3, 2, 1, 2)))
+    self.assertEqual(f.tree_of(3), frozenset([3]))
+    self.assertEqual(f.tree_of(1), set([1, 2]))
+    self.assertEqual(f.pop_changed(), set([(1,2), (3,2)]))
+    self.assertFalse(f.remove_link(link(1, 2, 3, 2))) # Already broken
+    self.assertFalse(f.link_event(LinkEvent(True,
+                                            link(4, 1, 5, 1, 'broadcast'))))
+
+  def test_random (self):
+    rng = random.Random(7)
+    f = SpanningForest()
+    links = set()
+    ports = set()
+    for i in range(1000):
+      s1 = rng.randint(1, 12)
+      s2 = rng.randint(1, 12)
+      p1 = rng.randint(1, 3)
+      p2 = rng.randint(1, 3)
+      if rng.random() < 0.5:
+        f.add_link(link(s1, p1, s2, p2))
+        links.add((s1,p1,s2,p2))
+      else:
+        f.remove_link(link(s1, p1, s2, p2))
+        links.discard((s1,p1,s2,p2))
+      if rng.random() < 0.5:
+        f.add_link(link(s2, p2, s1, p1))
+        links.add((s2,p2,s1,p1))
+      old = ports
+      ports = self.check(f, links)
+      self.assertTrue(old ^ ports <= f.pop_changed())
+
+
+if __name__ == '__main__':
+  unittest.main()
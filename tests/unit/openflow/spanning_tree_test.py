@@ -0,0 +1,309 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import types
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+try:
+  import networkx
+except ImportError:
+  # spanning_tree imports networkx, but nothing tested here uses it
+  sys.modules['networkx'] = types.ModuleType('networkx')
+
+from pox.core import core
+from pox.lib.revent import EventMixin
+from pox.lib.addresses import EthAddr
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.discovery import Link, LinkTable, LinkEvent
+import pox.openflow.spanning_tree as spanning_tree
+import pox.forwarding.l2_multi as l2_multi
+
+
+def link (d1, p1, d2, p2, link_type = 'lldp'):
+  return Link(d1, p1, d2, p2, link_type, True)
+
+
+class FakeDiscovery (EventMixin):
+  _eventMixin_events = set([LinkEvent])
+  send_cycle_time = 5
+
+  def __init__ (self):
+    self.adjacency = LinkTable()
+
+  def is_edge_port (self, dpid, port):
+    return not self.adjacency.links_at(dpid, port)
+
+  def _is_broadcast_port (self, dpid, port):
+    return any(l.link_type == 'broadcast'
+               for l in self.adjacency.links_at(dpid, port))
+
+  def add (self, l):
+    self.adjacency[l] = 0
+    self.raiseEvent(LinkEvent(True, l))
+
+  def remove (self, l):
+    # Like discovery, forget the link once the event is over
+    self.raiseEvent(LinkEvent(False, l))
+    del self.adjacency[l]
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.connections = {}
+
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid, ports, connect_time = 0):
+    self.dpid = dpid
+    self.connect_time = connect_time
+    self.ports = {}
+    for p in ports:
+      self.ports[p] = of.ofp_phy_port(port_no = p,
+          hw_addr = EthAddr("00:00:00:00:%02x:%02x" % (dpid, p)))
+    self.sent = []
+
+  def send (self, msg):
+    self.sent.append(msg)
+
+  def pop_flood_bits (self):
+    """
+    Returns [(port_no, flood)] for the port_mods sent, and forgets them
+    """
+    r = [(m.port_no, not (m.config & of.OFPPC_NO_FLOOD))
+         for m in self.sent if isinstance(m, of.ofp_port_mod)]
+    del self.sent[:]
+    return r
+
+
+class FakeConnectionUp (object):
+  def __init__ (self, connection):
+    self.connection = connection
+    self.dpid = connection.dpid
+
+
+class SpanningTreeTestBase (unittest.TestCase):
+  """
+  Puts a fake discovery and openflow on core, and resets spanning_tree
+
+  Functions passed to core.callLater() are kept in self.later, and the
+  arguments to spanning_tree's Timers in self.timers.
+  """
+  def setUp (self):
+    self.later = []
+    core.callLater = lambda f, *args, **kw: self.later.append(f)
+    st = spanning_tree
+    self.saved_module = (st.Timer, st._invalidate_ports, st._hold_down)
+    self.timers = []
+    st.Timer = lambda *args, **kw: self.timers.append((args, kw))
+    st._invalidate_ports = lambda dpid: None
+    self.saved = dict((n, core.components.get(n))
+                      for n in ('openflow', 'openflow_discovery'))
+    self.discovery = FakeDiscovery()
+    self.openflow = FakeOpenFlow()
+    core.components['openflow_discovery'] = self.discovery
+    core.components['openflow'] = self.openflow
+
+    self.reset()
+    spanning_tree.track_broadcast_segments()
+    self.discovery.addListenerByName("LinkEvent",
+                                     spanning_tree._handle_LinkEvent,
+                                     priority=100)
+
+  def tearDown (self):
+    del core.callLater
+    st = spanning_tree
+    st.Timer, st._invalidate_ports, st._hold_down = self.saved_module
+    for n,c in self.saved.iteritems():
+      if c is None:
+        core.components.pop(n, None)
+      else:
+        core.components[n] = c
+    self.reset()
+
+  def reset (self):
+    st = spanning_tree
+    st._tracking_segments = False
+    st.broadcast_segments.clear()
+    st._segments_version = st.broadcast_segments.version
+    st.spanning_forest.clear()
+    st.spanning_forest.pop_changed()
+    st._prev.clear()
+    st._dirty_ports.clear()
+    st._unsynced.clear()
+
+
+class BroadcastSegmentsFeedTest (SpanningTreeTestBase):
+  def setUp (self):
+    SpanningTreeTestBase.setUp(self)
+    self.rebuilds = []
+    self.saved_rebuild = spanning_tree.update_sw_cloud_site_domain
+    spanning_tree.update_sw_cloud_site_domain = \
+        lambda: self.rebuilds.append(len(spanning_tree.broadcast_segments))
+
+    # l2_multi listens to the fake discovery itself
+    self.app = l2_multi.l2_multi()
+    self.updates = []
+    self.app.update_clouds_in_broadcast = \
+        lambda changes: self.updates.append(
+            len(spanning_tree.broadcast_segments))
+    self.switches = []
+    for dpid in (1, 2):
+      sw = l2_multi.Switch()
+      sw.dpid = dpid
+      l2_multi.switches[dpid] = sw
+      l2_multi.shortest_paths.add_node(sw)
+      self.switches.append(sw)
+
+  def tearDown (self):
+    spanning_tree.update_sw_cloud_site_domain = self.saved_rebuild
+    for sw in self.switches:
+      del l2_multi.switches[sw.dpid]
+      l2_multi._forget_node(sw)
+      l2_multi.adjacency.pop(sw, None)
+    SpanningTreeTestBase.tearDown(self)
+
+  def test_both_consumers (self):
+    d = self.discovery
+    d.add(link(1, 1, 2, 1, 'broadcast'))
+    self.assertEqual(self.rebuilds, [1])
+    self.assertEqual(self.updates, [1])
+
+    # The other direction doesn't change the segment
+    d.add(link(2, 1, 1, 1, 'broadcast'))
+    self.assertEqual(self.rebuilds, [1])
+    self.assertEqual(self.updates, [1, 1])
+
+    # Links between the same ports turning into LLDP ones.  The segment
+    # only goes once both directions have.
+    d.remove(link(1, 1, 2, 1, 'lldp'))
+    self.assertEqual(self.updates, [1, 1])
+    d.remove(link(2, 1, 1, 1, 'lldp'))
+    self.assertEqual(self.updates, [1, 1, 0])
+    self.assertEqual(len(spanning_tree.broadcast_segments), 0)
+
+    # Unrelated LLDP links leave both alone
+    d.add(link(1, 2, 2, 2))
+    self.assertEqual(self.updates, [1, 1, 0])
+    self.assertEqual(self.rebuilds, [1])
+
+  def test_fed_once (self):
+    spanning_tree.track_broadcast_segments()
+    version = spanning_tree.broadcast_segments.version
+    self.discovery.add(link(1, 1, 2, 1, 'broadcast'))
+    self.assertEqual(spanning_tree.broadcast_segments.version, version + 1)
+
+
+class UpdateTreeTest (SpanningTreeTestBase):
+  def setUp (self):
+    SpanningTreeTestBase.setUp(self)
+    self.cons = {}
+    for dpid in (1, 2):
+      self.cons[dpid] = FakeConnection(dpid, [1, 2, 3])
+      self.openflow.connections[dpid] = self.cons[dpid]
+
+  def connect (self, dpid):
+    spanning_tree._handle_ConnectionUp(FakeConnectionUp(self.cons[dpid]))
+
+  def flood_bits (self):
+    return dict((dpid, con.pop_flood_bits())
+                for dpid,con in self.cons.iteritems())
+
+  def test_sync_and_dirty_ports (self):
+    self.connect(1)
+    self.connect(2)
+    self.assertEqual(spanning_tree._unsynced, set([1, 2]))
+    spanning_tree._update_tree()
+    self.assertEqual(spanning_tree._unsynced, set())
+    everything = [(1, True), (2, True), (3, True)]
+    self.assertEqual(self.flood_bits(), {1:everything, 2:everything})
+
+    # Only the ends of the link are looked at, and both stop flooding
+    # until the link goes both ways and is on the tree
+    self.discovery.add(link(1, 1, 2, 1))
+    self.assertEqual(spanning_tree._dirty_ports, set())
+    self.assertEqual(self.flood_bits(), {1:[(1, False)], 2:[(1, False)]})
+    self.discovery.add(link(2, 1, 1, 1))
+    self.assertEqual(self.flood_bits(), {1:[(1, True)], 2:[(1, True)]})
+
+    # Nothing is sent for ports whose flood bits haven't changed
+    spanning_tree._update_tree()
+    spanning_tree._unsynced.update([1, 2])
+    spanning_tree._dirty_ports.add((1, 2))
+    spanning_tree._update_tree()
+    self.assertEqual(self.flood_bits(), {1:[], 2:[]})
+
+    # Reconnecting forgets what was sent
+    self.connect(2)
+    spanning_tree._update_tree()
+    self.assertEqual(self.flood_bits(), {1:[], 2:everything})
+
+  def test_deferred_removal (self):
+    self.connect(1)
+    self.connect(2)
+    self.discovery.add(link(1, 1, 2, 1))
+    self.discovery.add(link(2, 1, 1, 1))
+    self.flood_bits()
+
+    # The update waits until discovery has forgotten the link
+    self.discovery.remove(link(1, 1, 2, 1))
+    self.assertEqual(self.later, [spanning_tree._update_tree])
+    self.assertEqual(self.flood_bits(), {1:[], 2:[]})
+    self.later.pop()()
+    self.assertEqual(self.flood_bits(), {1:[(1, False)], 2:[(1, False)]})
+
+    # Both ends were already off, so the last direction going doesn't
+    # update anything, but the ports are left dirty for the next update
+    self.discovery.remove(link(2, 1, 1, 1))
+    self.assertEqual(self.later, [])
+    self.assertEqual(spanning_tree._dirty_ports, set([(1, 1), (2, 1)]))
+    spanning_tree._update_tree()
+    self.assertEqual(self.flood_bits(), {1:[(1, True)], 2:[(1, True)]})
+
+  def test_hold_down (self):
+    spanning_tree._hold_down = True
+    self.cons[1].connect_time = time.time()
+    self.connect(1)
+    self.connect(2)
+    (delay, func), kw = self.timers[0]
+    self.assertEqual(func, spanning_tree._update_tree)
+    self.assertEqual(kw['kw'], {'force_dpid':1})
+
+    # The young switch is left alone, and stays unsynced
+    spanning_tree._update_tree()
+    self.assertEqual(spanning_tree._unsynced, set([1]))
+    self.assertEqual(self.flood_bits()[1], [])
+
+    func(**kw['kw'])
+    self.assertEqual(spanning_tree._unsynced, set())
+    self.assertEqual(len(self.flood_bits()[1]), 3)
+
+    # Its dirty ports are held too...
+    self.discovery.add(link(1, 1, 2, 1))
+    self.assertEqual(spanning_tree._dirty_ports, set([(1, 1)]))
+    self.assertEqual(self.flood_bits(), {1:[], 2:[(1, False)]})
+
+    # ...until the forced update
+    func(**kw['kw'])
+    self.assertEqual(spanning_tree._dirty_ports, set())
+    self.assertEqual(self.flood_bits(), {1:[(1, False)], 2:[]})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -128,6 +128,36 @@ class OFSyncFlowTableTest(unittest.TestCase):
     self.assertEqual(len(seen_ft_events), 2)
     self.assertTrue(isinstance(seen_ft_events[-1], FlowTableModification) and seen_ft_events[-1].removed == [entry])
 
+  def test_reconnect_installed(self):
+    """ test that resyncing entries already in the table keeps one copy """
+    t = self.t
+    s = self.s
+
+    seen_ft_events = []
+    t.addListener(FlowTableModification, lambda(event): seen_ft_events.append(event))
+
+    entry = TableEntry(priority=5, cookie=0x31415926, match=ofp_match(dl_src=EthAddr("00:00:00:00:00:01")), actions=[ofp_action_output(port=5)])
+    t.install(entry)
+    s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=s.sent[-1].xid)))
+    self.assertEqual(len(t), 1)
+
+    s.raiseEvent(SwitchConnectionDown(s))
+    s.raiseEvent(SwitchConnectionUp(s, self.conn))
+    self.assertTrue(isinstance(s.sent[-2], ofp_flow_mod) and s.sent[-2].command == OFPFC_ADD and s.sent[-2].match == entry.match)
+
+    # the switch confirms the reinstalled entry
+    s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=s.sent[-1].xid)))
+    self.assertEqual(len(t), 1)
+    self.assertEqual(t.entries[0], entry)
+    self.assertEqual(t.num_pending, 0)
+    self.assertEqual(seen_ft_events[-1].added, [])
+
+    # it's still indexed once, so it can be removed cleanly
+    t.remove_strict(entry)
+    s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=s.sent[-1].xid)))
+    self.assertEqual(len(t), 0)
+    self.assertEqual(seen_ft_events[-1].removed, [entry])
+
   def test_handle_FlowRemoved(self):
     """ test that simple removal of a flow works"""
     t = self.t
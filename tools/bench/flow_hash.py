@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Simulation of multipath flow hashing
+
+Generates TCP flows between a set of hosts and spreads them over N
+equal-cost paths, reporting how evenly they're spread (the busiest
+path's share over the ideal share) and what fraction of flows move when
+a path is removed or added (the ideal is 1/N).  The schemes compared are
+l2_multi's old one (XOR of the last bytes of the MACs into a 256 slot
+round-robin table), and pox.lib.flow_hash's Rendezvous and Maglev.
+
+Invoke from the top level:
+  ./tools/bench/flow_hash.py [--flows=N] [--hosts=N] [--paths=2,4,8,16]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.flow_hash import Rendezvous, Maglev
+from pox.lib.addresses import EthAddr, IPAddr
+import pox.openflow.libopenflow_01 as of
+
+
+class XorMac (object):
+  """
+  What l2_multi used to do
+  """
+  def flow_key (self, match):
+    return ord(match.dl_src.raw[5]) ^ ord(match.dl_dst.raw[5])
+
+  def build (self, choices):
+    return [choices[i % len(choices)] for i in xrange(256)]
+
+  def select (self, table, key):
+    return table[key]
+
+
+def make_flows (count, hosts, rng):
+  r = []
+  for _ in xrange(count):
+    a,b = rng.sample(xrange(1, hosts + 1), 2)
+    r.append(of.ofp_match(
+        dl_src = EthAddr("00:00:00:00:%02x:%02x" % (a >> 8, a & 0xff)),
+        dl_dst = EthAddr("00:00:00:00:%02x:%02x" % (b >> 8, b & 0xff)),
+        dl_type = 0x800, nw_proto = 6,
+        nw_src = IPAddr("10.0.%i.%i" % (a >> 8, a & 0xff)),
+        nw_dst = IPAddr("10.0.%i.%i" % (b >> 8, b & 0xff)),
+        tp_src = rng.randint(1024, 65535), tp_dst = 80))
+  return r
+
+
+def moved (before, after):
+  return sum(1 for x,y in zip(before, after) if x != y) / float(len(before))
+
+
+def bench (name, h, matches, n):
+  t = time.time()
+  keys = [h.flow_key(m) for m in matches]
+  paths = [("path", i) for i in xrange(n + 1)]
+  table = h.build(paths[:n])
+  before = [h.select(table, k) for k in keys]
+  elapsed = time.time() - t
+
+  load = max(before.count(p) for p in paths[:n]) / (len(keys) / float(n))
+  removed = moved(before, [h.select(h.build(paths[1:n]), k) for k in keys])
+  added = moved(before, [h.select(h.build(paths), k) for k in keys])
+  print("%-10s %2i paths: max load %5.2fx  moved on remove %5.1f%% "
+        "(ideal %4.1f%%)  on add %5.1f%% (ideal %4.1f%%)  %7.0f flows/s"
+        % (name, n, load, removed * 100, 100.0 / n, added * 100,
+           100.0 / (n + 1), len(keys) / elapsed))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--flows", type="int", default=20000)
+  parser.add_option("--hosts", type="int", default=64)
+  parser.add_option("--paths", default="2,4,8,16")
+  opts,args = parser.parse_args()
+
+  matches = make_flows(opts.flows, opts.hosts, random.Random(1))
+  for n in [int(x) for x in opts.paths.split(",")]:
+    for name,h in (("xor-mac", XorMac()), ("rendezvous", Rendezvous()),
+                   ("maglev", Maglev())):
+      bench(name, h, matches, n)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for rerouting flows around failed links with FlowIndex
+
+Installs --flows flows between random leaves of a leaf-spine fabric,
+then fails random leaf-spine links one at a time.  For each failure, the
+flows which used the link are moved onto new paths, as l2_multi does.
+The report compares the flow_mods (and controller time) this takes with
+what clearing every switch and reinstalling every flow would take, which
+is what load_balancing used to do on every link event.
+
+Invoke from the top level:
+  ./tools/bench/flow_reroute.py [--switches=N] [--flows=N] [--failures=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.graph.paths import ShortestPaths
+from pox.openflow.flow_index import FlowIndex
+import pox.openflow.libopenflow_01 as of
+
+
+class FakeSwitch (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", type="int", default=100)
+  parser.add_option("--flows", type="int", default=20000)
+  parser.add_option("--failures", type="int", default=20)
+  opts,args = parser.parse_args()
+
+  rng = random.Random(1)
+  count = opts.switches
+  spines = max(4, count // 8)
+  sws = [FakeSwitch(i) for i in range(count)]
+  sp = ShortestPaths()
+  ports = {} # (a, b) -> port on a toward b
+  for leaf in range(spines, count):
+    for spine in rng.sample(range(spines), 4):
+      ports[(leaf, spine)] = len([k for k in ports if k[0] == leaf]) + 100
+      ports[(spine, leaf)] = leaf
+      sp.add_link(leaf, spine)
+
+  def hops (src, dst, key):
+    paths = sp.sample_paths(src, dst, 16)
+    if not paths: return None
+    path = paths[key % len(paths)]
+    r = []
+    in_port = 1
+    for a,b in zip(path[:-1], path[1:]):
+      r.append((sws[a], in_port, ports[(a,b)]))
+      in_port = ports[(b,a)]
+    r.append((sws[dst], in_port, 1))
+    return r
+
+  index = FlowIndex(10, 30)
+  for i in xrange(opts.flows):
+    src,dst = rng.sample(range(spines, count), 2)
+    match = of.ofp_match(dl_type = 0x800, nw_proto = 6, tp_src = i,
+                         tp_dst = 80)
+    index.add(match, (src, dst, i), hops(src, dst, i))
+
+  t = time.time()
+  for f in index._flows.values():
+    for sw,in_port,out_port in f.hops:
+      index.flow_mod(f, in_port, out_port)
+  clear_time = time.time() - t
+  clear_mods = len(sws) + index.hop_count
+
+  moved = mods = switches = 0
+  elapsed = 0
+  links = [k for k in ports if k[0] >= spines]
+  for leaf,spine in rng.sample(links, opts.failures):
+    touched = set()
+    t = time.time()
+    flows = index.flows_on_link(leaf, ports[(leaf,spine)],
+                                spine, ports[(spine,leaf)])
+    sp.remove_link(leaf, spine)
+    del ports[(leaf,spine)]
+    del ports[(spine,leaf)]
+    for f in flows:
+      src,dst,key = f.route
+      for sw,msg in index.reroute(f, hops(src, dst, key) or ()):
+        mods += 1
+        touched.add(sw)
+    elapsed += time.time() - t
+    moved += len(flows)
+    switches += len(touched)
+
+  n = float(opts.failures)
+  print("%i switches, %i flows, %i hops" % (count, opts.flows,
+                                            index.hop_count))
+  print("targeted:   %8.1f flows moved  %8.1f flow_mods  %6.1f switches  "
+        "%7.2f ms per failure" % (moved / n, mods / n, switches / n,
+                                  elapsed / n * 1000))
+  print("full clear: %8i flows moved  %8i flow_mods  %6i switches  "
+        "%7.2f ms per failure" % (opts.flows, clear_mods, count,
+                                  clear_time * 1000))
+
+
+if __name__ == "__main__":
+  main()
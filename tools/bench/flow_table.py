@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Scaling benchmark for flow_table.FlowTable
+
+Fills a table with a mix of exact-match and wildcarded entries (as a
+reactive controller talking to a SoftwareSwitch would), and then times
+packet lookups, strict deletes, and non-strict stats queries at several
+table sizes.  With --baseline=REV, flow_table.py as of git revision REV
+is measured too.
+
+Invoke from the top level:
+  ./tools/bench/flow_table.py [--sizes=1000,10000,50000] [--baseline=REV]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import subprocess
+import imp
+import random
+
+top = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, top)
+
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.flow_table as flow_table
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def load_baseline (rev):
+  """
+  Loads flow_table as of the given git revision as a new module
+  """
+  src = subprocess.check_output(["git", "show",
+                                 rev + ":pox/openflow/flow_table.py"],
+                                cwd = top)
+  # The name makes its relative imports resolve within pox.openflow
+  m = imp.new_module("pox.openflow.flow_table_" + rev)
+  m.__file__ = "<%s:flow_table.py>" % (rev,)
+  exec compile(src, m.__file__, "exec") in m.__dict__
+  return m
+
+
+def host (i):
+  return (EthAddr("00:00:00:%02x:%02x:%02x" % (i >> 16, (i >> 8) & 0xff,
+                                                 i & 0xff)),
+          IPAddr("10.%i.%i.%i" % (i >> 16, (i >> 8) & 0xff, i & 0xff)))
+
+
+def make_matches (size):
+  """
+  Returns a list of (priority, match) for a table of the given size
+
+  Most entries are exact 5-tuple flows between hosts, some are per-
+  destination-MAC L2 entries, and a few are subnet/port ACL-ish entries.
+  """
+  r = []
+  for i in xrange(size):
+    kind = i % 10
+    mac,ip = host(i)
+    if kind < 7:
+      m = of.ofp_match(in_port = 1 + i % 4, dl_src = mac,
+                       dl_dst = host(i+1)[0], dl_type = 0x0800,
+                       nw_proto = 6, nw_src = ip, nw_dst = host(i+1)[1],
+                       tp_src = 1024 + i % 1000, tp_dst = 80)
+      r.append((of.OFP_DEFAULT_PRIORITY, m))
+    elif kind < 9:
+      r.append((100, of.ofp_match(dl_dst = mac)))
+    else:
+      m = of.ofp_match(dl_type = 0x0800, nw_src = (ip, 24),
+                       nw_proto = 17, tp_dst = i % 65536)
+      r.append((200, m))
+  return r
+
+
+def make_packets (count, size):
+  r = []
+  for j in xrange(count):
+    i = (j * 7919) % size
+    mac,ip = host(i)
+    mac2,ip2 = host(i+1)
+    e = pkt.ethernet(src = mac, dst = mac2, type = pkt.ethernet.IP_TYPE)
+    ipp = pkt.ipv4(srcip = ip, dstip = ip2, protocol = pkt.ipv4.TCP_PROTOCOL)
+    ipp.payload = pkt.tcp(srcport = 1024 + i % 1000, dstport = 80, off = 5)
+    e.payload = ipp
+    r.append((pkt.ethernet(e.pack()), 1 + i % 4))
+  return r
+
+
+def rate (f, items):
+  t = time.time()
+  for i in items:
+    f(i)
+  return len(items) / (time.time() - t)
+
+
+def bench (ft, size, label, count):
+  matches = make_matches(size)
+  table = ft.FlowTable()
+  t = time.time()
+  for p,m in matches:
+    table.add_entry(ft.TableEntry(priority = p, match = m))
+  add_rate = size / (time.time() - t)
+
+  packets = make_packets(count, size)
+  lookup = rate(lambda p: table.entry_for_packet(*p), packets)
+
+  queries = [matches[(i * 104729) % size][1] for i in xrange(count // 10)]
+  stats = rate(lambda m: table.flow_stats(m), queries)
+
+  victims = [matches[(i * 15485863) % size] for i in xrange(count // 10)]
+  delete = rate(lambda pm: table.remove_matching_entries(pm[1], pm[0],
+                                                         strict = True),
+                victims)
+
+  print("%-10s %6i entries: add %9.0f/s  lookup %9.0f/s  "
+        "stats %8.0f/s  strict delete %8.0f/s"
+        % (label, size, add_rate, lookup, stats, delete))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--sizes", default="1000,10000,50000")
+  parser.add_option("--count", type="int", default=1000)
+  parser.add_option("--baseline", default=None,
+                    help="git revision to compare against")
+  opts,args = parser.parse_args()
+
+  sizes = [int(x) for x in opts.sizes.split(",")]
+  modules = [("current", flow_table)]
+  if opts.baseline:
+    modules.insert(0, (opts.baseline[:10], load_baseline(opts.baseline)))
+
+  for size in sizes:
+    for label,ft in modules:
+      bench(ft, size, label, opts.count)
+
+
+if __name__ == "__main__":
+  main()
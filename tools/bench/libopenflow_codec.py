@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmark for libopenflow_01 packing and unpacking
+
+Reports pack(), pack_into(), and unpack throughput for flow_mods,
+packet_outs, and packet_ins.  With --baseline=REV, the same numbers are
+also reported for libopenflow_01.py as of git revision REV so that the
+two can be compared.
+
+Invoke from the top level:
+  ./tools/bench/libopenflow_codec.py [--count=N] [--baseline=REV]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import subprocess
+import imp
+
+top = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, top)
+
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def load_baseline (rev):
+  """
+  Loads libopenflow_01 as of the given git revision as a new module
+  """
+  src = subprocess.check_output(["git", "show",
+                                 rev + ":pox/openflow/libopenflow_01.py"],
+                                cwd = top)
+  m = imp.new_module("libopenflow_01_" + rev)
+  m.__file__ = "<%s:libopenflow_01.py>" % (rev,)
+  exec compile(src, m.__file__, "exec") in m.__dict__
+  return m
+
+
+def make_messages (of):
+  match = of.ofp_match(in_port = 1, dl_src = EthAddr("00:00:00:00:00:01"),
+                       dl_dst = EthAddr("00:00:00:00:00:02"),
+                       dl_type = 0x0800, nw_proto = 6,
+                       nw_src = IPAddr("10.0.0.1"),
+                       nw_dst = IPAddr("10.0.0.2"), tp_src = 1234,
+                       tp_dst = 80)
+  fm = of.ofp_flow_mod(match = match, idle_timeout = 10, priority = 100,
+                       actions = [of.ofp_action_output(port = 2),
+                                  of.ofp_action_output(port = 3)])
+  po = of.ofp_packet_out(data = b'x' * 100,
+                         actions = of.ofp_action_output(port = 4))
+  pi = of.ofp_packet_in(in_port = 1, buffer_id = 42, data = b'x' * 128)
+  return [("flow_mod", fm), ("packet_out", po), ("packet_in", pi)]
+
+
+def rate (f, count):
+  t = time.time()
+  for _ in xrange(count):
+    f()
+  return count / (time.time() - t)
+
+
+def bench (of, count, label):
+  for name,msg in make_messages(of):
+    raw = msg.pack()
+    cls = type(msg)
+    print("%-10s %-10s pack      : %10.0f msgs/sec"
+          % (label, name, rate(msg.pack, count)))
+    if hasattr(msg, 'pack_into'):
+      buf = bytearray(len(raw))
+      print("%-10s %-10s pack_into : %10.0f msgs/sec"
+            % (label, name, rate(lambda: msg.pack_into(buf), count)))
+    print("%-10s %-10s unpack    : %10.0f msgs/sec"
+          % (label, name, rate(lambda: cls.unpack_new(raw), count)))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--count", type="int", default=50000)
+  parser.add_option("--baseline", default=None,
+                    help="git revision to compare against")
+  opts,args = parser.parse_args()
+
+  if opts.baseline:
+    bench(load_baseline(opts.baseline), opts.count, opts.baseline[:10])
+  bench(of, opts.count, "current")
+
+
+if __name__ == "__main__":
+  main()
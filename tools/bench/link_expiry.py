@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for discovery's link expiry
+
+Simulates discovery (on a fake clock) with --links links which are heard
+from once per send cycle at spread-out times, --dead of which go quiet,
+and reports the time per expiry check and per link refresh.  With
+--scan, each check scans every link, as it used to, and refreshing is
+just setting the timestamp.
+
+Invoke from the top level:
+  ./tools/bench/link_expiry.py [--links=N] [--dead=N] [--scan]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.core
+pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+import pox.openflow.discovery as discovery
+from pox.openflow.discovery import Discovery, Link
+
+
+class FakeClock (object):
+  now = 0.0
+  def time (self):
+    return self.now
+
+
+class ScanDiscovery (Discovery):
+  """
+  Discovery with the old full scan
+  """
+  def _expire_links (self):
+    now = discovery.time.time()
+    expired = [link for link,timestamp in self.adjacency.iteritems()
+               if timestamp + self._link_timeout < now]
+    if expired:
+      self._delete_links(expired)
+      self.expired_links += len(expired)
+
+  def _refresh_link (self, link):
+    self.adjacency[link] = discovery.time.time()
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--links", type="int", default=50000)
+  parser.add_option("--dead", type="int", default=100)
+  parser.add_option("--cycles", type="int", default=10)
+  parser.add_option("--scan", action="store_true", default=False,
+                    help="scan all links on every check, as before")
+  opts,args = parser.parse_args()
+
+  clock = discovery.time = FakeClock()
+  d = (ScanDiscovery if opts.scan else Discovery)(install_flow = False)
+  # (Link's hash is the sum of its dpids and ports; keep them distinct)
+  links = [Link(i + 1, 1, (i + 1) << 16, 2, 'lldp', True)
+           for i in range(opts.links)]
+
+  # Time is in steps of a tenth of a send cycle; each link is heard from
+  # in one step of each cycle, and expiry is checked every check period
+  steps = 10
+  step = d.send_cycle_time / steps
+  check_every = int(round(d._timeout_check_period / step))
+  groups = [list(enumerate(links))[i::steps] for i in range(steps)]
+  refresh_time = 0
+  refreshes = 0
+  check_time = 0
+  checks = 0
+  for n in range(opts.cycles * steps):
+    clock.now += step
+    start = time.time()
+    for i,link in groups[n % steps]:
+      if n < steps or i >= opts.dead:
+        d._refresh_link(link)
+        refreshes += 1
+    refresh_time += time.time() - start
+    if n % check_every == 0:
+      start = time.time()
+      d._expire_links()
+      check_time += time.time() - start
+      checks += 1
+
+  print("%i links (%s): check %8.2f ms, refresh %5.2f us, %i expired"
+        % (opts.links, "scanning" if opts.scan else "wheel",
+           check_time / checks * 1000, refresh_time / refreshes * 1e6,
+           d.expired_links))
+  core.quit()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for reading discovery probes
+
+Compares getting the originator's DPID and port from discovery's own
+probes with the fixed-offset reader which discovery now uses against the
+full parse (pox.lib.packet plus TLV objects) which it falls back on for
+foreign LLDP.
+
+Invoke from the top level:
+  ./tools/bench/lldp_parse.py [--count=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.core
+pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+from pox.openflow.discovery import LLDPAndBroadcastSender, Discovery
+from pox.openflow.discovery import _parse_probe
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr
+
+
+def full_parse (raw):
+  return Discovery._parse_lldp(pkt.ethernet(raw))
+
+
+def bench (label, f, probes):
+  start = time.time()
+  for raw in probes:
+    f(raw)
+  elapsed = time.time() - start
+  print("%-12s %9.0f probes/s  %6.2f us each"
+        % (label, len(probes) / elapsed, elapsed / len(probes) * 1e6))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--count", type="int", default=50000)
+  opts,args = parser.parse_args()
+
+  make = (LLDPAndBroadcastSender._create_discovery_packet,
+          LLDPAndBroadcastSender._create_broadcast_discovery_packet)
+  probes = []
+  for i in range(opts.count):
+    eth = make[i % 2](i // 48 + 1, i % 48 + 1, EthAddr("02:00:00:00:00:01"),
+                      120)
+    probes.append(eth.pack())
+
+  bench("full parse", full_parse, probes)
+  bench("fast path", _parse_probe, probes)
+  core.quit()
+
+
+if __name__ == "__main__":
+  main()
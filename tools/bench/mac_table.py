@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for pox.lib.mac_table.MacTable
+
+Learns the given numbers of MACs spread over the edge ports of a set of
+switches, then measures learning (including host moves), lookups, and
+unlearning the MACs on the two ends of a link.  That's what l2_multi does
+when discovery finds a link.  The old way was a scan of the entire
+mac_map.  Memory is the size of the containers themselves (the MAC and
+location objects are shared, so they're not counted).
+
+Invoke from the top level:
+  ./tools/bench/mac_table.py [--macs=10000,100000] [--flaps=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.mac_table import MacTable
+from pox.lib.addresses import EthAddr
+
+
+def container_bytes (t):
+  r = sys.getsizeof(t)
+  at = getattr(t, "_at", None)
+  if at is not None:
+    r += sys.getsizeof(at)
+    r += sum(sys.getsizeof(s) for s in at.itervalues())
+  return r
+
+
+def scan_unlearn (mac_map, sw1, port1, sw2, port2):
+  """
+  What l2_multi used to do
+  """
+  bad_macs = set()
+  for mac,(sw,port) in mac_map.iteritems():
+    if sw is sw1 and port == port1: bad_macs.add(mac)
+    if sw is sw2 and port == port2: bad_macs.add(mac)
+  for mac in bad_macs:
+    del mac_map[mac]
+  return bad_macs
+
+
+def index_unlearn (mac_map, sw1, port1, sw2, port2):
+  r = list(mac_map.forget_location((sw1, port1)))
+  r.extend(mac_map.forget_location((sw2, port2)))
+  return r
+
+
+def bench (label, cls, unlearn, count, opts, rng):
+  sws = [object() for i in range(opts.switches)]
+  locs = [(sw, p) for sw in sws for p in range(1, opts.ports + 1)]
+  macs = [EthAddr("%012x" % (0x020000000000 + i)) for i in xrange(count)]
+  learned = [(m, rng.choice(locs)) for m in macs]
+  moves = [(rng.choice(macs), rng.choice(locs)) for i in xrange(count)]
+
+  t = cls()
+  start = time.time()
+  for m,loc in learned:
+    t[m] = loc
+  for m,loc in moves:
+    t[m] = loc
+  learn = (len(learned) + len(moves)) / (time.time() - start)
+
+  start = time.time()
+  for m in macs:
+    t.get(m)
+  lookup = len(macs) / (time.time() - start)
+
+  size = container_bytes(t)
+
+  elapsed = 0
+  forgotten = 0
+  for i in xrange(opts.flaps):
+    (sw1,port1),(sw2,port2) = rng.sample(locs, 2)
+    start = time.time()
+    gone = unlearn(t, sw1, port1, sw2, port2)
+    elapsed += time.time() - start
+    forgotten += len(gone)
+    for m in gone:
+      t[m] = rng.choice(locs)
+
+  print("%-8s %6i MACs: %7.0f KiB  learn %8.0f/s  lookup %9.0f/s  "
+        "unlearn %9.1f us (%i MACs each)"
+        % (label, count, size / 1024.0, learn, lookup,
+           elapsed / opts.flaps * 1e6, forgotten // opts.flaps))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--macs", default="10000,100000")
+  parser.add_option("--switches", type="int", default=100)
+  parser.add_option("--ports", type="int", default=48)
+  parser.add_option("--flaps", type="int", default=200)
+  opts,args = parser.parse_args()
+
+  for count in [int(x) for x in opts.macs.split(",")]:
+    bench("dict", dict, scan_unlearn, count, opts, random.Random(1))
+    bench("MacTable", MacTable, index_unlearn, count, opts, random.Random(1))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures the per-pass cost of the OpenFlow listener's socket wait
+
+Compares what a pass of OpenFlow_01_Task costs (building the select
+lists from every connection, as SelectHub does, and waiting on them with
+EpollSelect since there are more than FD_SETSIZE sockets) against a pass
+of OpenFlow_01_EpollTask (polling a persistent epoll set and looking the
+ready fd up in a dict).  On each pass a single "switch" has data waiting.
+Disconnect cost (removing one connection) is also reported.
+
+UDP sockets stand in for switch connections so that each switch only
+needs one descriptor.  Linux only.
+
+Invoke from the top level:
+  ./tools/bench/of_01_epoll.py [--switches=1000,5000,10000] [--passes=N]
+"""
+
+import sys
+import os.path
+import time
+import socket
+import select
+import resource
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.epoll_select import EpollSelect
+
+
+class FakeConnection (object):
+  def __init__ (self, sock):
+    self.sock = sock
+  def fileno (self):
+    return self.sock.fileno()
+  def read (self):
+    self.sock.recv(64)
+
+
+def make_switches (count):
+  cons = []
+  for _ in xrange(count):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    s.setblocking(0)
+    cons.append(FakeConnection(s))
+  return cons
+
+
+def bench_list_select (cons, sender, passes):
+  sockets = list(cons)
+  es = EpollSelect()
+  task = object()
+  t = time.time()
+  for i in xrange(passes):
+    target = cons[(i * 7919) % len(cons)]
+    sender.sendto(b"x" * 8, target.sock.getsockname())
+    # This is what SelectHub._select() does with a task's Select()
+    rl = {}
+    xl = {}
+    for s in sockets: rl[s] = task
+    for s in sockets: xl[s] = task
+    ro,wo,xo = es.select(rl.keys(), [], xl.keys(), 1)
+    for con in ro:
+      con.read()
+  per_pass = (time.time() - t) / passes
+
+  t = time.time()
+  sockets.remove(cons[len(cons)//2])
+  remove = time.time() - t
+  es.close()
+  return per_pass, remove
+
+
+def bench_persistent_epoll (cons, sender, passes):
+  poller = select.epoll()
+  by_fd = {}
+  for con in cons:
+    by_fd[con.fileno()] = con
+    poller.register(con.fileno(), select.EPOLLIN | select.EPOLLET)
+  t = time.time()
+  for i in xrange(passes):
+    target = cons[(i * 7919) % len(cons)]
+    sender.sendto(b"x" * 8, target.sock.getsockname())
+    for fd,event in poller.poll(1):
+      by_fd[fd].read()
+  per_pass = (time.time() - t) / passes
+
+  t = time.time()
+  con = cons[len(cons)//2]
+  del by_fd[con.fileno()]
+  poller.unregister(con.fileno())
+  remove = time.time() - t
+  poller.close()
+  return per_pass, remove
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", default="1000,5000,10000")
+  parser.add_option("--passes", type="int", default=200)
+  opts,args = parser.parse_args()
+
+  sizes = [int(x) for x in opts.switches.split(",")]
+  soft,hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  want = max(sizes) + 64
+  if soft < want:
+    try:
+      resource.setrlimit(resource.RLIMIT_NOFILE, (min(want, hard), hard))
+    except Exception:
+      pass
+  soft,hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+  sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+  print("%8s  %16s  %16s  %14s  %14s" % ("switches", "list pass (us)",
+        "epoll pass (us)", "list rm (us)", "epoll rm (us)"))
+  for n in sizes:
+    if n + 64 > soft:
+      print("%8i  skipped (descriptor limit is %i)" % (n, soft))
+      continue
+    cons = make_switches(n)
+    lp,lr = bench_list_select(cons, sender, opts.passes)
+    ep,er = bench_persistent_epoll(cons, sender, opts.passes)
+    print("%8i  %16.1f  %16.1f  %14.1f  %14.1f" % (n, lp * 1e6, ep * 1e6,
+                                                 lr * 1e6, er * 1e6))
+    for con in cons:
+      con.sock.close()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmark for of_01.Connection.read()
+
+Feeds a canned stream of OpenFlow messages through a Connection using a
+fake socket and reports messages per second.  Two streams are used:
+64 byte ECHO_REQUESTs and 1500 byte PACKET_INs.
+
+Invoke from the top level:
+  ./tools/bench/of_01_read.py [--count=N] [--read-size=N ...]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.core
+pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.of_01 as of_01
+
+
+class FakeSocket (object):
+  """
+  A socket which returns a canned stream of bytes
+  """
+  def __init__ (self, data):
+    self.data = data
+    self.offset = 0
+
+  def recv (self, bufsize):
+    d = self.data[self.offset:self.offset+bufsize]
+    self.offset += len(d)
+    return d
+
+  def recv_into (self, buffer, nbytes = 0):
+    d = self.recv(nbytes or len(buffer))
+    buffer[0:len(d)] = d
+    return len(d)
+
+  def send (self, data):
+    return len(data)
+
+  def fileno (self):
+    return -1
+
+
+def _nop (con, msg):
+  pass
+
+
+def make_stream (kind, count):
+  if kind == "echo":
+    m = of.ofp_echo_request(body = b"\x00" * 56)
+  else:
+    m = of.ofp_packet_in(in_port = 1, buffer_id = 7,
+                         data = b"\xaa" * (1500 - 18))
+  return m.pack() * count
+
+
+def bench_connection (data, count, legacy = False):
+  con = of_01.Connection(FakeSocket(data))
+  con.handlers = [_nop] * len(con.handlers)
+  if legacy:
+    con._recv_into = None
+  t = time.time()
+  while con.read():
+    pass
+  return count / (time.time() - t)
+
+
+def bench_concatenating (data, count, read_size):
+  """
+  The old approach: append to a string and slice off what was consumed
+  """
+  sock = FakeSocket(data)
+  unpackers = of_01.unpackers
+  buf = b''
+  t = time.time()
+  while True:
+    d = sock.recv(read_size)
+    if not d: break
+    buf += d
+    buf_len = len(buf)
+    offset = 0
+    while buf_len - offset >= 8:
+      ofp_type = ord(buf[offset+1])
+      if ord(buf[offset]) != of.OFP_VERSION: return 0
+      msg_length = ord(buf[offset+2]) << 8 | ord(buf[offset+3])
+      if buf_len - offset < msg_length: break
+      offset,msg = unpackers[ofp_type](buf, offset)
+      try:
+        _nop(None, msg)
+      except:
+        continue
+    if offset != 0:
+      buf = buf[offset:]
+  return count / (time.time() - t)
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--count", type="int", default=50000)
+  parser.add_option("--read-size", type="int", action="append",
+                    dest="read_sizes", default=None)
+  opts,args = parser.parse_args()
+
+  # Sends are only queued; the writer is never started
+  of_01.connectionWriter = of_01.ConnectionWriter()
+
+  for read_size in opts.read_sizes or [2048, 16384, 65536]:
+    of_01.Connection.read_size = read_size
+    for kind in ("echo", "packet_in"):
+      data = make_stream(kind, opts.count)
+      print("%-9s  read_size=%i" % (kind, read_size))
+      print("  concatenating buffer   : %10.0f msgs/sec"
+            % (bench_concatenating(data, opts.count, read_size),))
+      print("  Connection (recv)      : %10.0f msgs/sec"
+            % (bench_connection(data, opts.count, legacy=True),))
+      print("  Connection (recv_into) : %10.0f msgs/sec"
+            % (bench_connection(data, opts.count),))
+
+
+if __name__ == "__main__":
+  try:
+    main()
+  finally:
+    pox.core.core.quit()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+PacketIn flood benchmark for path installs
+
+Drives a forwarding component's PacketIn handler with --flows new flows
+between hosts on a line of switches, each of which sends --packets
+packets before its path's barriers come back (as a fast sender does
+while a path is being set up).  Reports the flow_mods sent, how many
+redundant installs were avoided, how many packets were held or dropped,
+and the time spent handling PacketIns.  With --no-suppress, the
+pending-install table is emptied before every PacketIn, which is how
+things worked before it existed.
+
+Invoke from the top level:
+  ./tools/bench/packet_in_storm.py [--component=load_balancing]
+                                   [--flows=N] [--packets=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.core
+pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.openflow import PacketIn
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.sent = []
+  def send (self, msg):
+    self.sent.append(msg)
+  def addListeners (self, *args, **kw):
+    return []
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.sent = []
+  def sendToDPID (self, dpid, msg):
+    self.sent.append((dpid, msg))
+
+
+class FakeBarrierIn (object):
+  def __init__ (self, dpid, xid):
+    self.dpid = dpid
+    self.xid = xid
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--component", default="load_balancing",
+                    help="l2_multi or load_balancing")
+  parser.add_option("--switches", type="int", default=4)
+  parser.add_option("--flows", type="int", default=500)
+  parser.add_option("--packets", type="int", default=20)
+  parser.add_option("--no-suppress", dest="suppress", action="store_false",
+                    default=True)
+  opts,args = parser.parse_args()
+
+  m = __import__("pox.forwarding." + opts.component, fromlist=["x"])
+  flushes = []
+  m.installer._defer = flushes.append
+  m.installer.timeout = 3600 # Don't fail anything while we're busy
+  openflow = FakeOpenFlow()
+  core.register("openflow", openflow)
+  core.registerNew(m.l2_multi)
+  app = core.l2_multi
+
+  sws = []
+  for i in range(1, opts.switches + 1):
+    sw = m.Switch()
+    sw.dpid = i
+    sw.ports = []
+    sw.connection = FakeConnection(i)
+    sw._connected_at = 0
+    m.switches[i] = sw
+    if hasattr(m, "shortest_paths"): m.shortest_paths.add_node(sw)
+    sws.append(sw)
+  for a,b in zip(sws[:-1], sws[1:]):
+    if hasattr(m, "_link"):
+      m._link(a, b, 2, 1, {})
+    else:
+      m.adjacency[a][b] = 2
+      m.adjacency[b][a] = 1
+
+  src = EthAddr("00:00:00:00:00:01")
+  dst = EthAddr("00:00:00:00:00:02")
+  m.mac_map[src] = (sws[0], 10)
+  m.mac_map[dst] = (sws[-1], 10)
+
+  packet_ins = []
+  buffer_id = 0
+  for p in range(opts.packets):
+    for f in range(opts.flows):
+      e = pkt.ethernet(src = src, dst = dst, type = pkt.ethernet.IP_TYPE)
+      ip = pkt.ipv4(srcip = IPAddr("10.0.0.1"), dstip = IPAddr("10.0.0.2"),
+                    protocol = pkt.ipv4.TCP_PROTOCOL)
+      ip.payload = pkt.tcp(srcport = 1024 + f, dstport = 80, off = 5)
+      e.payload = ip
+      buffer_id += 1
+      o = of.ofp_packet_in(in_port = 10, buffer_id = buffer_id,
+                           data = e.pack())
+      packet_ins.append(PacketIn(sws[0].connection, o))
+
+  t = time.time()
+  for event in packet_ins:
+    if not opts.suppress: m.pending_installs.clear()
+    sws[0]._handle_PacketIn(event)
+  elapsed = time.time() - t
+  for f in flushes: f()
+  for sw in sws:
+    for msg in sw.connection.sent:
+      if isinstance(msg, of.ofp_barrier_request):
+        m.installer.barrier_in(FakeBarrierIn(sw.dpid, msg.xid))
+
+  flow_mods = sum(isinstance(msg, of.ofp_flow_mod)
+                  for sw in sws for msg in sw.connection.sent)
+  print("%s%s: %i PacketIns for %i flows in %.1f ms"
+        % (opts.component, "" if opts.suppress else " (no suppression)",
+           len(packet_ins), opts.flows, elapsed * 1000))
+  print("  flow_mods sent:             %8i" % (flow_mods,))
+  print("  redundant installs avoided: %8i" % (app.redundant_installs_avoided,))
+  print("  packets sent after install: %8i" % (len(openflow.sent),))
+  print("  packets dropped:            %8i" % (app.held_packets_dropped,))
+  core.quit()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for installing a burst of paths
+
+Sets up --flows new bidirectional flows between random leaves of a
+leaf-spine fabric at once, as l2_multi does for a burst of PacketIns,
+either the old way (a flow_mod and a barrier per hop) or with a
+PathInstaller (one barrier per switch for the whole burst).  Switches are
+simulated: each handles its messages in order, taking --flow-mod-us per
+flow_mod and --barrier-us per barrier, and replies after --rtt-us.  The
+report gives messages sent, controller time, and the simulated setup
+latency of the forward paths (when their buffered packets could go).
+
+Invoke from the top level:
+  ./tools/bench/path_install.py [--switches=N] [--flows=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.openflow.path_install import PathInstaller
+import pox.openflow.libopenflow_01 as of
+
+
+class FakeSwitch (object):
+  """
+  A switch which works through its messages in order (in simulated time)
+  """
+  def __init__ (self, dpid, opts):
+    self.dpid = dpid
+    self.opts = opts
+    self.clock = 0.0
+    self.barriers = [] # (xid, time reply arrives)
+    self.messages = 0
+
+  def send (self, msg):
+    self.messages += 1
+    if isinstance(msg, of.ofp_barrier_request):
+      self.clock += self.opts.barrier_us
+      self.barriers.append((msg.xid, self.clock + self.opts.rtt_us))
+    else:
+      self.clock += self.opts.flow_mod_us
+
+
+class FakeBarrierIn (object):
+  def __init__ (self, dpid, xid):
+    self.dpid = dpid
+    self.xid = xid
+
+
+def make_paths (opts, rng):
+  spines = max(4, opts.switches // 8)
+  sws = [FakeSwitch(i, opts) for i in range(opts.switches)]
+  paths = []
+  for i in xrange(opts.flows):
+    a,b = rng.sample(range(spines, opts.switches), 2)
+    s = rng.randrange(spines)
+    paths.append([(sws[a], 1, 100 + s), (sws[s], a, b), (sws[b], 100 + s, 1)])
+  return sws, paths
+
+
+def replies (sws):
+  r = []
+  for sw in sws:
+    r.extend((t, sw.dpid, xid) for xid,t in sw.barriers)
+  r.sort()
+  return r
+
+
+def old_way (opts, rng):
+  sws,paths = make_paths(opts, rng)
+  done_at = {}
+  waiting = {} # (dpid,xid) -> forward path index
+  t = time.time()
+  for i,p in enumerate(paths):
+    for path,forward in ((p, True),
+                         ([(s,o,n) for s,n,o in reversed(p)], False)):
+      for sw,in_port,out_port in path:
+        msg = of.ofp_flow_mod(match = of.ofp_match(in_port = in_port))
+        msg.actions.append(of.ofp_action_output(port = out_port))
+        sw.send(msg)
+        b = of.ofp_barrier_request()
+        sw.send(b)
+        if forward: waiting[(sw.dpid,b.xid)] = i
+  elapsed = time.time() - t
+  for when,dpid,xid in replies(sws):
+    i = waiting.get((dpid,xid))
+    if i is not None: done_at[i] = when
+  return sws, elapsed, done_at.values()
+
+
+def installer_way (opts, rng):
+  sws,paths = make_paths(opts, rng)
+  flushes = []
+  installer = PathInstaller(defer = flushes.append)
+  now = [None]
+  done_at = {}
+  def installed (txn, i):
+    done_at[i] = now[0]
+  t = time.time()
+  for i,p in enumerate(paths):
+    for path,forward in ((p, True),
+                         ([(s,o,n) for s,n,o in reversed(p)], False)):
+      txn = installer.begin(installed if forward else None, i)
+      for sw,in_port,out_port in path:
+        msg = of.ofp_flow_mod(match = of.ofp_match(in_port = in_port))
+        msg.actions.append(of.ofp_action_output(port = out_port))
+        txn.send(sw, msg)
+      txn.commit()
+  for f in flushes: f()
+  elapsed = time.time() - t
+
+  for when,dpid,xid in replies(sws):
+    now[0] = when
+    installer.barrier_in(FakeBarrierIn(dpid, xid))
+  return sws, elapsed, done_at.values()
+
+
+def report (label, sws, elapsed, latencies):
+  latencies = sorted(latencies)
+  print("%-10s %7i messages  %7.1f ms controller  setup latency "
+        "mean %8.1f us  p99 %8.1f us  max %8.1f us"
+        % (label, sum(sw.messages for sw in sws), elapsed * 1000,
+           sum(latencies) / len(latencies),
+           latencies[int(len(latencies) * 0.99) - 1], latencies[-1]))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", type="int", default=40)
+  parser.add_option("--flows", type="int", default=2000)
+  parser.add_option("--flow-mod-us", dest="flow_mod_us", type="float",
+                    default=20)
+  parser.add_option("--barrier-us", dest="barrier_us", type="float",
+                    default=50)
+  parser.add_option("--rtt-us", dest="rtt_us", type="float", default=200)
+  opts,args = parser.parse_args()
+
+  print("%i switches, burst of %i flows" % (opts.switches, opts.flows))
+  report("per-hop", *old_way(opts, random.Random(1)))
+  report("batched", *installer_way(opts, random.Random(1)))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for pox.lib.graph.paths.PathMatrix
+
+Times computing all-pairs shortest paths for a leaf-spine-ish fabric the
+way load_balancing's and topo_proactive's _calc_paths() used to (a
+Floyd-Warshall over dicts of dicts of (distance, intermediate)) against
+PathMatrix with its pure-Python BFS and, if NumPy is installed, its
+matrix BFS.  Floyd-Warshall is cubic, so it's skipped above
+--max-floyd-warshall switches.
+
+Invoke from the top level:
+  ./tools/bench/path_matrix.py [--switches=50,200,1000]
+                               [--max-floyd-warshall=N]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.graph.paths import PathMatrix, ShortestPaths
+import pox.lib.graph.paths as paths
+
+
+def make_adjacency (count, rng):
+  """
+  Returns adjacency for a two-tier fabric of about count switches
+
+  An eighth of the switches are spines; every leaf connects to four of
+  them.
+  """
+  spines = max(4, count // 8)
+  adj = defaultdict(set)
+  for leaf in range(spines, count):
+    for spine in rng.sample(range(spines), 4):
+      adj[leaf].add(spine)
+      adj[spine].add(leaf)
+  return dict(adj)
+
+
+def floyd_warshall (adj):
+  """
+  The old _calc_paths()
+  """
+  sws = list(adj)
+  path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+  for k in sws:
+    for j in adj[k]:
+      path_map[k][j] = (1,None)
+    path_map[k][k] = (0,None)
+  for k in sws:
+    for i in sws:
+      for j in sws:
+        if path_map[i][k][0] is not None:
+          if path_map[k][j][0] is not None:
+            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
+            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
+              path_map[i][j] = (ikj_dist, k)
+  return path_map
+
+
+def timed (f, *args, **kw):
+  t = time.time()
+  f(*args, **kw)
+  return (time.time() - t) * 1000
+
+
+def bench (count, max_fw):
+  adj = make_adjacency(count, random.Random(count))
+  links = sum(len(x) for x in adj.itervalues()) // 2
+  print("%5i switches, %5i links:" % (count, links))
+  if count <= max_fw:
+    print("  Floyd-Warshall        : %10.1f ms" % (timed(floyd_warshall, adj),))
+  print("  PathMatrix (Python)   : %10.1f ms"
+        % (timed(PathMatrix, adj, use_numpy = False),))
+  if paths.numpy is not None:
+    print("  PathMatrix (NumPy)    : %10.1f ms"
+          % (timed(PathMatrix, adj, use_numpy = True),))
+
+  sp = ShortestPaths()
+  for a,bs in adj.iteritems():
+    for b in bs:
+      if a < b: sp.add_link(a, b)
+  print("  ShortestPaths        : %10.1f ms" % (timed(sp.recompute),))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", default="50,200,1000")
+  parser.add_option("--max-floyd-warshall", dest="max_fw", type="int",
+                    default=200, help="skip the old algorithm above this")
+  opts,args = parser.parse_args()
+
+  if paths.numpy is None:
+    print("(NumPy isn't installed; only the pure-Python BFS is timed)")
+  for count in [int(x) for x in opts.switches.split(",")]:
+    bench(count, opts.max_fw)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmark for the recoco SelectHub
+
+Registers a number of sleeping tasks with a non-threaded SelectHub (as
+lots of Timers or Sleep()ing tasks would) and times how many select
+cycles it can run per second while none of them are due.  The pinger is
+pinged before each cycle so that select() returns immediately and only
+the hub's own bookkeeping is measured.  With --baseline=REV, recoco.py as
+of git revision REV is measured too.
+
+Invoke from the top level:
+  ./tools/bench/recoco_select.py [--timers=100,1000,10000] [--baseline=REV]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import subprocess
+import imp
+
+top = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, top)
+
+import pox.lib.recoco.recoco as recoco
+
+
+def load_baseline (rev):
+  """
+  Loads recoco as of the given git revision as a new module
+  """
+  src = subprocess.check_output(["git", "show",
+                                 rev + ":pox/lib/recoco/recoco.py"],
+                                cwd = top)
+  m = imp.new_module("pox.lib.recoco.recoco_" + rev)
+  m.__file__ = "<%s:recoco.py>" % (rev,)
+  exec compile(src, m.__file__, "exec") in m.__dict__
+  return m
+
+
+class FakeScheduler (object):
+  _hasQuit = False
+  def __init__ (self):
+    self.woken = 0
+  def fast_schedule (self, task):
+    self.woken += 1
+
+
+class FakeTask (object):
+  pass
+
+
+def bench (rc, timers, cycles, label):
+  sched = FakeScheduler()
+  hub = rc.SelectHub(sched, threaded = False)
+  now = time.time()
+  for i in xrange(timers):
+    hub.registerTimer(FakeTask(), now + 3600 + i, True)
+  hub._select(hub._tasks, {}) # Pick up the registrations
+
+  rets = {}
+  t = time.time()
+  for _ in xrange(cycles):
+    hub._pinger.ping()
+    hub._select(hub._tasks, rets)
+  elapsed = time.time() - t
+  assert sched.woken == 0
+  print("%-10s %6i timers: %9.0f cycles/sec  (%6.1f us/cycle)"
+        % (label, timers, cycles / elapsed, elapsed / cycles * 1e6))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--timers", default="100,1000,10000")
+  parser.add_option("--cycles", type="int", default=2000)
+  parser.add_option("--baseline", default=None,
+                    help="git revision to compare against")
+  opts,args = parser.parse_args()
+
+  sizes = [int(x) for x in opts.timers.split(",")]
+  modules = [("current", recoco)]
+  if opts.baseline:
+    modules.insert(0, (opts.baseline[:10], load_baseline(opts.baseline)))
+
+  for size in sizes:
+    for label,rc in modules:
+      bench(rc, size, opts.cycles, label)
+
+
+if __name__ == "__main__":
+  main()
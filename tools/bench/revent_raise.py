@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmark for revent's EventMixin.raiseEvent
+
+Raises an event type (with constructor arguments, as of_01 does for
+PacketIn) on a source with 0, 1, and 5 listeners, as well as raising an
+already-constructed event, and reports raises per second.  With
+--baseline=REV, revent.py as of git revision REV is measured too.
+
+Invoke from the top level:
+  ./tools/bench/revent_raise.py [--count=N] [--baseline=REV]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import subprocess
+import imp
+
+top = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, top)
+
+import pox.lib.revent.revent as revent
+
+
+def load_baseline (rev):
+  """
+  Loads revent as of the given git revision as a new module
+  """
+  src = subprocess.check_output(["git", "show",
+                                 rev + ":pox/lib/revent/revent.py"],
+                                cwd = top)
+  m = imp.new_module("pox.lib.revent.revent_" + rev)
+  m.__file__ = "<%s:revent.py>" % (rev,)
+  exec compile(src, m.__file__, "exec") in m.__dict__
+  return m
+
+
+def make_source (rv, listeners):
+  class Ping (rv.Event):
+    def __init__ (self, connection, ofp):
+      self.connection = connection
+      self.ofp = ofp
+
+  class Source (rv.EventMixin):
+    _eventMixin_events = set([Ping])
+
+  s = Source()
+  for i in range(listeners):
+    s.addListener(Ping, lambda event: None)
+  return s, Ping
+
+
+def rate (f, count):
+  t = time.time()
+  for _ in xrange(count):
+    f()
+  return count / (time.time() - t)
+
+
+def bench (rv, count, label):
+  for listeners in (0, 1, 5):
+    s,Ping = make_source(rv, listeners)
+    by_type = rate(lambda: s.raiseEvent(Ping, s, None), count)
+    e = Ping(s, None)
+    by_object = rate(lambda: s.raiseEvent(e), count)
+    print("%-10s %i listeners: raise type %9.0f/s  raise object %9.0f/s"
+          % (label, listeners, by_type, by_object))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--count", type="int", default=200000)
+  parser.add_option("--baseline", default=None,
+                    help="git revision to compare against")
+  opts,args = parser.parse_args()
+
+  if opts.baseline:
+    bench(load_baseline(opts.baseline), opts.count, opts.baseline[:10])
+  bench(revent, opts.count, "current")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for pox.lib.graph.paths.ShortestPaths
+
+Builds a leaf-spine-ish fabric of the given number of switches and flaps
+random links, reporting the latency of the incremental update for each
+flap alongside the time for a full recompute: both ShortestPaths'
+recompute() and the Floyd-Warshall over dict-of-dicts which l2_multi's
+_calc_paths() used to do on the first PacketIn after every link event.
+It also compares building every equal-cost path for some switch pairs
+with sampling at most --max-paths of them.
+
+Invoke from the top level:
+  ./tools/bench/shortest_paths.py [--switches=50,300] [--flaps=N]
+                                  [--max-paths=K]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.graph.paths import ShortestPaths
+
+
+def make_links (count, rng):
+  """
+  Returns links for a two-tier fabric of about count switches
+
+  An eighth of the switches are spines; every leaf connects to four of
+  them.
+  """
+  spines = max(4, count // 8)
+  links = set()
+  for leaf in range(spines, count):
+    for spine in rng.sample(range(spines), 4):
+      links.add((spine, leaf))
+  return sorted(links)
+
+
+def floyd_warshall (nodes, links):
+  """
+  Hop counts and ECMP intermediates, as l2_multi used to compute them
+  """
+  adjacency = defaultdict(dict)
+  for a,b in links:
+    adjacency[a][b] = adjacency[b][a] = True
+  path_map = defaultdict(lambda:defaultdict(lambda: {}))
+  for k in nodes:
+    for j in nodes:
+      path_map[k][j]['distance'] = float("inf")
+      path_map[k][j]['intermediate'] = []
+    for j in adjacency[k]:
+      path_map[k][j]['distance'] = 1
+    path_map[k][k]['distance'] = 0
+  for k in nodes:
+    for i in nodes:
+      for j in nodes:
+        ikj_dist = path_map[i][k]['distance']+path_map[k][j]['distance']
+        if ikj_dist < path_map[i][j]['distance']:
+          path_map[i][j]['distance'] = ikj_dist
+          path_map[i][j]['intermediate'] = [k]
+        elif path_map[i][j]['distance'] == ikj_dist:
+          path_map[i][j]['intermediate'].append(k)
+  return path_map
+
+
+def bench_ecmp (sp, count, max_paths, rng):
+  pairs = [rng.sample(range(count), 2) for _ in range(200)]
+  t = time.time()
+  every = sum(len(list(sp.paths(a, b))) for a,b in pairs)
+  t2 = time.time()
+  some = sum(len(sp.sample_paths(a, b, max_paths)) for a,b in pairs)
+  t3 = time.time()
+  print("  all ECMP paths        : %9.3f ms per pair (%.1f paths)"
+        % ((t2 - t) / len(pairs) * 1000, every / float(len(pairs))))
+  print("  sampled ECMP paths    : %9.3f ms per pair (%.1f paths)"
+        % ((t3 - t2) / len(pairs) * 1000, some / float(len(pairs))))
+
+
+def bench (count, flaps, fw, max_paths):
+  rng = random.Random(count)
+  links = make_links(count, rng)
+  sp = ShortestPaths()
+  for a,b in links:
+    sp.add_link(a, b)
+
+  t = time.time()
+  sp.recompute()
+  recompute = time.time() - t
+
+  down = up = 0.0
+  pairs = 0
+  for l in rng.sample(links, flaps):
+    t = time.time()
+    pairs += sum(len(x) for x in sp.remove_link(*l).itervalues())
+    t2 = time.time()
+    pairs += sum(len(x) for x in sp.add_link(*l).itervalues())
+    up += time.time() - t2
+    down += t2 - t
+
+  print("%5i switches, %5i links:" % (count, len(links)))
+  print("  incremental link down : %9.3f ms" % (down / flaps * 1000,))
+  print("  incremental link up   : %9.3f ms" % (up / flaps * 1000,))
+  print("  pairs invalidated     : %9.1f per event" % (pairs / 2.0 / flaps,))
+  print("  full BFS recompute    : %9.3f ms" % (recompute * 1000,))
+  bench_ecmp(sp, count, max_paths, rng)
+  if fw:
+    t = time.time()
+    floyd_warshall(range(count), links)
+    print("  full Floyd-Warshall   : %9.3f ms" % ((time.time() - t) * 1000,))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", default="50,300")
+  parser.add_option("--flaps", type="int", default=50)
+  parser.add_option("--max-paths", dest="max_paths", type="int", default=16)
+  parser.add_option("--no-floyd-warshall", dest="fw", action="store_false",
+                    default=True, help="skip the (slow) old algorithm")
+  opts,args = parser.parse_args()
+
+  for count in [int(x) for x in opts.switches.split(",")]:
+    bench(count, opts.flaps, opts.fw, opts.max_paths)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for spanning tree updates over discovery's link database
+
+Builds a leaf-spine-ish fabric of --switches switches (each leaf has four
+uplinks and the rest of its --ports are edge ports), fills in a discovery
+link table and feeds the links to openflow.spanning_tree's forest, and
+times _update_tree(): the first one, which sends a port_mod for every
+port, and then --flaps link failures and recoveries, each followed by
+an update.  With --full, every update works out the tree from scratch
+and checks every port of every switch, as it used to.  With --scan,
+discovery's lookups are replaced by scans of every link, which is how
+they used to work.
+
+Invoke from the top level:
+  ./tools/bench/spanning_tree.py [--switches=500] [--ports=48] [--full]
+"""
+
+import sys
+import os.path
+import time
+import optparse
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.core
+pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+from pox.openflow.discovery import Discovery, Link, LinkTable
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.spanning_tree as spanning_tree
+from pox.lib.addresses import EthAddr
+
+
+class ScanLinkTable (dict):
+  """
+  The old discovery adjacency, which had to be scanned for everything
+  """
+  def links_at (self, dpid, port):
+    return set(l for l in self if (dpid,port) in l.end)
+
+  def links_on (self, dpid):
+    return set(l for l in self if dpid in (l.dpid1, l.dpid2))
+
+  def links_of_type (self, link_type):
+    return set(l for l in self if l.link_type is link_type)
+
+
+class FakeDiscovery (object):
+  send_cycle_time = 5
+  is_edge_port = Discovery.is_edge_port.im_func
+  _is_broadcast_port = Discovery._is_broadcast_port.im_func
+
+  def __init__ (self, adjacency):
+    self.adjacency = adjacency
+
+
+class FakePort (object):
+  def __init__ (self, dpid, port_no):
+    self.port_no = port_no
+    self.hw_addr = EthAddr("%06x%06x" % (dpid, port_no))
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid, ports):
+    self.dpid = dpid
+    self.connect_time = 0
+    self.ports = dict((p, FakePort(dpid, p)) for p in ports)
+    self.sent = 0
+  def send (self, msg):
+    if isinstance(msg, of.ofp_port_mod): self.sent += 1
+
+
+class FakeOpenFlow (object):
+  def __init__ (self, connections):
+    self.connections = connections
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+
+def make_links (count, rng):
+  """
+  Returns (links, {dpid:next free port}) for a two-tier fabric
+  """
+  spines = max(4, count // 8)
+  next_port = dict((d, 1) for d in range(1, count + 1))
+  links = []
+  for leaf in range(spines + 1, count + 1):
+    for spine in rng.sample(range(1, spines + 1), 4):
+      p1 = next_port[leaf]
+      p2 = next_port[spine]
+      next_port[leaf] += 1
+      next_port[spine] += 1
+      links.append(Link(leaf, p1, spine, p2, 'lldp', True))
+      links.append(Link(spine, p2, leaf, p1, 'lldp', True))
+  return links, next_port
+
+
+def full_update ():
+  """
+  The old _update_tree(): a new tree and a look at every port on it
+  """
+  tree = spanning_tree._calc_spanning_tree()
+  discovery = core.openflow_discovery
+  prev = spanning_tree._prev
+  for sw, ports in tree.iteritems():
+    con = core.openflow.getConnection(sw)
+    tree_ports = set(p[1] for p in ports)
+    for p in con.ports.itervalues():
+      flood = p.port_no in tree_ports
+      if not flood:
+        if (discovery.is_edge_port(sw, p.port_no)
+            or discovery._is_broadcast_port(sw, p.port_no)):
+          flood = True
+      if prev[sw][p.port_no] is flood: continue
+      prev[sw][p.port_no] = flood
+      con.send(of.ofp_port_mod(port_no=p.port_no, hw_addr=p.hw_addr,
+                               config=0 if flood else of.OFPPC_NO_FLOOD,
+                               mask=of.OFPPC_NO_FLOOD))
+
+
+def main ():
+  parser = optparse.OptionParser()
+  parser.add_option("--switches", type="int", default=500)
+  parser.add_option("--ports", type="int", default=48)
+  parser.add_option("--flaps", type="int", default=20)
+  parser.add_option("--full", action="store_true", default=False,
+                    help="recompute the whole tree for every update")
+  parser.add_option("--scan", action="store_true", default=False,
+                    help="scan all links for every lookup, as before")
+  opts,args = parser.parse_args()
+
+  rng = random.Random(opts.switches)
+  links,next_port = make_links(opts.switches, rng)
+  adjacency = ScanLinkTable() if opts.scan else LinkTable()
+  forest = spanning_tree.spanning_forest
+  start = time.time()
+  for l in links:
+    adjacency[l] = 0
+    forest.add_link(l)
+  build = time.time() - start
+
+  connections = {}
+  for dpid,used in next_port.iteritems():
+    ports = range(1, max(used, opts.ports + 1))
+    connections[dpid] = FakeConnection(dpid, ports)
+  core.register("openflow_discovery", FakeDiscovery(adjacency))
+  core.register("openflow", FakeOpenFlow(connections))
+  update = full_update if opts.full else spanning_tree._update_tree
+
+  def sent ():
+    r = sum(c.sent for c in connections.itervalues())
+    for c in connections.itervalues():
+      c.sent = 0
+    return r
+
+  spanning_tree._unsynced.update(connections)
+  start = time.time()
+  update()
+  first = time.time() - start
+  first_sent = sent()
+
+  # Take down links (both directions at once, as when a switch goes) and
+  # bring them back, updating after each
+  flapped = rng.sample(links[::2], opts.flaps)
+  events = 0
+  start = time.time()
+  for l in flapped:
+    back = Link(l.dpid2, l.port2, l.dpid1, l.port1, 'lldp', True)
+    for added in (False, True):
+      for x in (l, back):
+        if added:
+          adjacency[x] = 0
+          forest.add_link(x)
+        else:
+          del adjacency[x]
+          forest.remove_link(x)
+        spanning_tree._dirty_ports.update(x.end)
+        update()
+        events += 1
+  flaps = (time.time() - start) / events
+
+  ports = sum(len(c.ports) for c in connections.itervalues())
+  print("%i switches, %i ports, %i links (%s, %s):"
+        % (opts.switches, ports, len(links),
+           "full" if opts.full else "incremental",
+           "scanning" if opts.scan else "indexed"))
+  print("  building forest : %9.1f ms" % (build * 1000,))
+  print("  first update    : %9.1f ms (%i port_mods)"
+        % (first * 1000, first_sent))
+  print("  link event      : %9.2f ms (%.1f port_mods each)"
+        % (flaps * 1000, float(sent()) / events))
+
+  for t in spanning_tree._dirty_switches.values():
+    t.cancel()
+  core.quit()
+
+
+if __name__ == "__main__":
+  main()